@@ -0,0 +1,166 @@
+"""
+미션 일괄 판정 CLI (Streamlit 없이 실행)
+
+manifest(JSONL) 한 줄 = 미션 1건:
+  {"id": "m-001", "category": "청소", "details": "방 청소하기", "photo_paths": ["before.jpg", "after.jpg"]}
+
+판정 결과는 완료되는 순서대로 --out(JSONL)에 한 줄씩 추가된다.
+성공한 id는 체크포인트 파일에 기록되어, 다시 실행하면 건너뛴다(실패한 건만 재시도).
+
+사용 예:
+  OPENAI_API_KEY=sk-... python batch_judge.py missions.jsonl --out verdicts.jsonl --concurrency 4
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, Iterator, Set, Tuple
+
+from judge_engine import build_llm, judge_mission
+from llm_client import PRIORITY_BATCH, LLMClient
+from model_router import build_router, load_config
+from result_cache import ResultCache
+from result_store import get_store
+from structured_output import json_mode
+
+
+def read_manifest(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                print(f"[skip] {path}:{line_no} JSON 파싱 실패", file=sys.stderr)
+                continue
+            # id가 없으면 줄 내용으로 만든다 (같은 줄이면 재실행해도 같은 id)
+            mission_id = str(item.get("id") or hashlib.sha256(line.encode("utf-8")).hexdigest()[:16])
+            yield mission_id, item
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def judge_one(llm, mission_id: str, item: Dict[str, Any], cache: ResultCache) -> Dict[str, Any]:
+    category = item.get("category", "청소")
+    photo_paths = list(item.get("photo_paths", []))[:10]
+    missing = [p for p in photo_paths if not os.path.exists(p)]
+    if missing:
+        return {"id": mission_id, "ok": False, "error": f"사진 파일 없음: {missing}"}
+    if not photo_paths:
+        return {"id": mission_id, "ok": False, "error": "사진이 없습니다."}
+
+    try:
+        out = judge_mission(llm, category, item.get("details", ""), photo_paths, cache=cache)
+    except Exception as e:
+        return {"id": mission_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    # 화면에서 판정한 기록과 같은 저장소에 남김 (세션 ID = "batch")
+    store = get_store()
+    store.append("batch", mission_id, "mission", out["mission"])
+    store.append("batch", mission_id, "photo", out["photo_analysis"])
+    store.append("batch", mission_id, "grade", out["result"])
+
+    result = out["result"] or {}
+    return {
+        "id": mission_id,
+        "ok": True,
+        "category": category,
+        "completion_percent": result.get("completion_percent", 0.0),
+        "pass": bool(result.get("pass", False)),
+        "reason_summary": result.get("reason_summary", []),
+        "missing_or_unclear": result.get("missing_or_unclear", []),
+        "next_request_to_child": result.get("next_request_to_child", []),
+        "mission": out["mission"],
+        "photo_analysis": out["photo_analysis"],
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    api_key = args.api_key or os.getenv("OPENAI_API_KEY", "")
+    if not api_key:
+        print("OPENAI_API_KEY(또는 --api-key)가 필요합니다.", file=sys.stderr)
+        return 2
+
+    # 배치 호출은 낮은 우선순위 (같은 프로세스의 화면 호출이 먼저 나감)
+    chat = build_llm(api_key, model_name=args.model, base_url=args.base_url, max_retries=0)
+    llm = LLMClient(json_mode(chat), priority=PRIORITY_BATCH)
+    router_config = load_config()
+    if router_config:
+        # MODEL_ROUTER_CONFIG가 있으면 단계별 모델 라우터 (--model은 무시)
+        llm = build_router(api_key, router_config, priority=PRIORITY_BATCH)
+    cache = ResultCache()
+
+    checkpoint = args.checkpoint or args.out + ".done"
+    done_ids = load_checkpoint(checkpoint)
+
+    out_f = open(args.out, "a", encoding="utf-8")
+    ckpt_f = open(checkpoint, "a", encoding="utf-8")
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "failed": 0, "skipped": 0}
+
+    def _emit(verdict: Dict[str, Any]) -> None:
+        with write_lock:
+            out_f.write(json.dumps(verdict, ensure_ascii=False) + "\n")
+            out_f.flush()
+            if verdict["ok"]:
+                # 결과 줄을 쓴 다음에 체크포인트 기록 → 중간에 죽어도 결과 없이 '완료'로 남지 않음
+                ckpt_f.write(verdict["id"] + "\n")
+                ckpt_f.flush()
+                counts["ok"] += 1
+            else:
+                counts["failed"] += 1
+
+    concurrency = max(1, args.concurrency)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            pending = set()
+            for mission_id, item in read_manifest(args.manifest):
+                if mission_id in done_ids:
+                    counts["skipped"] += 1
+                    continue
+                done_ids.add(mission_id)  # manifest 안의 중복 id도 한 번만
+
+                # 대기열이 너무 길어지지 않게 in-flight 개수 제한
+                while len(pending) >= concurrency * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        _emit(fut.result())
+                pending.add(pool.submit(judge_one, llm, mission_id, item, cache))
+
+            for fut in wait(pending).done:
+                _emit(fut.result())
+    finally:
+        out_f.close()
+        ckpt_f.close()
+
+    print(
+        f"완료 {counts['ok']}건 / 실패 {counts['failed']}건 / 건너뜀 {counts['skipped']}건",
+        file=sys.stderr,
+    )
+    return 0 if counts["failed"] == 0 else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="미션 인증 일괄 판정 (JSONL → JSONL)")
+    parser.add_argument("manifest", help="미션 목록 JSONL (category, details, photo_paths[, id])")
+    parser.add_argument("--out", default="verdicts.jsonl", help="판정 결과 JSONL (추가 모드)")
+    parser.add_argument("--checkpoint", default=None, help="완료된 id 목록 파일 (기본: <out>.done)")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 판정할 미션 수")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--base-url", default=None, help="OpenAI 호환 서버 주소 (예: fake_llm_server.py)")
+    return run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
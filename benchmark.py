@@ -0,0 +1,393 @@
+"""
+오프라인 벤치마크 (API 키/네트워크 없이 판정 파이프라인 전체 측정)
+
+가짜 OpenAI 호환 서버(fake_llm_server)를 띄우고, 합성 사진 묶음(미션당 1~10장, 여러 해상도)으로
+missionGet → photoGet → missionComplete(또는 fused)를 동시 실행 수별로 돌린다.
+  - 미션당 지연 p50/p95/p99, 처리량(미션/초)
+  - 업로드 바이트(가짜 서버가 받은 요청 본문 합계), 모델 호출 수, 깨진 출력 수
+  - 최대 RSS (측정 중 /proc/self/statm 샘플링, 없으면 ru_maxrss)
+  - 구간별 평균 시간 (tracing)
+가짜 모델: 지연 분포 / 출력 속도 / 깨진 JSON 비율 조절, --seed를 주면 같은 입력에 항상 같은 지연·출력
+--baseline으로 이전 리포트를 주면 p95 지연/처리량/업로드량이 --max-regression 이상 나빠졌을 때 종료 코드 1 (CI용)
+
+동시 실행 수마다 새 사진 묶음을 만들어서 이미지 전처리 캐시가 다음 단계 결과를 빠르게 만들지 않게 한다.
+미션 템플릿 / 사진별 분석 재사용은 기본으로 끈다 (환경변수로 켜면 그 설정으로 측정).
+--select-max-bytes / --select-max-tokens로 사진 선택 예산을 주면 빠진 사진 수와 함께 지연/업로드 감소를 비교할 수 있다.
+
+사용 예:
+  python benchmark.py --missions 30 --concurrency 1,4,8 --latency 0.2 --latency-dist lognormal --jitter 0.5 \\
+      --tokens-per-s 150 --malformed-rate 0.05 --seed 7 --report bench.json
+  python benchmark.py --missions 30 --concurrency 1,4,8 --seed 7 --baseline bench.json --max-regression 0.25
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageDraw
+
+from fake_llm_server import LATENCY_DISTS, FakeLLMConfig, start_server
+
+CATEGORIES = ("청소", "숙제", "습관")
+PHOTO_COUNTS = (1, 2, 3, 5, 10)
+PHOTO_SIZES = ((640, 480), (1600, 1200), (3000, 2250))
+
+
+# =========================================================
+# 가짜 모델 응답 (요청 종류별 고정 JSON)
+# =========================================================
+_CHECKLIST = ["바닥에 물건 없음", "책상 위 정리", "쓰레기 버림"]
+
+MISSION_OUTPUT = json.dumps({
+    "category": "청소",
+    "details_raw": "벤치마크",
+    "mission_summary": "방 정리하기",
+    "checklist": [{"item": c} for c in _CHECKLIST],
+}, ensure_ascii=False)
+
+_PHOTO_FIELDS = {
+    "mode": "single",
+    "observations": ["바닥에 물건이 거의 없음", "책상 위 책이 한쪽에 쌓여 있음", "쓰레기통이 비어 있음"],
+    "notable_changes": [],
+    "caveats": ["사진 밖 영역은 확인 불가"],
+    "items": [
+        {"item": _CHECKLIST[0], "status": "done", "evidence": "바닥이 보임"},
+        {"item": _CHECKLIST[1], "status": "partial", "evidence": "책 일부가 흩어져 있음"},
+        {"item": _CHECKLIST[2], "status": "done", "evidence": "쓰레기통이 비어 있음"},
+    ],
+}
+_GRADE_FIELDS = {
+    "completion_percent": 83,
+    "pass": True,
+    "reason_summary": ["바닥 정리 완료", "쓰레기 처리 완료", "책상은 부분 정리"],
+    "missing_or_unclear": ["책상 위 책 정리가 덜 됨"],
+    "next_request_to_child": ["책상 위 책을 꽂아 주세요."],
+}
+PHOTO_OUTPUT = json.dumps(_PHOTO_FIELDS, ensure_ascii=False)
+GRADE_OUTPUT = json.dumps(_GRADE_FIELDS, ensure_ascii=False)
+FUSED_OUTPUT = json.dumps({**_PHOTO_FIELDS, **_GRADE_FIELDS}, ensure_ascii=False)
+
+
+def respond(req: Dict[str, Any]) -> str:
+    """고정 프롬프트(system)의 역할 문구로 요청 종류 판단. 수정 호출(system 없음)은 스키마 안내의 키로 판단"""
+    messages = req.get("messages", [])
+    system = ""
+    if messages and messages[0].get("role") == "system":
+        system = str(messages[0].get("content", ""))
+    if "미션 정리" in system:
+        return MISSION_OUTPUT
+    if "겸 채점관" in system:
+        return FUSED_OUTPUT
+    if "사진 분석가" in system:
+        return PHOTO_OUTPUT
+    if "채점관" in system:
+        return GRADE_OUTPUT
+
+    text = json.dumps(messages[-1].get("content", "") if messages else "", ensure_ascii=False)
+    if "completion_percent" in text and "observations" in text:
+        return FUSED_OUTPUT
+    if "completion_percent" in text:
+        return GRADE_OUTPUT
+    if "observations" in text:
+        return PHOTO_OUTPUT
+    return MISSION_OUTPUT
+
+
+# =========================================================
+# 합성 사진 묶음
+# =========================================================
+@functools.lru_cache(maxsize=None)
+def _noise(size: Tuple[int, int]) -> Image.Image:
+    # 노이즈 생성이 제일 느려서 해상도별로 1번만 (사진마다 다른 건 도형)
+    return Image.effect_noise(size, 24).convert("RGB")
+
+
+def make_photo(path: str, size: Tuple[int, int], seed: int) -> None:
+    """사전 검사(흐림/단색/어두움)를 통과하는 무작위 도형 + 노이즈 사진"""
+    rng = random.Random(seed)
+    w, h = size
+    im = Image.new("RGB", size, tuple(rng.randint(90, 200) for _ in range(3)))
+    draw = ImageDraw.Draw(im)
+    for _ in range(40):
+        x0, y0 = rng.randint(0, w - 1), rng.randint(0, h - 1)
+        x1, y1 = min(w, x0 + rng.randint(w // 20, w // 4)), min(h, y0 + rng.randint(h // 20, h // 4))
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle([x0, y0, x1, y1], fill=color)
+        else:
+            draw.ellipse([x0, y0, x1, y1], fill=color)
+    Image.blend(im, _noise(size), 0.15).save(path, format="JPEG", quality=90)
+
+
+def build_corpus(root: str, missions: int, seed: int) -> List[Dict[str, Any]]:
+    """미션 목록: 카테고리 / 사진 수(1~10) / 해상도를 돌아가며 섞는다"""
+    os.makedirs(root, exist_ok=True)
+    items = []
+    for i in range(missions):
+        count = PHOTO_COUNTS[i % len(PHOTO_COUNTS)]
+        size = PHOTO_SIZES[i % len(PHOTO_SIZES)]
+        paths = []
+        for j in range(count):
+            path = os.path.join(root, f"m{i:03d}-{j}.jpg")
+            make_photo(path, size, seed * 100003 + i * 101 + j)
+            paths.append(path)
+        items.append({
+            "id": f"bench-{i:03d}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "details": f"방 정리하기 {i}",
+            "photo_paths": paths,
+            "size": f"{size[0]}x{size[1]}",
+        })
+    return items
+
+
+# =========================================================
+# 측정
+# =========================================================
+class RssSampler:
+    """측정 구간의 최대 RSS (리눅스는 /proc/self/statm 샘플링, 그 외는 프로세스 전체 최대값)"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _current(self) -> int:
+        from session_store import current_rss
+        return current_rss()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = self._current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current())
+
+
+def percentile(values: List[float], q: float) -> float:
+    """선형 보간 백분위수"""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    pos = q * (len(s) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+
+def run_level(
+    cfg: FakeLLMConfig,
+    base_url: str,
+    items: List[Dict[str, Any]],
+    concurrency: int,
+    args: argparse.Namespace,
+) -> Dict[str, Any]:
+    # 환경변수 기본값을 정한 뒤에 불러와야 해서 여기서 import
+    from judge_engine import build_llm, judge_mission
+    from llm_client import LLMClient, PRIORITY_BATCH
+    from result_cache import ResultCache
+    from structured_output import json_mode
+    from token_usage import usage_scope
+    from tracing import STATS
+
+    chat = build_llm("sk-bench", model_name="fake-model", base_url=base_url, max_retries=0)
+    llm = LLMClient(
+        json_mode(chat),
+        rpm=args.rpm,
+        tpm=args.tpm,
+        max_concurrency=max(concurrency, 1) * 2,
+        priority=PRIORITY_BATCH,
+    )
+    cache = ResultCache(root=tempfile.mkdtemp(prefix=f"bench-c{concurrency}-", dir="."))
+    session = f"bench-c{concurrency}-{int(time.time())}"
+
+    def _one(item: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            out = judge_mission(
+                llm, item["category"], item["details"], item["photo_paths"], cache=cache, pipeline=args.pipeline
+            )
+            error = None if (out.get("result") or {}).get("completion_percent") is not None else "empty result"
+            deselected = len((out.get("photo_analysis") or {}).get("deselected_photos") or [])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            deselected = 0
+        return {"id": item["id"], "latency_s": time.perf_counter() - t0, "error": error, "deselected": deselected}
+
+    def _submit(pool: ThreadPoolExecutor, item: Dict[str, Any]) -> Any:
+        # 세션 스코프(토큰 기록/구간 통계)를 작업 스레드로 전달
+        return pool.submit(contextvars.copy_context().run, _one, item)
+
+    bytes0, requests0, malformed0 = cfg.bytes_received, cfg.requests, cfg.malformed
+    with usage_scope(session_id=session), RssSampler() as rss:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = [_submit(pool, item) for item in items]
+            rows = [f.result() for f in futures]
+        wall = time.perf_counter() - t0
+
+    ok = [r["latency_s"] for r in rows if not r["error"]]
+    uploaded = cfg.bytes_received - bytes0
+    return {
+        "concurrency": concurrency,
+        "missions": len(rows),
+        "photos": sum(len(i["photo_paths"]) for i in items),
+        # 사진 선택(PHOTO_SELECT_*)으로 모델에 보내지 않은 사진 수 — 정확도와 바꾼 양
+        "photos_deselected": sum(r["deselected"] for r in rows),
+        "errors": sum(1 for r in rows if r["error"]),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(ok) / wall, 3) if wall > 0 else 0.0,
+        "latency_p50_s": round(percentile(ok, 0.50), 3),
+        "latency_p95_s": round(percentile(ok, 0.95), 3),
+        "latency_p99_s": round(percentile(ok, 0.99), 3),
+        "bytes_uploaded": uploaded,
+        "bytes_per_mission": int(uploaded / len(rows)) if rows else 0,
+        "model_calls": cfg.requests - requests0,
+        "malformed_outputs": cfg.malformed - malformed0,
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+        "stages": {r["stage"]: r["avg_ms"] for r in STATS.session_breakdown(session)[:12]},
+        "error_samples": [r["error"] for r in rows if r["error"]][:5],
+    }
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """같은 동시 실행 수끼리 비교해서 허용치보다 나빠진 지표 목록"""
+    base = {lv["concurrency"]: lv for lv in baseline.get("levels", [])}
+    out = []
+    for lv in report["levels"]:
+        b = base.get(lv["concurrency"])
+        if b is None:
+            continue
+        c = lv["concurrency"]
+        if b["latency_p95_s"] > 0 and lv["latency_p95_s"] > b["latency_p95_s"] * (1 + max_regression):
+            out.append(f"c={c} p95 지연 {b['latency_p95_s']}s → {lv['latency_p95_s']}s")
+        if b["throughput_per_s"] > 0 and lv["throughput_per_s"] < b["throughput_per_s"] * (1 - max_regression):
+            out.append(f"c={c} 처리량 {b['throughput_per_s']}/s → {lv['throughput_per_s']}/s")
+        if b["bytes_per_mission"] > 0 and lv["bytes_per_mission"] > b["bytes_per_mission"] * (1 + max_regression):
+            out.append(f"c={c} 미션당 업로드 {b['bytes_per_mission']}B → {lv['bytes_per_mission']}B")
+        if lv["errors"] > b["errors"]:
+            out.append(f"c={c} 실패 {b['errors']}건 → {lv['errors']}건")
+    return out
+
+
+def run(args: argparse.Namespace) -> int:
+    report_path = os.path.abspath(args.report) if args.report else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    # 재사용 캐시는 기본으로 끔 (매번 같은 일을 하도록). 명시적으로 준 환경변수는 그대로
+    os.environ.setdefault("MISSION_TEMPLATE_CACHE", "0")
+    os.environ.setdefault("PHOTO_HASH_REUSE", "0")
+    if args.select_max_bytes or args.select_max_tokens:
+        os.environ["PHOTO_SELECT_MAX_BYTES"] = str(args.select_max_bytes)
+        os.environ["PHOTO_SELECT_MAX_TOKENS"] = str(args.select_max_tokens)
+
+    # 캐시/기록 파일(.cache, outputs)은 임시 작업 디렉터리에
+    workdir = tempfile.mkdtemp(prefix="judge-bench-")
+    os.chdir(workdir)
+
+    cfg = FakeLLMConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        latency_dist=args.latency_dist,
+        tokens_per_s=args.tokens_per_s,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+        responder=respond,
+    )
+    server = start_server(cfg)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    levels = []
+    try:
+        for n, concurrency in enumerate(int(c) for c in args.concurrency.split(",") if c.strip()):
+            t0 = time.perf_counter()
+            # 사진 경로가 요청 본문에 들어가므로 경로를 고정해야 --seed로 같은 지연/출력이 재현됨
+            root = os.path.join(tempfile.gettempdir(), "judge-bench", f"s{args.seed}-{n}-c{concurrency}")
+            items = build_corpus(root, args.missions, args.seed + n)
+            print(f"c={concurrency}: 사진 {sum(len(i['photo_paths']) for i in items)}장 생성 "
+                  f"({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+            lv = run_level(cfg, base_url, items, concurrency, args)
+            levels.append(lv)
+            print(
+                f"c={concurrency:>3}: 처리량 {lv['throughput_per_s']}/s / 지연 p50 {lv['latency_p50_s']}s "
+                f"p95 {lv['latency_p95_s']}s p99 {lv['latency_p99_s']}s / "
+                f"업로드 {lv['bytes_uploaded'] / (1024 * 1024):.1f}MB / 호출 {lv['model_calls']}회 "
+                f"(깨진 출력 {lv['malformed_outputs']}) / 선택 제외 사진 {lv['photos_deselected']}장 / 최대 RSS {lv['peak_rss_mb']}MB / 실패 {lv['errors']}건",
+                file=sys.stderr,
+            )
+    finally:
+        server.shutdown()
+
+    report = {
+        "config": {
+            "missions": args.missions,
+            "pipeline": args.pipeline,
+            "latency": args.latency,
+            "latency_dist": args.latency_dist,
+            "jitter": args.jitter,
+            "tokens_per_s": args.tokens_per_s,
+            "malformed_rate": args.malformed_rate,
+            "seed": args.seed,
+            "select_max_bytes": args.select_max_bytes,
+            "select_max_tokens": args.select_max_tokens,
+        },
+        "levels": levels,
+    }
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if baseline is not None:
+        worse = regressions(report, baseline, args.max_regression)
+        for w in worse:
+            print(f"회귀: {w}", file=sys.stderr)
+        if worse:
+            return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="오프라인 판정 파이프라인 벤치마크 (가짜 모델)")
+    parser.add_argument("--missions", type=int, default=30, help="동시 실행 수마다 판정할 미션 수")
+    parser.add_argument("--concurrency", default="1,4,8", help="동시 실행 수 목록 (쉼표 구분)")
+    parser.add_argument("--pipeline", choices=("two_stage", "fused"), default="two_stage")
+    parser.add_argument("--latency", type=float, default=0.2, help="모델 응답 지연(초, lognormal이면 중앙값)")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTS, default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.4, help="uniform이면 ±초, lognormal이면 sigma")
+    parser.add_argument("--tokens-per-s", type=float, default=0.0, help="출력 속도 (0이면 지연 없음)")
+    parser.add_argument("--malformed-rate", type=float, default=0.05, help="깨진 JSON 출력 비율")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--select-max-bytes", type=int, default=0,
+                        help="사진 선택 바이트 예산 (PHOTO_SELECT_MAX_BYTES, 0이면 환경변수 그대로)")
+    parser.add_argument("--select-max-tokens", type=int, default=0,
+                        help="사진 선택 이미지 토큰 예산 (PHOTO_SELECT_MAX_TOKENS)")
+    parser.add_argument("--rpm", type=int, default=100000, help="LLMClient 분당 요청 한도 (기본은 사실상 무제한)")
+    parser.add_argument("--tpm", type=int, default=100000000, help="LLMClient 분당 토큰 한도")
+    parser.add_argument("--report", default=None, help="결과 JSON 경로")
+    parser.add_argument("--baseline", default=None, help="비교할 이전 결과 JSON")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="허용하는 악화 비율 (0.2 = 20%%)")
+    return run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+two_stage / fused 파이프라인 정확도·지연 비교 (라벨이 있는 미션 목록)
+
+manifest(JSONL) 한 줄 = 미션 1건 + 정답 라벨:
+  {"id": "m-001", "category": "청소", "details": "방 청소하기", "photo_paths": ["before.jpg", "after.jpg"],
+   "expected_pass": true, "expected_percent": 80}
+
+모드마다 빈 결과 캐시 + 빈 사진 인덱스(사진별 분석 재사용 없음)로 모든 미션을 판정해서 통과 여부 정확도, 완수율 오차(MAE), 미션당 지연/모델 호출 수를 비교한다.
+(미션 요약은 두 모드가 같은 결과를 쓰도록 먼저 한 번 만들어 둔다)
+
+사용 예:
+  OPENAI_API_KEY=sk-... python compare_pipelines.py labelled.jsonl --modes two_stage,fused --report report.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from batch_judge import read_manifest
+from judge_engine import POLICY_TEXT, build_llm, judge_mission, mission_get
+from llm_client import PRIORITY_BATCH, LLMClient
+from model_router import build_router, load_config
+from photo_hash import PhotoIndex, set_index
+from result_cache import ResultCache
+from structured_output import json_mode
+
+
+class CountingLLM:
+    """invoke/stream 호출 수만 세는 얇은 래퍼"""
+
+    def __init__(self, llm: Any):
+        self.llm = llm
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def invoke(self, messages: Any, *args: Any, **kwargs: Any) -> Any:
+        self._count()
+        return self.llm.invoke(messages, *args, **kwargs)
+
+    def stream(self, messages: Any, *args: Any, **kwargs: Any) -> Any:
+        self._count()
+        return self.llm.stream(messages, *args, **kwargs)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+def evaluate(llm: Any, items: List[Dict[str, Any]], pipeline: str, concurrency: int) -> Dict[str, Any]:
+    counter = CountingLLM(llm)
+    # 결과 캐시/사진 인덱스(PHOTO_HASH_REUSE의 사진별 분석)가 이전 모드·실행 결과를 돌려주지 않게
+    # 모드마다 새 임시 디렉터리에 둔다 → 지연/호출 수는 재사용 없는 값
+    root = tempfile.mkdtemp(prefix=f"cmp-{pipeline}-")
+    cache = ResultCache(root=os.path.join(root, "results"))
+    previous_index = set_index(PhotoIndex(os.path.join(root, "photo_index.sqlite3")))
+
+    def _one(item: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            out = judge_mission(
+                counter, item["category"], item["details"], item["photo_paths"], cache=cache, pipeline=pipeline
+            )
+            result = out["result"] or {}
+            error = None
+        except Exception as e:
+            result, error = {}, f"{type(e).__name__}: {e}"
+        return {
+            "id": item["id"],
+            "latency_s": time.perf_counter() - t0,
+            "pass": bool(result.get("pass", False)),
+            "percent": float(result.get("completion_percent", 0.0) or 0.0),
+            "expected_pass": item.get("expected_pass"),
+            "expected_percent": item.get("expected_percent"),
+            "error": error,
+        }
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            rows = list(pool.map(_one, items))
+    finally:
+        set_index(previous_index)
+
+    labelled = [r for r in rows if r["expected_pass"] is not None and not r["error"]]
+    with_percent = [r for r in rows if r["expected_percent"] is not None and not r["error"]]
+    latencies = [r["latency_s"] for r in rows if not r["error"]]
+    return {
+        "pipeline": pipeline,
+        "missions": len(rows),
+        "errors": sum(1 for r in rows if r["error"]),
+        "pass_accuracy": (
+            sum(1 for r in labelled if r["pass"] == bool(r["expected_pass"])) / len(labelled) if labelled else None
+        ),
+        "percent_mae": (
+            sum(abs(r["percent"] - float(r["expected_percent"])) for r in with_percent) / len(with_percent)
+            if with_percent else None
+        ),
+        "latency_p50_s": round(_percentile(latencies, 0.5), 3),
+        "latency_p95_s": round(_percentile(latencies, 0.95), 3),
+        # 미션 요약은 미리 만들어 두었으므로 여기 호출 수는 사진 분석/판정(+JSON 수정 호출)만
+        "model_calls_per_mission": round(counter.calls / len(rows), 2) if rows else 0.0,
+        "photo_index": "fresh per mode (no per-photo reuse)",
+        "rows": rows,
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    api_key = args.api_key or os.getenv("OPENAI_API_KEY", "")
+    if not api_key:
+        print("OPENAI_API_KEY(또는 --api-key)가 필요합니다.", file=sys.stderr)
+        return 2
+
+    chat = build_llm(api_key, model_name=args.model, base_url=args.base_url, max_retries=0)
+    llm = LLMClient(json_mode(chat), priority=PRIORITY_BATCH)
+    router_config = load_config()
+    if router_config:
+        # MODEL_ROUTER_CONFIG가 있으면 단계별 모델 라우터 (--model은 무시)
+        llm = build_router(api_key, router_config, priority=PRIORITY_BATCH)
+
+    items = []
+    for mission_id, item in read_manifest(args.manifest):
+        item = dict(item, id=mission_id, category=item.get("category", "청소"), details=item.get("details", ""))
+        item["photo_paths"] = list(item.get("photo_paths", []))[:10]
+        items.append(item)
+    if not items:
+        print("판정할 미션이 없습니다.", file=sys.stderr)
+        return 2
+
+    # 두 모드가 같은 체크리스트로 채점되도록 미션 요약을 먼저 만든다 (템플릿 캐시에 남음)
+    for item in items:
+        mission_get(llm, item["category"], item["details"], POLICY_TEXT)
+
+    reports = [evaluate(llm, items, mode.strip(), args.concurrency) for mode in args.modes.split(",") if mode.strip()]
+    for r in reports:
+        acc = "-" if r["pass_accuracy"] is None else f"{r['pass_accuracy'] * 100:.1f}%"
+        mae = "-" if r["percent_mae"] is None else f"{r['percent_mae']:.1f}"
+        print(
+            f"{r['pipeline']:>10}: 통과 정확도 {acc} / 완수율 MAE {mae} / "
+            f"지연 p50 {r['latency_p50_s']}s p95 {r['latency_p95_s']}s / "
+            f"호출 {r['model_calls_per_mission']}회/건 / 실패 {r['errors']}건",
+            file=sys.stderr,
+        )
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="two_stage / fused 파이프라인 비교 (라벨 JSONL)")
+    parser.add_argument("manifest", help="라벨이 있는 미션 목록 JSONL (expected_pass[, expected_percent])")
+    parser.add_argument("--modes", default="two_stage,fused", help="비교할 모드 (쉼표 구분)")
+    parser.add_argument("--report", default=None, help="미션별 결과까지 담은 JSON 리포트 경로")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--base-url", default=None, help="OpenAI 호환 서버 주소 (예: fake_llm_server.py)")
+    return run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+로컬 가짜 OpenAI 호환 서버 (테스트/개발용)
+
+- POST /v1/chat/completions : 고정 응답(JSON 문자열)을 돌려준다 (stream=true면 SSE로 나눠서)
+- GET  /v1/models           : 키 검증용 목록
+- 지연(latency)과 에러(429/500) 주입 가능
+  - 지연 분포: uniform(latency ± jitter) / lognormal(중앙값 latency, sigma jitter) / fixed
+  - 출력 속도: tokens_per_s를 주면 출력 토큰 수만큼 추가 지연 (스트리밍은 청크마다 나눠서)
+- 응답 내용: 고정 문자열(content) 또는 요청별로 고르는 함수(responder), 일부를 깨진 JSON으로(malformed_rate)
+- seed를 주면 요청 내용(본문 해시)별로 지연/깨짐이 항상 같음 → 동시 실행 순서와 무관하게 재현 가능
+- 받은 요청 본문 바이트 수 집계(bytes_received) → 업로드 용량 측정
+- 프롬프트 캐시 흉내: 앞쪽 system 메시지가 전에 본 것과 같으면 그 토큰 수를 usage.prompt_tokens_details.cached_tokens로 보고
+
+사용 예:
+  python fake_llm_server.py --port 8765 --latency 0.5 --jitter 0.2 --error-rate 0.2
+  build_llm("sk-fake", base_url="http://127.0.0.1:8765/v1")
+"""
+import json
+import time
+import hashlib
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+LATENCY_DISTS = ("uniform", "lognormal", "fixed")
+
+
+class FakeLLMConfig:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        rate_limit_rate: float = 0.0,
+        content: str = '{"ok": true}',
+        seed: Optional[int] = None,
+        stream_chunk_chars: int = 8,
+        stream_chunk_delay: float = 0.0,
+        latency_dist: str = "uniform",
+        tokens_per_s: float = 0.0,
+        malformed_rate: float = 0.0,
+        responder: Optional[Callable[[dict], str]] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit_rate = rate_limit_rate
+        self.content = content
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_delay = stream_chunk_delay
+        self.latency_dist = latency_dist if latency_dist in LATENCY_DISTS else "uniform"
+        self.tokens_per_s = tokens_per_s
+        self.malformed_rate = malformed_rate
+        self.responder = responder
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.malformed = 0
+        self.seen_prefixes: set = set()
+
+    def request_rng(self, body: bytes) -> random.Random:
+        """seed가 있으면 요청 본문별로 고정된 난수열, 없으면 공용 난수열"""
+        if self.seed is None:
+            return random.Random()
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        return random.Random(f"{self.seed}:{digest}")
+
+    def delay(self, rng: random.Random) -> float:
+        if self.latency_dist == "fixed":
+            return self.latency
+        if self.latency_dist == "lognormal":
+            # 중앙값 latency, 꼬리 두께 jitter(sigma)
+            return self.latency * rng.lognormvariate(0.0, self.jitter) if self.latency > 0 else 0.0
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+    def respond(self, req: dict, rng: random.Random) -> str:
+        content = self.responder(req) if self.responder is not None else self.content
+        if self.malformed_rate and rng.random() < self.malformed_rate:
+            with self.lock:
+                self.malformed += 1
+            return malform(content, rng)
+        return content
+
+    def cached_tokens(self, messages: list) -> int:
+        """앞쪽 system 메시지(고정 프롬프트)를 전에 봤으면 그 토큰 수, 처음이면 0 (이번 것을 기억)"""
+        prefix = []
+        for m in messages:
+            if not isinstance(m, dict) or m.get("role") != "system":
+                break
+            prefix.append(m)
+        if not prefix:
+            return 0
+        digest = hashlib.sha256(json.dumps(prefix, sort_keys=True).encode("utf-8")).hexdigest()
+        with self.lock:
+            seen = digest in self.seen_prefixes
+            self.seen_prefixes.add(digest)
+        return _prompt_tokens(prefix) if seen else 0
+
+    def roll(self) -> float:
+        with self.lock:
+            self.requests += 1
+            return self.rng.random()
+
+
+def malform(content: str, rng: random.Random) -> str:
+    """모델이 실제로 내는 깨진 출력 흉내: 잘림 / 코드펜스+꼬리 쉼표(복구 가능) / JSON 아님(수정 호출 필요)"""
+    kind = rng.choice(("truncated", "fenced", "prose"))
+    if kind == "truncated":
+        return content[: max(1, len(content) * 2 // 3)]
+    if kind == "fenced":
+        body = content.rstrip()
+        if body.endswith("}"):
+            body = body[:-1].rstrip() + ",}"
+        return "결과입니다:\n```json\n" + body + "\n```"
+    return "죄송합니다. 사진을 확인하기 어렵습니다. 다시 시도해 주세요."
+
+
+def _prompt_tokens(messages: list) -> int:
+    """텍스트는 4글자 = 1토큰, 이미지는 장당 고정값 (base64 길이로 세면 실제 과금과 크게 다름)"""
+    chars, images = 0, 0
+    for m in messages:
+        content = m.get("content") if isinstance(m, dict) else None
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    images += 1
+                elif isinstance(part, dict):
+                    chars += len(str(part.get("text", "")))
+    return chars // 4 + images * 765
+
+
+def _make_handler(cfg: FakeLLMConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # 테스트 출력 조용히
+            pass
+
+        def _send(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            req = json.loads(body or b"{}")
+            with cfg.lock:
+                cfg.bytes_received += len(body)
+
+            rng = cfg.request_rng(body)
+            time.sleep(cfg.delay(rng))
+
+            r = cfg.roll()
+            if r < cfg.rate_limit_rate:
+                self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"retry-after": "0.1"})
+                return
+            if r < cfg.rate_limit_rate + cfg.error_rate:
+                self._send(cfg.error_status, {"error": {"message": "injected error", "type": "server_error"}})
+                return
+
+            content = cfg.respond(req, rng)
+            prompt_tokens = _prompt_tokens(req.get("messages", []))
+            completion_tokens = max(1, len(content) // 4)
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cfg.cached_tokens(req.get("messages", []))},
+            }
+            if req.get("stream"):
+                self._send_stream(req, usage, content)
+                return
+
+            if cfg.tokens_per_s > 0:
+                time.sleep(completion_tokens / cfg.tokens_per_s)
+            self._send(200, {
+                "id": f"chatcmpl-fake-{cfg.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": req.get("model", "fake-model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        def _send_stream(self, req: dict, usage: dict, content: str) -> None:
+            # SSE: 내용을 몇 글자씩 나눠서 보내고, 마지막에 finish_reason / usage / [DONE]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            base = {
+                "id": f"chatcmpl-fake-{cfg.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": req.get("model", "fake-model"),
+            }
+
+            def emit(choices: list, extra: Optional[dict] = None) -> None:
+                body = dict(base, choices=choices, **(extra or {}))
+                self.wfile.write(b"data: " + json.dumps(body, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+
+            emit([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            step = max(1, cfg.stream_chunk_chars)
+            # 출력 속도(tokens_per_s)는 청크마다 나눠서 적용 (4글자 = 1토큰)
+            chunk_delay = cfg.stream_chunk_delay + (step / 4 / cfg.tokens_per_s if cfg.tokens_per_s > 0 else 0.0)
+            for i in range(0, len(content), step):
+                if chunk_delay:
+                    time.sleep(chunk_delay)
+                emit([{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}])
+            emit([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (req.get("stream_options") or {}).get("include_usage"):
+                emit([], {"usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_server(cfg: FakeLLMConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """백그라운드 스레드로 서버 시작. base_url = f"http://{host}:{server.server_port}/v1" """
+    server = ThreadingHTTPServer((host, port), _make_handler(cfg))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm-server", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="가짜 OpenAI 호환 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--content", default='{"ok": true}')
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTS, default="uniform")
+    parser.add_argument("--tokens-per-s", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    cfg = FakeLLMConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        rate_limit_rate=args.rate_limit_rate,
+        content=args.content,
+        latency_dist=args.latency_dist,
+        tokens_per_s=args.tokens_per_s,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(cfg))
+    print(f"fake LLM server: http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
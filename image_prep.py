@@ -0,0 +1,158 @@
+import os
+import io
+import json
+import hashlib
+import mimetypes
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from upload_store import digest_for
+
+
+# =========================================================
+# 이미지 전처리 (base64 인코딩 전에 실행)
+# - EXIF 회전 적용 → 긴 변 기준 축소 → JPEG/WebP 재인코딩(메타데이터 제거)
+# - 결과 바이트는 (원본 sha256, 설정) 기준으로 디스크 캐시
+# 설정은 환경변수(.env)로 조정:
+#   IMAGE_MAX_EDGE (기본 1568), IMAGE_FORMAT (JPEG/WEBP, 기본 JPEG), IMAGE_QUALITY (기본 80)
+# =========================================================
+CACHE_DIR = os.path.join(".cache", "images")
+
+_FORMATS = {"JPEG": ("image/jpeg", ".jpg"), "WEBP": ("image/webp", ".webp")}
+
+
+@dataclass(frozen=True)
+class PrepSettings:
+    max_edge: int = 1568
+    fmt: str = "JPEG"
+    quality: int = 80
+
+    @classmethod
+    def from_env(cls) -> "PrepSettings":
+        fmt = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+        if fmt not in _FORMATS:
+            fmt = "JPEG"
+        return cls(
+            max_edge=int(os.getenv("IMAGE_MAX_EDGE", "1568")),
+            fmt=fmt,
+            quality=int(os.getenv("IMAGE_QUALITY", "80")),
+        )
+
+    def tag(self) -> str:
+        return f"{self.fmt.lower()}-e{self.max_edge}-q{self.quality}"
+
+
+@dataclass
+class PreparedImage:
+    path: str
+    data: bytes
+    mime: str
+    original_bytes: int
+    size: Tuple[int, int]
+    processed: bool  # False면 디코딩 실패로 원본을 그대로 사용
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - len(self.data)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "original_bytes": self.original_bytes,
+            "encoded_bytes": len(self.data),
+            "saved_bytes": self.saved_bytes,
+            "size": list(self.size),
+            "processed": self.processed,
+        }
+
+
+# (경로, mtime, 크기, 설정) → PreparedImage : 같은 프로세스 안에서 원본 재해시/재인코딩 생략
+_MEMO: "OrderedDict[tuple, PreparedImage]" = OrderedDict()
+_MEMO_MAX = 64
+_MEMO_LOCK = threading.Lock()
+
+
+def _encode(raw: bytes, settings: PrepSettings) -> Tuple[bytes, Tuple[int, int]]:
+    with Image.open(io.BytesIO(raw)) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode in ("RGBA", "LA", "P"):
+            im = im.convert("RGBA")
+            bg = Image.new("RGB", im.size, (255, 255, 255))
+            bg.paste(im, mask=im.getchannel("A"))
+            im = bg
+        elif im.mode != "RGB":
+            im = im.convert("RGB")
+
+        if max(im.size) > settings.max_edge:
+            im.thumbnail((settings.max_edge, settings.max_edge), Image.LANCZOS)
+
+        # exif/icc_profile를 넘기지 않으므로 메타데이터는 저장되지 않음
+        buf = io.BytesIO()
+        im.save(buf, format=settings.fmt, quality=settings.quality, optimize=True)
+        return buf.getvalue(), im.size
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def prepare_image(path: str, settings: Optional[PrepSettings] = None, cache_dir: str = CACHE_DIR) -> PreparedImage:
+    settings = settings or PrepSettings.from_env()
+
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, settings)
+    with _MEMO_LOCK:
+        hit = _MEMO.get(memo_key)
+        if hit is not None:
+            _MEMO.move_to_end(memo_key)
+            return hit
+
+    # 업로드 저장소의 파일은 이름이 sha256 → 디스크 캐시가 있으면 원본을 읽지 않음
+    digest = digest_for(path)
+    raw = None
+    if digest is None:
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+    mime, ext = _FORMATS[settings.fmt]
+    out_path = os.path.join(cache_dir, digest[:2], f"{digest}-{settings.tag()}{ext}")
+    meta_path = out_path + ".json"
+
+    prepared = None
+    try:
+        with open(out_path, "rb") as f:
+            data = f.read()
+        with open(meta_path, "r", encoding="utf-8") as f:
+            size = tuple(json.load(f)["size"])
+        prepared = PreparedImage(path, data, mime, stat.st_size, size, True)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if prepared is None:
+        if raw is None:
+            with open(path, "rb") as f:
+                raw = f.read()
+        try:
+            data, size = _encode(raw, settings)
+            _write_atomic(out_path, data)
+            _write_atomic(meta_path, json.dumps({"size": list(size)}).encode("utf-8"))
+            prepared = PreparedImage(path, data, mime, len(raw), size, True)
+        except Exception:
+            # Pillow가 못 여는 파일은 원본 그대로 전송 (판독 여부는 모델에 맡김)
+            raw_mime = mimetypes.guess_type(path)[0] or "image/jpeg"
+            prepared = PreparedImage(path, raw, raw_mime, len(raw), (0, 0), False)
+
+    with _MEMO_LOCK:
+        _MEMO[memo_key] = prepared
+        while len(_MEMO) > _MEMO_MAX:
+            _MEMO.popitem(last=False)
+    return prepared
@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from judge_engine import cached_fused, mission_complete, photo_get, safe_json_load
+from result_cache import ResultCache
+from result_store import get_store, new_id
+from token_usage import BudgetPlan, usage_scope
+from tracing import span
+
+
+# =========================================================
+# 백그라운드 판정 작업 큐 (SQLite, WAL 모드)
+# - STEP 4/5의 사진 분석/최종 판정을 Streamlit 스크립트 실행 밖의 작업자 스레드에서 돌린다
+#   → 페이지 이동/rerun으로 스크립트가 끊겨도 작업은 계속되고, 화면은 작업 상태를 폴링
+# - 같은 입력(결과 캐시 키)으로 다시 제출하면 진행 중/완료된 작업을 그대로 돌려줌 (중복 호출 방지)
+# - 끝나면 결과 캐시(디스크) + 결과 저장소에 기록, 작업 행에도 결과 JSON 보관
+# - 모델 클라이언트(API 키)는 DB에 쓰지 않고 제출한 프로세스 메모리에만 둔다
+#   → 작업은 제출한 프로세스(owner)의 작업자만 가져가고, 멈춘 프로세스의 작업은 오류로 정리
+# =========================================================
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join("outputs", "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# 화면이 작업 상태를 다시 읽는 간격(초)
+JOB_POLL_S = float(os.getenv("JOB_POLL_S", "1.0"))
+# 이 시간 동안 heartbeat가 없는 다른 프로세스의 작업은 중단된 것으로 봄
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "60"))
+# 끝난 작업 행 보관 기간(초)
+JOB_RETENTION_S = float(os.getenv("JOB_RETENTION_S", "86400"))
+
+_HEARTBEAT_S = 5.0
+# 스트리밍 중간 결과를 DB에 쓰는 최소 간격(초)
+_PARTIAL_INTERVAL_S = 0.3
+
+ACTIVE = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            TEXT PRIMARY KEY,
+    owner         TEXT NOT NULL,
+    session_id    TEXT NOT NULL,
+    mission_id    TEXT NOT NULL,
+    kind          TEXT NOT NULL,
+    dedupe_key    TEXT NOT NULL,
+    status        TEXT NOT NULL,
+    payload       TEXT NOT NULL,
+    partial       TEXT,
+    result        TEXT,
+    error         TEXT,
+    created_at    REAL NOT NULL,
+    started_at    REAL,
+    finished_at   REAL,
+    heartbeat_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (owner, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (dedupe_key, status);
+"""
+
+
+@dataclass
+class Job:
+    id: str
+    session_id: str
+    mission_id: str
+    kind: str                   # "photo" | "grade" | "fused"
+    dedupe_key: str
+    status: str                 # "queued" | "running" | "done" | "error"
+    payload: Dict[str, Any]
+    partial: Dict[str, Any] = field(default_factory=dict)
+    result: Dict[str, Any] = field(default_factory=dict)
+    error: str = ""
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE
+
+    @classmethod
+    def from_row(cls, r: sqlite3.Row) -> "Job":
+        return cls(
+            id=r["id"],
+            session_id=r["session_id"],
+            mission_id=r["mission_id"],
+            kind=r["kind"],
+            dedupe_key=r["dedupe_key"],
+            status=r["status"],
+            payload=json.loads(r["payload"]),
+            partial=json.loads(r["partial"]) if r["partial"] else {},
+            result=json.loads(r["result"]) if r["result"] else {},
+            error=r["error"] or "",
+            created_at=r["created_at"],
+            started_at=r["started_at"],
+            finished_at=r["finished_at"],
+        )
+
+
+# =========================================================
+# 작업 종류별 실행 함수: (llm, job, on_partial) → 결과 dict
+# 결과 캐시 키는 제출할 때의 dedupe_key (화면이 계산한 photo_cache_key / grade_cache_key)
+# payload["budget"]: 그 키를 만들 때 쓴 예산 단계 → 실행도 같은 단계로 (키와 결과가 어긋나지 않게)
+# =========================================================
+PartialSink = Callable[[Dict[str, Any]], None]
+Handler = Callable[[Any, Job, PartialSink], Dict[str, Any]]
+
+
+def record_result(result: Dict[str, Any], session_id: str, mission_id: str) -> None:
+    """작업 결과를 세션/미션의 결과 저장소 기록으로 남긴다 (다른 세션의 작업을 재사용한 경우에도)"""
+    store = get_store()
+    if "photo_json" in result:
+        store.append(session_id, mission_id, "photo", safe_json_load(result["photo_json"]))
+    if "result_json" in result:
+        store.append(session_id, mission_id, "grade", safe_json_load(result["result_json"]))
+
+
+def _plan(payload: Dict[str, Any]) -> Optional[BudgetPlan]:
+    budget = payload.get("budget")
+    return BudgetPlan(**budget) if isinstance(budget, dict) else None
+
+
+def run_photo_job(llm: Any, job: Job, on_partial: PartialSink) -> Dict[str, Any]:
+    p = job.payload
+    photo_json = photo_get(
+        llm, p["category"], p["mission_json"], p["photo_paths"],
+        on_partial=on_partial, plan=_plan(p), photo_labels=p.get("photo_labels"),
+    )
+    ResultCache().put(job.dedupe_key, photo_json)
+    return {"photo_json": photo_json}
+
+
+def run_grade_job(llm: Any, job: Job, on_partial: PartialSink) -> Dict[str, Any]:
+    p = job.payload
+    result_json = mission_complete(llm, p["mission_json"], p["photo_json"], on_partial=on_partial, plan=_plan(p))
+    ResultCache().put(job.dedupe_key, result_json)
+    return {"result_json": result_json}
+
+
+def run_fused_job(llm: Any, job: Job, on_partial: PartialSink) -> Dict[str, Any]:
+    p = job.payload
+    photo_json, result_json, _ = cached_fused(
+        llm, p["category"], p["mission_json"], p["photo_paths"], ResultCache(), on_partial, _plan(p),
+        p.get("photo_labels"),
+    )
+    return {"photo_json": photo_json, "result_json": result_json}
+
+
+HANDLERS: Dict[str, Handler] = {
+    "photo": run_photo_job,
+    "grade": run_grade_job,
+    "fused": run_fused_job,
+}
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str = JOB_QUEUE_PATH,
+        workers: int = JOB_WORKERS,
+        handlers: Optional[Dict[str, Handler]] = None,
+    ):
+        self.path = path
+        self.workers = max(1, workers)
+        self.handlers = dict(handlers if handlers is not None else HANDLERS)
+        # 이 프로세스(작업자 풀) 식별자
+        self.owner = new_id()
+        self._local = threading.local()
+        self._clients: Dict[str, Any] = {}
+        # 진행 중인 작업을 함께 기다리는 다른 (세션, 미션) → 끝나면 그쪽 기록도 남김
+        self._followers: Dict[str, List[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 연결은 스레드 간 공유하지 않음 → 스레드마다 1개
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # ---------- 제출 / 조회 ----------
+    def submit(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        llm: Any,
+        session_id: str,
+        mission_id: str,
+        key: str,
+    ) -> Job:
+        """
+        작업 등록. 같은 key로 이 프로세스에서 진행 중이거나 이미 끝난 작업이 있으면 그 작업을 반환.
+        (오류로 끝난 작업은 재사용하지 않음 → 다시 제출하면 새 작업)
+        다른 세션/미션의 작업을 재사용하면 이 세션/미션의 결과 저장소 기록도 남긴다
+        (끝난 작업은 바로, 진행 중인 작업은 끝날 때).
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"알 수 없는 작업 종류: {kind}")
+        self.start()
+        conn = self._conn()
+        with self._lock:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE dedupe_key = ? AND (status = 'done' OR (owner = ? AND status IN (?, ?))) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, self.owner, *ACTIVE),
+            ).fetchone()
+            found = Job.from_row(row) if row is not None else None
+            other = found is not None and (found.session_id, found.mission_id) != (session_id, mission_id)
+            if found is not None and found.active and other:
+                self._followers.setdefault(found.id, []).append((session_id, mission_id))
+            if found is None:
+                job_id = new_id()
+                now = time.time()
+                # 작업자가 행을 가져가기 전에 클라이언트가 있어야 함
+                self._clients[job_id] = llm
+                with conn:
+                    conn.execute(
+                        "INSERT INTO jobs (id, owner, session_id, mission_id, kind, dedupe_key, status, payload, "
+                        "created_at, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                        (job_id, self.owner, session_id, mission_id, kind, key,
+                         json.dumps(payload, ensure_ascii=False), now, now),
+                    )
+        if found is not None:
+            if found.status == "done" and other:
+                record_result(found.result, session_id, mission_id)
+            return found
+        self._wake.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def position(self, job: Job) -> int:
+        """이 작업 앞에 대기 중인 작업 수 (실행 중이면 0)"""
+        if job.status != "queued":
+            return 0
+        (n,) = self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE owner = ? AND status = 'queued' AND created_at < ?",
+            (self.owner, job.created_at),
+        ).fetchone()
+        return int(n)
+
+    # ---------- 작업자 ----------
+    def start(self) -> None:
+        """작업자/heartbeat 스레드 시작 (여러 번 불러도 1번만)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.reap_stale()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    def _claim(self) -> Optional[Job]:
+        conn = self._conn()
+        with self._lock:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE owner = ? AND status = 'queued' ORDER BY created_at LIMIT 1",
+                (self.owner,),
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            with conn:
+                cur = conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ? "
+                    "WHERE id = ? AND status = 'queued'",
+                    (now, now, row["id"]),
+                )
+            if cur.rowcount != 1:
+                return None
+        job = Job.from_row(row)
+        job.status, job.started_at = "running", now
+        return job
+
+    def _set_partial(self, job_id: str, obj: Dict[str, Any]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET partial = ?, heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                (json.dumps(obj, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def _finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: str = "") -> None:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, heartbeat_at = ? WHERE id = ?",
+                ("error" if error else "done",
+                 json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error or None, now, now, job_id),
+            )
+
+    def run_job(self, job: Job) -> None:
+        llm = self._clients.pop(job.id, None)
+        if llm is None:
+            self._finish(job.id, error="작업을 실행할 모델 클라이언트가 없습니다. 다시 시도해 주세요.")
+            return
+
+        last = [0.0]
+
+        def on_partial(obj: Dict[str, Any]) -> None:
+            now = time.monotonic()
+            if now - last[0] < _PARTIAL_INTERVAL_S:
+                return
+            last[0] = now
+            try:
+                self._set_partial(job.id, obj)
+            except sqlite3.Error:
+                pass  # 중간 결과 기록 실패로 작업을 멈추지 않음
+
+        try:
+            with usage_scope(session_id=job.session_id), span("job." + job.kind):
+                result = self.handlers[job.kind](llm, job, on_partial)
+                record_result(result, job.session_id, job.mission_id)
+        except Exception as e:
+            result = None
+            self._finish(job.id, error=f"{type(e).__name__}: {e}")
+        else:
+            self._finish(job.id, result=result)
+
+        with self._lock:
+            followers = self._followers.pop(job.id, [])
+        for session_id, mission_id in followers if result is not None else []:
+            try:
+                record_result(result, session_id, mission_id)
+            except Exception:
+                pass  # 다른 세션 기록 실패로 작업 결과를 바꾸지 않음
+
+    def _worker_loop(self) -> None:
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error:
+                job = None
+            if job is None:
+                self._wake.wait(JOB_POLL_S)
+                self._wake.clear()
+                continue
+            self.run_job(job)
+
+    # ---------- 정리 ----------
+    def reap_stale(self, now: Optional[float] = None) -> int:
+        """heartbeat가 끊긴 다른 프로세스의 작업을 오류로 정리 + 오래된 완료 작업 삭제. 정리한 작업 수 반환"""
+        now = now if now is not None else time.time()
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'error', error = ?, finished_at = ? "
+                "WHERE owner != ? AND status IN (?, ?) AND heartbeat_at < ?",
+                ("작업을 처리하던 프로세스가 멈췄습니다. 다시 시도해 주세요.", now,
+                 self.owner, *ACTIVE, now - JOB_STALE_S),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND finished_at < ?",
+                (*ACTIVE, now - JOB_RETENTION_S),
+            )
+        return cur.rowcount
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(_HEARTBEAT_S)
+            try:
+                conn = self._conn()
+                with conn:
+                    conn.execute(
+                        "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)",
+                        (time.time(), self.owner, *ACTIVE),
+                    )
+                self.reap_stale()
+            except sqlite3.Error:
+                pass
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -0,0 +1,1074 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+import tempfile
+import time
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from image_prep import PrepSettings, prepare_image
+from llm_client import ChatLike, shared_http_clients
+from model_router import confidence_escalation, escalation
+from partial_json import parse_partial
+from structured_output import (
+    FUSED_SCHEMA,
+    GRADE_SCHEMA,
+    MISSION_SCHEMA,
+    PHOTO_SCHEMA,
+    parse_model_json,
+    repair_json,
+)
+from photo_hash import SAME_PHOTO_DISTANCE, PhotoHashes, distance, get_index, image_hashes
+from policy import POLICY, category_policy, policy_text, policy_version
+from scoring import score_mission
+from mission_cache import MissionTemplateCache, get_templates
+from photo_change import change_summary_text, is_unchanged, measure_change
+from photo_quality import screen_photo
+from photo_select import checklist_words, select_photos, selection_enabled, selection_tag
+from photo_mapreduce import PhotoUnit, UnitResult, build_units, merge_results, run_map
+from result_cache import ResultCache, result_key
+from token_usage import BudgetPlan, budget_plan, with_stage
+from tracing import span, traced
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+# =========================================================
+# 공통: 정책
+# =========================================================
+# 정책 문구는 policy 설정(카테고리별 안내/통과 기준/가중치)에서 만든다
+POLICY_TEXT = policy_text(POLICY)
+
+# 프롬프트를 바꾸면 버전도 올릴 것 (결과 캐시 키에 포함됨)
+PHOTO_PROMPT_VERSION = "photo-v4"
+GRADE_PROMPT_VERSION = "grade-v4"
+
+# 최종 판정 방식: "llm"(채점 모델 호출) | "rules"(사진 단계의 항목별 상태로 로컬 채점, scoring.py)
+GRADE_MODE = os.getenv("GRADE_MODE", "llm")
+
+# 사진 이후 단계: "two_stage"(photoGet → missionComplete 2번 호출) | "fused"(사진 분석+판정 1번 호출)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "two_stage")
+FUSED_PROMPT_VERSION = "fused-v2"
+
+# 사진 분석 방식: "mapreduce"(사진별 병렬 분석 후 병합) | "single_call"(전체 사진을 한 번에)
+# mapreduce는 사진(비교모드는 전후 1쌍)별 결과를 해시로 재사용 → 사진을 추가/교체하면 그 사진만 새로 분석
+PHOTO_ANALYSIS_MODE = os.getenv("PHOTO_ANALYSIS_MODE", "mapreduce")
+PHOTO_MAX_WORKERS = int(os.getenv("PHOTO_MAX_WORKERS", "4"))
+PHOTO_TIMEOUT_S = float(os.getenv("PHOTO_TIMEOUT_S", "60"))
+# 같은/거의 같은 사진의 사진별 분석 결과 재사용 (photo_hash 인덱스)
+PHOTO_HASH_REUSE = os.getenv("PHOTO_HASH_REUSE", "1") == "1"
+# 청소 비교모드에서 로컬 변화 측정(photo_change)을 먼저 돌려 프롬프트/판정 근거로 사용
+PHOTO_CHANGE_DETECTION = os.getenv("PHOTO_CHANGE_DETECTION", "1") == "1"
+# 같은/비슷한 미션 입력이면 체크리스트를 다시 만들지 않고 템플릿 재사용 (mission_cache)
+MISSION_TEMPLATE_CACHE = os.getenv("MISSION_TEMPLATE_CACHE", "1") == "1"
+
+
+# =========================================================
+# 공통 유틸
+# =========================================================
+def build_llm(
+    api_key: str,
+    model_name: str = "gpt-4o-mini",
+    base_url: Optional[str] = None,
+    max_retries: int = 2,
+) -> ChatOpenAI:
+    # HTTP 커넥션 풀은 프로세스 전체에서 공유 (llm_client.shared_http_clients)
+    # LLMClient로 감쌀 때는 재시도를 래퍼가 하므로 max_retries=0으로 만든다
+    http_client, http_async_client = shared_http_clients()
+    return ChatOpenAI(
+        api_key=api_key,
+        model=model_name,
+        temperature=0,
+        base_url=base_url,
+        max_retries=max_retries,
+        stream_usage=True,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+def ensure_dir(path: str) -> None:
+    os.makedirs(path, exist_ok=True)
+
+
+@traced("save_json")
+def save_json(path: str, obj: Any) -> None:
+    # 임시 파일에 쓰고 rename → 읽는 쪽이 반쯤 쓰인 파일을 보지 않음
+    d = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=d, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def safe_json_load(text: str) -> Any:
+    """
+    JSON 문자열 파싱. 코드펜스/앞뒤 설명/꼬리 쉼표/잘린 출력은 복구 시도 (structured_output.repair_json).
+    실패하면 None.
+    """
+    return repair_json(text)
+
+
+def image_to_data_url(path: str, settings: Optional[PrepSettings] = None) -> str:
+    # 원본 그대로가 아니라 회전/축소/재인코딩(메타데이터 제거)된 바이트를 인코딩
+    with span("image_prep"):
+        img = prepare_image(path, settings)
+    with span("base64", bytes=len(img.data)):
+        b64 = base64.b64encode(img.data).decode("utf-8")
+    return f"data:{img.mime};base64,{b64}"
+
+
+
+# 스트리밍 미리보기 콜백: 지금까지 완성된 키만 담긴 dict를 받는다
+PartialCallback = Callable[[Dict[str, Any]], None]
+
+PHOTO_LIST_KEYS = ("observations", "notable_changes", "caveats")
+GRADE_LIST_KEYS = ("reason_summary", "missing_or_unclear", "next_request_to_child")
+
+
+def complete_text(
+    llm: ChatLike,
+    messages: Any,
+    on_partial: Optional[PartialCallback] = None,
+    list_keys: tuple = (),
+    scalar_keys: tuple = (),
+) -> str:
+    """
+    모델 출력 텍스트 전체를 반환.
+    on_partial이 있으면 스트리밍으로 받으면서 완성된 키를 콜백으로 넘긴다.
+    """
+    if on_partial is None:
+        with span("model", stream=False):
+            return llm.invoke(messages).content.strip()
+
+    buf = ""
+    with span("model", stream=True) as s:
+        t0 = time.perf_counter()
+        for chunk in llm.stream(messages):
+            piece = chunk.content if isinstance(chunk.content, str) else ""
+            if not piece:
+                continue
+            if not buf:
+                s.attrs["first_chunk_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            buf += piece
+            on_partial(parse_partial(buf, list_keys, scalar_keys))
+    return buf.strip()
+
+
+def complete_json(
+    llm: ChatLike,
+    messages: Any,
+    schema: Dict[str, Any],
+    kind: str,
+    on_partial: Optional[PartialCallback] = None,
+    list_keys: tuple = (),
+    scalar_keys: tuple = (),
+) -> Tuple[Any, str]:
+    """
+    complete_text + parse_model_json → (파싱 결과, 원문).
+    llm이 모델 라우터면 파싱 실패/낮은 신뢰도일 때 더 강한 모델로 다시 묻는다 (model_router.escalation).
+    """
+    while True:
+        out = complete_text(llm, messages, on_partial, list_keys, scalar_keys)
+        with span("parse"):
+            obj = parse_model_json(llm, out, schema)
+        stronger = escalation(llm, obj, schema, kind)
+        if stronger is None:
+            return obj, out
+        logger.info("model router: %s 단계 승급", kind)
+        llm = stronger
+
+
+# =========================================================
+# 프롬프트 = 고정 앞부분(system) + 가변 뒷부분(human)
+# - 역할/규칙/스키마처럼 호출마다 같은 내용은 system 메시지에 모아서 맨 앞에 둔다
+#   → 앞부분이 글자 하나까지 같아야 제공자 쪽 프롬프트 캐시가 적용됨 (캐시된 입력 토큰은 token_usage에 기록)
+# - 미션/사진 분석/채점 기준처럼 바뀌는 값은 human 메시지에, 덜 바뀌는 것부터 순서대로 (사진은 맨 끝)
+# - 고정 앞부분에 카테고리/모드 같은 값을 끼워 넣지 말 것
+# =========================================================
+MISSION_SYSTEM_PROMPT = """
+너는 '미션 정리 도우미'이다. 부모가 입력한 미션 세부사항을 채점 가능한 체크리스트로 정리해라.
+
+규칙:
+- 세부사항에 적힌 내용만 체크리스트로 만든다. (추측해서 항목 추가 금지)
+- 각 항목은 사진으로 확인 가능한 형태로 짧게 쓴다.
+- category는 [카테고리] 값을 그대로 쓴다.
+- JSON만 출력
+
+스키마:
+{
+  "category": "카테고리",
+  "details_raw": "부모 입력 원문",
+  "mission_summary": "한 줄 요약",
+  "checklist": [{"item": "확인할 항목"}]
+}
+""".strip()
+
+_PHOTO_MODE_RULES = """[모드]
+- compare: 사진 1 = before, 사진 2 = after. 달라진 점을 notable_changes에 적어라.
+- single: 결과 사진만 보고 관찰한다. notable_changes는 빈 배열로 둔다.
+- [로컬 변화 측정] 수치가 주어지면 참고하되, 수치와 사진이 다르면 사진을 우선한다."""
+
+_PHOTO_SCHEMA_HINT = """  "mode": "compare 또는 single (입력의 [모드] 값 그대로)",
+  "observations": ["체크리스트 기준 관찰 3~8개"],
+  "notable_changes": ["전후 변화 0~6개"],
+  "caveats": ["사진만으로 알 수 없는 점 0~5개"],
+  "items": [{"item": "체크리스트 항목 문구 그대로", "status": "done|partial|missing|unclear", "evidence": "사진 근거 한 줄"}]"""
+
+_PHOTO_NOTES = """주의:
+- items는 체크리스트 항목마다 1개씩, 같은 순서로 적어라. 사진으로 확인 안 되면 status는 unclear.
+- 글씨/채점표시가 안 보이면 '판독 불가/불명확'이라고 적어라.
+- 개인정보/이름 추정 금지."""
+
+GRADE_SCHEMA_HINT = """  "completion_percent": number,
+  "pass": boolean,
+  "reason_summary": ["근거 3~6개"],
+  "missing_or_unclear": ["불명확/부족한 점 0~6개"],
+  "next_request_to_child": ["추가 요청 0~6개"]"""
+
+PHOTO_SYSTEM_PROMPT = f"""
+너는 '미션 인증 사진 분석가'이다. 사진에서 보이는 것만 근거로 관찰해라.
+
+{_PHOTO_MODE_RULES}
+
+JSON만 출력
+
+스키마:
+{{
+{_PHOTO_SCHEMA_HINT}
+}}
+
+{_PHOTO_NOTES}
+""".strip()
+
+GRADE_SYSTEM_PROMPT = f"""
+너는 '미션 채점관'이다. 주어진 [미션 정보]와 [사진 분석]만 근거로 평가해라.
+
+- 채점 기준은 입력의 [채점 규칙]을 따른다.
+- 사진 분석에 change_metrics(로컬 전후 변화 측정)가 있으면 전후 변화의 객관 근거로 참고
+- JSON만 출력
+
+스키마:
+{{
+{GRADE_SCHEMA_HINT}
+}}
+""".strip()
+
+FUSED_SYSTEM_PROMPT = f"""
+너는 '미션 인증 사진 분석가 겸 채점관'이다. 사진에서 보이는 것만 근거로 관찰하고, 그 관찰만으로 채점해라.
+
+{_PHOTO_MODE_RULES}
+
+- 채점 기준은 입력의 [채점 규칙]을 따른다.
+- items의 status(done/partial/missing/unclear)와 완수율이 서로 맞아야 한다.
+- JSON만 출력
+
+스키마:
+{{
+{_PHOTO_SCHEMA_HINT},
+{GRADE_SCHEMA_HINT}
+}}
+
+{_PHOTO_NOTES}
+""".strip()
+
+
+def prompt_messages(system: str, human: Any) -> List[BaseMessage]:
+    """human: 텍스트 또는 이미 만든 HumanMessage(사진 포함)"""
+    if not isinstance(human, BaseMessage):
+        human = HumanMessage(content=human)
+    return [SystemMessage(content=system), human]
+
+
+def mission_prompt_text(category: str, details: str, policy: str) -> str:
+    # 정책은 배포마다 고정이라 가변 부분 중 맨 앞
+    return f"""[정책]
+{policy}
+
+[카테고리]
+{category}
+
+[부모 입력 세부사항]
+{details}"""
+
+
+# =========================================================
+# 판정 단계 (Streamlit 없이 llm만 받아서 동작)
+# =========================================================
+@traced("missionGet")
+@with_stage("mission")
+def mission_get(
+    llm: ChatLike,
+    category: str,
+    details: str,
+    policy: str = POLICY_TEXT,
+    templates: Optional[MissionTemplateCache] = None,
+    refresh: bool = False,
+) -> str:
+    """
+    [1] 미션 요약 + 체크리스트 생성.
+    같은 카테고리/정책에서 같거나 충분히 비슷한 세부사항이면 저장된 템플릿을 쓴다 (LLM 호출 없음).
+    템플릿은 설정된 정책(POLICY_TEXT)으로 만든 것만 쓰고, 버킷은 policy_version(POLICY).
+    refresh=True면 템플릿을 보지 않고 새로 만들어 이 세부사항의 템플릿을 바꾼다 (STEP 2 "체크리스트 새로 만들기").
+    반환: JSON 문자열
+    """
+    if policy != POLICY_TEXT:
+        templates = None
+    elif templates is None and MISSION_TEMPLATE_CACHE:
+        templates = get_templates()
+    version = policy_version(POLICY)
+
+    if templates is not None and not refresh:
+        with span("template"):
+            hit = templates.lookup(category, details, version)
+        if hit is not None:
+            obj, match, score = hit
+            # 어떤 미션의 체크리스트인지 화면에 보여 주도록 원래 세부사항을 남긴다
+            obj["template_match"] = {"kind": match, "score": score, "details": obj.get("details_raw", "")}
+            obj["category"] = category
+            obj["details_raw"] = details
+            return json.dumps(obj, ensure_ascii=False)
+
+    messages = prompt_messages(MISSION_SYSTEM_PROMPT, mission_prompt_text(category, details, policy))
+    obj, out = complete_json(llm, messages, MISSION_SCHEMA, "mission")
+    if not isinstance(obj, dict):
+        obj = {"_raw": out}
+
+    obj["category"] = category
+    obj["details_raw"] = details
+    obj.setdefault("mission_summary", "")
+    obj.setdefault("checklist", [])
+
+    # 제대로 만들어진 체크리스트만 템플릿으로 저장
+    if templates is not None and obj["checklist"] and "_raw" not in obj:
+        try:
+            templates.put(category, details, version, obj)
+        except OSError:
+            logger.exception("mission template: 저장 실패")
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _change_block(change_metrics: Optional[Dict[str, Any]]) -> str:
+    if not change_metrics:
+        return ""
+    return f"""
+
+[로컬 변화 측정 (before→after, 참고용 수치)]
+{change_summary_text(change_metrics)}"""
+
+
+def photo_prompt_text(
+    category: str,
+    mission_obj: Dict[str, Any],
+    mode: str,
+    change_metrics: Optional[Dict[str, Any]] = None,
+) -> str:
+    """사진 분석 프롬프트의 가변 부분 (고정 부분은 PHOTO_SYSTEM_PROMPT)"""
+    return f"""[미션 정보]
+{json.dumps({
+  "category": category,
+  "mission_summary": mission_obj.get("mission_summary"),
+  "checklist": mission_obj.get("checklist", [])
+}, ensure_ascii=False)}
+
+[모드] {mode}{_change_block(change_metrics)}"""
+
+
+def photo_message(
+    prompt_text: str,
+    photo_paths: List[str],
+    start: int = 1,
+    settings: Optional[PrepSettings] = None,
+) -> HumanMessage:
+    content: List[Dict[str, Any]] = [{"type": "text", "text": prompt_text}]
+    for i, p in enumerate(photo_paths, start=start):
+        content.append({"type": "text", "text": f"사진 {i} (path={p})"})
+        content.append({"type": "image_url", "image_url": {"url": image_to_data_url(p, settings)}})
+    return HumanMessage(content=content)
+
+
+def analyze_photos(
+    llm: ChatLike,
+    prompt_text: str,
+    photo_paths: List[str],
+    start: int = 1,
+    on_partial: Optional[PartialCallback] = None,
+    settings: Optional[PrepSettings] = None,
+    kind: str = "photo",
+) -> Any:
+    """kind="photo_unit"이면 mapreduce의 사진 단위 호출 → 라우터 승급은 파싱/스키마 실패일 때만"""
+    messages = prompt_messages(PHOTO_SYSTEM_PROMPT, photo_message(prompt_text, photo_paths, start, settings))
+    # 파싱 실패 시 수정 호출은 텍스트만 보냄 (사진 재전송 없음)
+    obj, _ = complete_json(llm, messages, PHOTO_SCHEMA, kind, on_partial, PHOTO_LIST_KEYS)
+    return obj
+
+
+def screen_photos(paths: List[str]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """(통과한 사진 경로, 거절된 사진 정보). 번호는 원래 제출 순서 기준"""
+    ok: List[str] = []
+    rejected: List[Dict[str, Any]] = []
+    for i, p in enumerate(paths, start=1):
+        report = screen_photo(p)
+        if report.ok:
+            ok.append(p)
+        else:
+            rejected.append({"index": i, "path": p, "problems": report.problems})
+    return ok, rejected
+
+
+def _add_rejected(obj: Dict[str, Any], rejected: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if rejected:
+        obj["rejected_photos"] = rejected
+        obj["caveats"] = list(obj.get("caveats", [])) + [
+            f"사진 {r['index']} 제외(사전 검사): {' / '.join(r['problems'])}" for r in rejected
+        ]
+    return obj
+
+
+def _add_budget(obj: Dict[str, Any], plan: Optional[BudgetPlan], dropped: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """토큰 예산 때문에 줄여서 분석했으면 그 사실을 결과에 남긴다"""
+    if plan is None or not plan.degraded:
+        return obj
+    obj["budget"] = {"level": plan.level, "used_fraction": plan.used_fraction, "max_edge": plan.max_edge}
+    if dropped:
+        obj["budget_dropped_photos"] = dropped
+        nums = ", ".join(str(d["index"]) for d in dropped)
+        obj["caveats"] = list(obj.get("caveats", [])) + [
+            f"토큰 예산이 부족해 사진 {nums} 제외 (최대 {plan.max_photos}장만 분석)"
+        ]
+    return obj
+
+
+def _add_deselected(obj: Dict[str, Any], deselected: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if deselected:
+        obj["deselected_photos"] = deselected
+        obj["caveats"] = list(obj.get("caveats", [])) + [
+            f"사진 {d['index']} 제외(사진 선택): {d['reason']}" for d in deselected
+        ]
+    return obj
+
+
+def _hashes(paths: List[str]) -> List[Optional[PhotoHashes]]:
+    out: List[Optional[PhotoHashes]] = []
+    for p in paths:
+        try:
+            out.append(image_hashes(p))
+        except Exception:
+            out.append(None)  # 디코딩 불가 등 → 해시 비교/재사용 대상에서 제외
+    return out
+
+
+def _index_photos(paths: List[str], hashes: List[Optional[PhotoHashes]]) -> None:
+    try:
+        index = get_index()
+        for p, h in zip(paths, hashes):
+            if h is not None:
+                index.add(h, p)
+    except Exception:
+        logger.exception("photo index: 기록 실패")
+
+
+def analysis_context_key(
+    category: str,
+    mission_obj: Dict[str, Any],
+    settings: Optional[PrepSettings] = None,
+) -> str:
+    """사진별 분석 결과를 재사용해도 되는 범위: 같은 카테고리/체크리스트/프롬프트/전처리"""
+    settings = settings or PrepSettings.from_env()
+    raw = json.dumps(
+        [category, mission_obj.get("checklist", []), PHOTO_PROMPT_VERSION, settings.tag()],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def same_photo_result() -> Dict[str, Any]:
+    """청소 비교모드에서 before/after가 같은 사진일 때 (모델 호출 없음)"""
+    return {
+        "mode": "compare",
+        "observations": ["사진 1(before)과 사진 2(after)가 같은 사진(또는 거의 같은 사진)입니다."],
+        "notable_changes": [],
+        "caveats": ["전후 사진이 같아 청소 전후 변화를 확인할 수 없음 — after 사진을 새로 찍어 제출 필요"],
+        "same_photo": True,
+    }
+
+
+def no_change_result(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """정렬 후 변화 면적이 사실상 0일 때 (모델 호출 없음)"""
+    return {
+        "mode": "compare",
+        "observations": ["before와 after 사이에 눈에 띄는 변화가 측정되지 않았습니다."],
+        "notable_changes": [],
+        "caveats": [f"로컬 변화 측정 결과 변화 없음 ({change_summary_text(metrics)})"],
+        "change_metrics": metrics,
+    }
+
+
+@dataclass
+class PhotoPrelude:
+    """모델 호출 전 로컬 단계(사전 검사/해시/전후 변화 측정) 결과"""
+    paths: List[str]
+    rejected: List[Dict[str, Any]]
+    mode: str
+    hashes: List[Optional[PhotoHashes]] = field(default_factory=list)
+    change_metrics: Optional[Dict[str, Any]] = None
+    # 모델 없이 결론이 난 경우의 사진 분석 결과 (사진 없음 / 전후 같은 사진 / 변화 없음)
+    shortcut: Optional[Dict[str, Any]] = None
+    # 토큰 예산에 따른 축소: 전처리 설정(해상도), 빠진 사진
+    budget: Optional[BudgetPlan] = None
+    settings: Optional[PrepSettings] = None
+    dropped: List[Dict[str, Any]] = field(default_factory=list)
+    # 사진 선택(photo_select)에서 빠진 사진
+    deselected: List[Dict[str, Any]] = field(default_factory=list)
+
+    def finish(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        """사진 분석 결과에 사전 검사 제외/예산 축소/선택 제외 내용 추가"""
+        obj = _add_budget(_add_rejected(obj, self.rejected), self.budget, self.dropped)
+        return _add_deselected(obj, self.deselected)
+
+
+def _apply_budget(pre: PhotoPrelude, plan: BudgetPlan, numbers: List[int]) -> None:
+    """예산을 다 써 가면 앞쪽 사진만, 낮은 해상도로 보낸다 (비교모드 판단은 줄이기 전 기준)"""
+    pre.budget = plan
+    if not plan.degraded:
+        return
+    if len(pre.paths) > plan.max_photos:
+        pre.dropped = [{"index": n, "path": p} for n, p in zip(numbers[plan.max_photos:], pre.paths[plan.max_photos:])]
+        pre.paths = pre.paths[:plan.max_photos]
+    base = PrepSettings.from_env()
+    if plan.max_edge is not None and plan.max_edge < base.max_edge:
+        pre.settings = replace(base, max_edge=plan.max_edge)
+
+
+@traced("prepare_photos")
+def prepare_photos(
+    category: str,
+    photo_paths: List[str],
+    plan: Optional[BudgetPlan] = None,
+    mission_obj: Optional[Dict[str, Any]] = None,
+    photo_labels: Optional[List[str]] = None,
+) -> PhotoPrelude:
+    """
+    모델 호출 전 로컬 단계. mission_obj / photo_labels(사진별 원래 이름, photo_paths와 같은 순서)는
+    사진 선택의 체크리스트 관련도에만 쓴다
+    """
+    with span("screen", photos=len(photo_paths[:10])):
+        paths, rejected = screen_photos(photo_paths[:10])
+    mode = "compare" if (category == "청소" and len(paths) == 2) else "single"
+    pre = PhotoPrelude(paths, rejected, mode)
+
+    if not paths:
+        obj = {"mode": mode, "observations": [], "notable_changes": [], "caveats": [], "partial": True}
+        pre.shortcut = pre.finish(obj)
+        return pre
+
+    # 통과한 사진의 원래 제출 번호 (캡션/예산 제외 안내용)
+    skipped = {r["index"] for r in rejected}
+    numbers = [i for i in range(1, len(photo_paths[:10]) + 1) if i not in skipped]
+    _apply_budget(pre, plan if plan is not None else budget_plan(), numbers)
+    paths = pre.paths
+
+    with span("hash"):
+        pre.hashes = _hashes(paths)
+        _index_photos(paths, pre.hashes)
+
+    if selection_enabled():
+        # 바이트/토큰 예산 안에서 보낼 사진과 해상도 결정 (비교모드는 두 장 모두 유지)
+        with span("select", photos=len(paths)):
+            label_of = dict(zip(photo_paths, photo_labels or photo_paths))
+            sel = select_photos(
+                paths,
+                numbers[:len(paths)],
+                pre.hashes,
+                pre.settings or PrepSettings.from_env(),
+                keep_all=(mode == "compare"),
+                labels=[label_of.get(p, p) for p in paths],
+                words=checklist_words(mission_obj or {}),
+            )
+        pre.paths, pre.hashes, pre.deselected = sel.paths, sel.hashes, sel.dropped
+        if sel.max_edge < (pre.settings or PrepSettings.from_env()).max_edge:
+            pre.settings = replace(pre.settings or PrepSettings.from_env(), max_edge=sel.max_edge)
+        paths = pre.paths
+
+    h = pre.hashes
+    if mode == "compare" and h[0] and h[1] and distance(h[0], h[1]) <= SAME_PHOTO_DISTANCE:
+        pre.shortcut = pre.finish(same_photo_result())
+        return pre
+
+    if mode == "compare" and PHOTO_CHANGE_DETECTION:
+        try:
+            with span("change"):
+                pre.change_metrics = measure_change(paths[0], paths[1])
+        except Exception:
+            logger.exception("photo change: 측정 실패")
+        if pre.change_metrics and is_unchanged(pre.change_metrics):
+            pre.shortcut = pre.finish(no_change_result(pre.change_metrics))
+    return pre
+
+
+@traced("photoGet")
+@with_stage("photo")
+def photo_get(
+    llm: ChatLike,
+    category: str,
+    mission_summary_json: str,
+    photo_paths: List[str],
+    on_partial: Optional[PartialCallback] = None,
+    plan: Optional[BudgetPlan] = None,
+    photo_labels: Optional[List[str]] = None,
+) -> str:
+    """
+    [2] 사진 관찰 요약 / 전후 변화 / 한계.
+    PHOTO_ANALYSIS_MODE=mapreduce 이면 사진(비교모드는 전후 1쌍)별로 동시에 분석 후 병합.
+    사진 1장(비교모드는 전후 1쌍) 단위 분석은 같은/거의 같은 사진의 이전 결과가 있으면 재사용 (photo_hash)
+    → 사진을 1장 추가/교체하면 그 사진만 모델에 보내고 전체 결과는 사진별 결과로 다시 병합한다.
+    사전 검사(photo_quality)를 통과하지 못한 사진은 모델에 보내지 않고 caveats에 남긴다.
+    토큰 예산을 다 써 가면 사진 수/해상도를 줄여서 분석한다 (token_usage.budget_plan).
+    plan: 캐시 키를 만들 때 쓴 예산 단계 (없으면 지금 사용량으로 계산)
+    photo_labels: 사진 선택의 관련도용 원래 이름 (업로드 사진은 올린 파일 이름, 없으면 경로)
+    on_partial: 미리보기 콜백 (single_call은 스트리밍, mapreduce는 사진별 분석이 끝날 때마다)
+    반환: JSON 문자열
+    """
+    mission_obj = safe_json_load(mission_summary_json) or {}
+    pre = prepare_photos(category, photo_paths, plan, mission_obj, photo_labels)
+    if pre.shortcut is not None:
+        if on_partial is not None:
+            on_partial(pre.shortcut)
+        return json.dumps(pre.shortcut, ensure_ascii=False)
+
+    photo_paths, mode, settings = pre.paths, pre.mode, pre.settings
+    change_metrics = pre.change_metrics
+    context_key = analysis_context_key(category, mission_obj, settings)
+    hash_of = dict(zip(photo_paths, pre.hashes))
+
+    # 이전 결과를 재사용한 사진 번호 (병렬 작업 스레드에서 추가)
+    reused: List[int] = []
+
+    def _analyze_one(
+        path: str, index: int, prompt_text: str, partial: Optional[PartialCallback] = None, kind: str = "photo"
+    ) -> Any:
+        h = hash_of.get(path)
+        if PHOTO_HASH_REUSE and h is not None:
+            try:
+                cached = get_index().get_analysis(h, context_key)
+            except Exception:
+                logger.exception("photo index: 조회 실패")
+                cached = None
+            if isinstance(cached, dict):
+                reused.append(index)
+                if partial is not None:
+                    partial(cached)
+                return cached
+
+        obj = analyze_photos(llm, prompt_text, [path], start=index, on_partial=partial, settings=settings, kind=kind)
+        if PHOTO_HASH_REUSE and h is not None and isinstance(obj, dict) and obj.get("observations"):
+            try:
+                get_index().put_analysis(h, context_key, obj)
+            except Exception:
+                logger.exception("photo index: 저장 실패")
+        return obj
+
+    def _analyze_pair(unit: PhotoUnit, prompt_text: str) -> Any:
+        # 전후 1쌍은 두 사진 해시의 조합으로 재사용 → 한쪽이라도 바뀌면 다시 분석
+        before, after = hash_of.get(unit.paths[0]), hash_of.get(unit.paths[1])
+        reuse = PHOTO_HASH_REUSE and before is not None and after is not None
+        if reuse:
+            try:
+                cached = get_index().get_pair_analysis(before, after, context_key)
+            except Exception:
+                logger.exception("photo index: 조회 실패")
+                cached = None
+            if isinstance(cached, dict):
+                reused.extend([unit.index, unit.index + 1])
+                return cached
+
+        obj = analyze_photos(llm, prompt_text, unit.paths, start=unit.index, settings=settings, kind="photo_unit")
+        if reuse and isinstance(obj, dict) and obj.get("observations"):
+            try:
+                get_index().put_pair_analysis(before, after, context_key, obj)
+            except Exception:
+                logger.exception("photo index: 저장 실패")
+        return obj
+
+    if PHOTO_ANALYSIS_MODE == "mapreduce":
+        def _analyze(unit: PhotoUnit) -> Any:
+            text = photo_prompt_text(category, mission_obj, unit.mode, change_metrics)
+            if unit.mode == "single":
+                return _analyze_one(unit.paths[0], unit.index, text, kind="photo_unit")
+            return _analyze_pair(unit, text)
+
+        finished: List[UnitResult] = []
+
+        def _progress(r: UnitResult) -> None:
+            # 끝난 사진까지의 병합 결과로 미리보기 갱신
+            finished.append(r)
+            if on_partial is not None:
+                on_partial(merge_results(sorted(finished, key=lambda x: x.unit.index), mode))
+
+        results = run_map(
+            _analyze,
+            build_units(photo_paths, mode),
+            max_workers=PHOTO_MAX_WORKERS,
+            timeout=PHOTO_TIMEOUT_S,
+            on_result=_progress,
+        )
+        merged = merge_results(results, mode)
+        stronger = confidence_escalation(llm, merged, "photo")
+        if stronger is not None:
+            # 사진별 결과를 합쳐도 unclear가 많으면 더 강한 모델에 사진 전체를 한 번에 다시 묻는다
+            logger.info("model router: 병합 결과 신뢰도 낮음 → 승급")
+            text = photo_prompt_text(category, mission_obj, mode, change_metrics)
+            obj = analyze_photos(stronger, text, photo_paths, settings=settings)
+            if isinstance(obj, dict):
+                merged = dict(obj, mode=mode)
+                merged.setdefault("observations", [])
+                merged.setdefault("notable_changes", [])
+                merged.setdefault("caveats", [])
+        if change_metrics:
+            merged["change_metrics"] = change_metrics
+        if reused:
+            merged["reused_photos"] = sorted(reused)
+        return json.dumps(pre.finish(merged), ensure_ascii=False)
+
+    prompt_text = photo_prompt_text(category, mission_obj, mode, change_metrics)
+    if len(photo_paths) == 1:
+        obj = _analyze_one(photo_paths[0], 1, prompt_text, on_partial)
+    else:
+        obj = analyze_photos(llm, prompt_text, photo_paths, on_partial=on_partial, settings=settings)
+
+    if isinstance(obj, dict):
+        obj.setdefault("mode", mode)
+        obj.setdefault("observations", [])
+        obj.setdefault("notable_changes", [])
+        obj.setdefault("caveats", [])
+        if change_metrics:
+            obj["change_metrics"] = change_metrics
+        pre.finish(obj)
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def grading_rules_text(cat: Dict[str, Any]) -> str:
+    scores = cat["status_scores"]
+    return f"""채점 규칙:
+- checklist 항목별로 달성={scores.get("done", 1.0):g} / 부분={scores.get("partial", 0.5):g} / 미달={scores.get("missing", 0.0):g}
+- 완수율 = 평균 * 100
+- {cat["pass_threshold"]:g}% 이상이면 통과(pass=true)
+- 확실하지 않으면 보수적으로(부분/미달) 판정"""
+
+
+def finalize_grade(obj: Dict[str, Any], cat: Dict[str, Any]) -> Dict[str, Any]:
+    """모델이 준 판정 보정: 완수율 0~100, 통과 여부는 정책 기준으로 다시 계산"""
+    try:
+        cp = float(obj.get("completion_percent", 0))
+    except Exception:
+        cp = 0.0
+    cp = max(0.0, min(100.0, cp))
+    obj["completion_percent"] = cp
+    obj["pass"] = bool(cp >= cat["pass_threshold"])
+
+    obj.setdefault("reason_summary", [])
+    obj.setdefault("missing_or_unclear", [])
+    obj.setdefault("next_request_to_child", [])
+    return obj
+
+
+def grade_prompt_text(mission_obj: Dict[str, Any], photo_obj: Dict[str, Any], cat: Dict[str, Any]) -> str:
+    """채점 프롬프트의 가변 부분 (고정 부분은 GRADE_SYSTEM_PROMPT)"""
+    return f"""[미션 정보]
+{json.dumps({
+  "category": mission_obj.get("category"),
+  "details_raw": mission_obj.get("details_raw"),
+  "mission_summary": mission_obj.get("mission_summary"),
+  "checklist": mission_obj.get("checklist", [])
+}, ensure_ascii=False)}
+
+[채점 규칙]
+{grading_rules_text(cat)}
+
+[사진 분석]
+{json.dumps(photo_obj, ensure_ascii=False)}"""
+
+
+@traced("missionComplete")
+@with_stage("grade")
+def mission_complete(
+    llm: ChatLike,
+    mission_summary_json: str,
+    photo_analysis_json: str,
+    on_partial: Optional[PartialCallback] = None,
+    plan: Optional[BudgetPlan] = None,
+) -> str:
+    """
+    [3] 최종 판정(완수율/통과 여부).
+    GRADE_MODE=rules 이면 모델 호출 없이 항목별 상태로 로컬 채점 (scoring.score_mission).
+    토큰 예산을 다 쓴 경우(budget_plan().local_grading)도 로컬 채점. plan: 캐시 키를 만들 때 쓴 예산 단계
+    on_partial: 스트리밍 미리보기 콜백 (최종값은 아래 보정을 거친 반환값을 쓸 것)
+    반환: JSON 문자열
+    """
+    mission_obj = safe_json_load(mission_summary_json) or {}
+    photo_obj = safe_json_load(photo_analysis_json) or {}
+
+    if GRADE_MODE == "rules":
+        plan = None
+    elif plan is None:
+        plan = budget_plan()
+    if GRADE_MODE == "rules" or (plan is not None and plan.local_grading):
+        obj = score_mission(mission_obj, photo_obj, POLICY)
+        if plan is not None:
+            obj["budget"] = {"level": plan.level, "used_fraction": plan.used_fraction}
+        if on_partial is not None:
+            on_partial(obj)
+        return json.dumps(obj, ensure_ascii=False)
+
+    cat = category_policy(POLICY, str(mission_obj.get("category") or ""))
+    messages = prompt_messages(GRADE_SYSTEM_PROMPT, grade_prompt_text(mission_obj, photo_obj, cat))
+    obj, out = complete_json(
+        llm, messages, GRADE_SCHEMA, "grade", on_partial, GRADE_LIST_KEYS, ("completion_percent",)
+    )
+    if not isinstance(obj, dict):
+        obj = {"_raw": out}
+
+    return json.dumps(finalize_grade(obj, cat), ensure_ascii=False)
+
+
+# =========================================================
+# 사진 분석 + 최종 판정 한 번에 (PIPELINE_MODE=fused)
+# 멀티모달 호출 1번으로 관찰/항목별 상태/판정을 같이 받고, 사진 분석과 판정으로 나눠서 돌려준다
+# =========================================================
+_PHOTO_KEYS = ("mode", "observations", "notable_changes", "caveats", "items")
+_GRADE_KEYS = ("completion_percent", "pass", "reason_summary", "missing_or_unclear", "next_request_to_child")
+
+
+def fused_prompt_text(
+    category: str,
+    mission_obj: Dict[str, Any],
+    mode: str,
+    change_metrics: Optional[Dict[str, Any]] = None,
+) -> str:
+    """fused 프롬프트의 가변 부분 (고정 부분은 FUSED_SYSTEM_PROMPT)"""
+    cat = category_policy(POLICY, category)
+    return f"""[미션 정보]
+{json.dumps({
+  "category": category,
+  "details_raw": mission_obj.get("details_raw"),
+  "mission_summary": mission_obj.get("mission_summary"),
+  "checklist": mission_obj.get("checklist", [])
+}, ensure_ascii=False)}
+
+[채점 규칙]
+{grading_rules_text(cat)}
+
+[모드] {mode}{_change_block(change_metrics)}"""
+
+
+@traced("judgeFused")
+@with_stage("fused")
+def judge_fused(
+    llm: ChatLike,
+    category: str,
+    mission_summary_json: str,
+    photo_paths: List[str],
+    on_partial: Optional[PartialCallback] = None,
+    plan: Optional[BudgetPlan] = None,
+    photo_labels: Optional[List[str]] = None,
+) -> Tuple[str, str]:
+    """
+    [2]+[3] 한 번의 호출로 (사진 분석 JSON, 판정 JSON).
+    로컬 단계에서 결론이 나면(사진 없음/전후 같음/변화 없음) 모델 없이 로컬 채점.
+    토큰 예산 축소(사진 수/해상도)는 photo_get과 같다.
+    on_partial: 스트리밍 미리보기 콜백 (사진 분석 키와 판정 근거 키가 함께 들어옴)
+    """
+    mission_obj = safe_json_load(mission_summary_json) or {}
+    mission_obj.setdefault("category", category)
+    cat = category_policy(POLICY, category)
+    pre = prepare_photos(category, photo_paths, plan, mission_obj, photo_labels)
+
+    if pre.shortcut is not None:
+        photo_obj = pre.shortcut
+        grade_obj = score_mission(mission_obj, photo_obj, POLICY)
+        if on_partial is not None:
+            on_partial({**photo_obj, **grade_obj})
+    else:
+        text = fused_prompt_text(category, mission_obj, pre.mode, pre.change_metrics)
+        messages = prompt_messages(FUSED_SYSTEM_PROMPT, photo_message(text, pre.paths, settings=pre.settings))
+        obj, out = complete_json(
+            llm, messages, FUSED_SCHEMA, "fused", on_partial, PHOTO_LIST_KEYS + GRADE_LIST_KEYS, ("completion_percent",)
+        )
+        if not isinstance(obj, dict):
+            obj = {"_raw": out}
+
+        photo_obj = {k: obj[k] for k in _PHOTO_KEYS if k in obj}
+        photo_obj.setdefault("mode", pre.mode)
+        photo_obj.setdefault("observations", [])
+        photo_obj.setdefault("notable_changes", [])
+        photo_obj.setdefault("caveats", [])
+        if pre.change_metrics:
+            photo_obj["change_metrics"] = pre.change_metrics
+        pre.finish(photo_obj)
+
+        if GRADE_MODE == "rules":
+            grade_obj = score_mission(mission_obj, photo_obj, POLICY)
+        else:
+            grade_obj = {k: obj[k] for k in _GRADE_KEYS if k in obj}
+            if "_raw" in obj:
+                grade_obj["_raw"] = obj["_raw"]
+            grade_obj = finalize_grade(grade_obj, cat)
+
+    grade_obj["pipeline"] = "fused"
+    return json.dumps(photo_obj, ensure_ascii=False), json.dumps(grade_obj, ensure_ascii=False)
+
+
+# =========================================================
+# 결과 캐시 키 (UI / 배치 공용)
+# =========================================================
+def _pipeline_tag(pipeline: Optional[str]) -> str:
+    pipeline = pipeline or PIPELINE_MODE
+    return f"{pipeline}:{FUSED_PROMPT_VERSION}" if pipeline == "fused" else pipeline
+
+
+def _budget_tag(plan: Optional[BudgetPlan]) -> str:
+    """
+    예산 때문에 줄여서 낸 결과는 정상 결과와 다른 키로 (예산이 풀리면 다시 정상 분석).
+    plan은 작업을 제출할 때 정한 값을 넘길 것 — 키를 만들 때마다 다시 계산하면 방금 끝난 작업이 쓴 토큰 때문에
+    단계가 바뀌어 그 결과를 못 찾고 같은 분석을 또 제출한다
+    """
+    plan = plan if plan is not None else budget_plan()
+    if not plan.degraded:
+        return ""
+    return f"budget-{plan.level}-n{plan.max_photos}-e{plan.max_edge}"
+
+
+def photo_cache_key(
+    category: str,
+    mission_json: str,
+    photo_paths: List[str],
+    pipeline: Optional[str] = None,
+    plan: Optional[BudgetPlan] = None,
+    photo_labels: Optional[List[str]] = None,
+) -> str:
+    return result_key(
+        "photo",
+        category,
+        mission_json,
+        photo_paths,
+        PHOTO_PROMPT_VERSION,
+        PrepSettings.from_env().tag(),
+        PHOTO_ANALYSIS_MODE,
+        "change" if PHOTO_CHANGE_DETECTION else "",
+        selection_tag(photo_labels or photo_paths),
+        _pipeline_tag(pipeline),
+        _budget_tag(plan),
+    )
+
+
+def grade_cache_key(
+    category: str,
+    mission_json: str,
+    photo_paths: List[str],
+    photo_json: str,
+    pipeline: Optional[str] = None,
+    plan: Optional[BudgetPlan] = None,
+) -> str:
+    if GRADE_MODE != "rules" and plan is None:
+        plan = budget_plan()
+    return result_key(
+        "grade",
+        category,
+        mission_json,
+        photo_paths,
+        GRADE_PROMPT_VERSION,
+        photo_json,
+        GRADE_MODE,
+        policy_version(POLICY),
+        _pipeline_tag(pipeline),
+        # 예산 초과로 로컬 채점한 결과는 모델 채점 결과와 섞이지 않게
+        "budget-local" if GRADE_MODE != "rules" and plan.local_grading else "",
+    )
+
+
+def cached_fused(
+    llm: ChatLike,
+    category: str,
+    mission_json: str,
+    photo_paths: List[str],
+    cache: ResultCache,
+    on_partial: Optional[PartialCallback] = None,
+    plan: Optional[BudgetPlan] = None,
+    photo_labels: Optional[List[str]] = None,
+) -> Tuple[str, str, bool]:
+    """
+    fused 결과를 사진 분석 키 / 판정 키에 나눠 저장 → STEP 4, 5가 같은 결과를 캐시에서 읽는다.
+    plan: 두 키와 분석에 같이 쓸 예산 단계 (없으면 지금 사용량으로 한 번 계산)
+    반환: (사진 분석 JSON, 판정 JSON, 모델/로컬 단계를 새로 실행했는지)
+    """
+    plan = plan if plan is not None else budget_plan()
+    photo_key = photo_cache_key(category, mission_json, photo_paths, "fused", plan, photo_labels)
+    photo_json = cache.get(photo_key)
+    if photo_json is not None:
+        result_json = cache.get(grade_cache_key(category, mission_json, photo_paths, photo_json, "fused", plan))
+        if result_json is not None:
+            return photo_json, result_json, False
+
+    photo_json, result_json = judge_fused(llm, category, mission_json, photo_paths, on_partial, plan, photo_labels)
+    cache.put(photo_key, photo_json)
+    cache.put(grade_cache_key(category, mission_json, photo_paths, photo_json, "fused", plan), result_json)
+    return photo_json, result_json, True
+
+
+# =========================================================
+# 미션 1건 전체 판정 (missionGet → photoGet → missionComplete, fused면 missionGet → judge_fused)
+# =========================================================
+@traced("judge_mission")
+def judge_mission(
+    llm: ChatLike,
+    category: str,
+    details: str,
+    photo_paths: List[str],
+    cache: Optional[ResultCache] = None,
+    pipeline: Optional[str] = None,
+) -> Dict[str, Any]:
+    cache = cache if cache is not None else ResultCache()
+    pipeline = pipeline or PIPELINE_MODE
+
+    mission_json = mission_get(llm, category, details, POLICY_TEXT)
+    # 사진 분석/판정 키와 실행이 같은 예산 단계를 보도록 한 번만 계산
+    plan = budget_plan()
+
+    if pipeline == "fused":
+        photo_json, result_json, _ = cached_fused(llm, category, mission_json, photo_paths, cache, plan=plan)
+        return {
+            "mission": safe_json_load(mission_json),
+            "photo_analysis": safe_json_load(photo_json),
+            "result": safe_json_load(result_json),
+        }
+
+    key = photo_cache_key(category, mission_json, photo_paths, pipeline, plan)
+    photo_json = cache.get(key)
+    if photo_json is None:
+        photo_json = photo_get(llm, category, mission_json, photo_paths, plan=plan)
+        cache.put(key, photo_json)
+
+    key = grade_cache_key(category, mission_json, photo_paths, photo_json, pipeline, plan)
+    result_json = cache.get(key)
+    if result_json is None:
+        result_json = mission_complete(llm, mission_json, photo_json, plan=plan)
+        cache.put(key, result_json)
+
+    return {
+        "mission": safe_json_load(mission_json),
+        "photo_analysis": safe_json_load(photo_json),
+        "result": safe_json_load(result_json),
+    }
@@ -0,0 +1,100 @@
+import os
+import hmac
+import time
+import hashlib
+import threading
+from typing import Dict, Optional, Protocol
+
+import openai
+
+from llm_client import shared_http_clients
+
+
+# =========================================================
+# API 키 검증 캐시 (프로세스 전체 공유)
+# - 키 원문 대신 솔트 해시(HMAC-SHA256)를 키로 사용, 솔트는 프로세스마다 새로 생성
+# - 최근에 확인된 키는 TTL 동안 호출 없이 통과
+# - 캐시 미스일 때도 채팅 완성(ping) 대신 가벼운 모델 조회 API로 확인
+# =========================================================
+KEY_VALIDATION_TTL_S = float(os.getenv("KEY_VALIDATION_TTL_S", "3600"))
+
+_SALT = os.urandom(16)
+
+
+def key_fingerprint(api_key: str) -> str:
+    return hmac.new(_SALT, api_key.strip().encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class KeyValidator(Protocol):
+    def check(self, api_key: str) -> bool:
+        """키가 유효하면 True, 인증 실패면 False. 네트워크 오류 등은 예외."""
+        ...
+
+
+class OpenAIKeyValidator:
+    """GET /v1/models/{model} 로 확인 (토큰 사용 없음, 보통 수십 ms)"""
+
+    def __init__(self, model_name: str = "gpt-4o-mini", base_url: Optional[str] = None, timeout: float = 10.0):
+        self.model_name = model_name
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def check(self, api_key: str) -> bool:
+        http_client, _ = shared_http_clients()
+        client = openai.OpenAI(
+            api_key=api_key,
+            base_url=self.base_url,
+            http_client=http_client,
+            max_retries=0,
+            timeout=self.timeout,
+        )
+        try:
+            client.models.retrieve(self.model_name)
+        except (openai.AuthenticationError, openai.PermissionDeniedError):
+            return False
+        except openai.NotFoundError:
+            # 키는 유효하지만 모델 조회 권한/이름 문제 → 목록 조회로 한 번 더
+            client.models.list()
+        return True
+
+
+class KeyValidationCache:
+    def __init__(self, ttl: float = KEY_VALIDATION_TTL_S):
+        self.ttl = ttl
+        self._valid_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def is_fresh(self, api_key: str) -> bool:
+        fp = key_fingerprint(api_key)
+        with self._lock:
+            until = self._valid_until.get(fp)
+            if until is None:
+                return False
+            if until < time.monotonic():
+                del self._valid_until[fp]
+                return False
+            return True
+
+    def mark_valid(self, api_key: str) -> None:
+        with self._lock:
+            self._valid_until[key_fingerprint(api_key)] = time.monotonic() + self.ttl
+
+    def forget(self, api_key: str) -> None:
+        with self._lock:
+            self._valid_until.pop(key_fingerprint(api_key), None)
+
+    def validate(self, api_key: str, validator: KeyValidator) -> bool:
+        # 성공만 캐시 (잘못된 키는 매번 확인 → 키를 고친 뒤 바로 통과)
+        if self.is_fresh(api_key):
+            return True
+        ok = validator.check(api_key)
+        if ok:
+            self.mark_valid(api_key)
+        return ok
+
+
+_cache = KeyValidationCache()
+
+
+def validate_api_key(api_key: str, validator: Optional[KeyValidator] = None) -> bool:
+    return _cache.validate(api_key, validator or OpenAIKeyValidator())
@@ -0,0 +1,363 @@
+import os
+import time
+import queue
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+
+from token_usage import current_scope, record
+
+
+# =========================================================
+# 비동기 LLM 클라이언트
+# - build_llm으로 만든 chat model을 감싸서 모든 호출을 하나의 백그라운드 이벤트 루프에서 실행
+# - 공유 HTTP 커넥션 풀 (프로세스 전체에서 httpx 클라이언트 1쌍)
+# - 429/5xx/타임아웃은 지수 백오프 + 지터로 재시도 (Retry-After 헤더 우선)
+# - 분당 요청수(RPM) / 분당 토큰수(TPM) 토큰 버킷
+# - 우선순위 대기열: 화면(interactive) 호출이 배치(batch) 호출보다 먼저 나간다
+# - 응답의 토큰 사용량(입력/출력/캐시)을 호출한 쪽의 usage_scope로 기록 (token_usage)
+#
+# 동기 코드(Streamlit, 스레드 풀)에서는 client.invoke(...)를 그대로 쓰면 된다.
+# =========================================================
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+LLM_RPM = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "200000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "90"))
+
+# 이미지 1장당 대략적인 입력 토큰 (축소된 사진 기준 추정치)
+_IMAGE_TOKENS = 800
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMCallError(Exception):
+    """재시도 후에도 실패한 LLM 호출. kind: rate_limit / server / timeout / network / client"""
+
+    def __init__(self, kind: str, attempts: int, cause: BaseException):
+        self.kind = kind
+        self.attempts = attempts
+        self.cause = cause
+        super().__init__(f"LLM 호출 실패({kind}, {attempts}회 시도): {type(cause).__name__}: {cause}")
+
+
+# ---------- 공유 HTTP 커넥션 풀 ----------
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60)
+_http_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+
+
+def shared_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    ChatOpenAI(http_client=..., http_async_client=...)에 넘길 공유 클라이언트.
+    비동기 클라이언트는 아래 백그라운드 루프에서만 사용된다.
+    """
+    global _http_client, _http_async_client
+    with _http_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=_HTTP_LIMITS, timeout=LLM_TIMEOUT_S)
+            _http_async_client = httpx.AsyncClient(limits=_HTTP_LIMITS, timeout=LLM_TIMEOUT_S)
+        return _http_client, _http_async_client
+
+
+# ---------- 백그라운드 이벤트 루프 (프로세스당 1개) ----------
+_loop_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            t = threading.Thread(target=_loop.run_forever, name="llm-client-loop", daemon=True)
+            t.start()
+        return _loop
+
+
+# ---------- 토큰 버킷 ----------
+class TokenBucket:
+    """분당 rate_per_min 만큼 연속적으로 채워지는 버킷. capacity 기본값 = 1분치."""
+
+    def __init__(self, rate_per_min: float, capacity: Optional[float] = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float) -> float:
+        """n개를 지금 꺼낼 수 있으면 0, 아니면 기다려야 하는 초."""
+        self._refill()
+        n = min(n, self.capacity)  # 용량보다 큰 요청은 가득 찼을 때 통과
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+    def take(self, n: float) -> None:
+        self._refill()
+        self.tokens -= min(n, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """추정치와 실제 사용량 차이 보정 (delta>0 이면 더 씀)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+# ---------- 우선순위 스케줄러 ----------
+class _Scheduler:
+    """
+    (priority, 도착순) 힙에서 맨 앞 요청부터 RPM/TPM/동시 실행 수가 허락할 때 통과시킨다.
+    맨 앞이 막히면 뒤 요청도 기다린다 (배치가 화면 호출을 추월하지 못하게).
+    루프 스레드에서만 사용.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int):
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.heap: List[Tuple[int, int, float, asyncio.Future]] = []
+        self.seq = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, priority: int, tokens: float) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.heap, (priority, next(self.seq), tokens, fut))
+        self._pump()
+        await fut
+
+    def release(self) -> None:
+        self.running -= 1
+        self._pump()
+
+    def _pump(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        while self.heap and self.running < self.max_concurrency:
+            priority, _, tokens, fut = self.heap[0]
+            if fut.cancelled():
+                heapq.heappop(self.heap)
+                continue
+            wait_s = max(self.rpm.wait_time(1), self.tpm.wait_time(tokens))
+            if wait_s > 0:
+                self.timer = asyncio.get_running_loop().call_later(wait_s, self._pump)
+                return
+            heapq.heappop(self.heap)
+            self.rpm.take(1)
+            self.tpm.take(tokens)
+            self.running += 1
+            fut.set_result(None)
+
+
+# ---------- 에러 분류 ----------
+def _status_of(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(exc: BaseException) -> Tuple[str, bool]:
+    """(종류, 재시도 가능 여부)"""
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout", True
+    status = _status_of(exc)
+    if status is not None:
+        if status == 429:
+            return "rate_limit", True
+        if status >= 500:
+            return "server", True
+        return "client", status in _RETRYABLE_STATUS
+    name = type(exc).__name__
+    if "Timeout" in name:
+        return "timeout", True
+    if isinstance(exc, (httpx.TransportError, ConnectionError)) or "Connection" in name:
+        return "network", True
+    return "client", False
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 20.0) -> float:
+    """full jitter: [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def estimate_tokens(messages: Any, max_output: int = 1024) -> int:
+    """요청 전 TPM 차감용 대략치 (한글 기준 약 2글자 = 1토큰)"""
+    chars, images = 0, 0
+    items = messages if isinstance(messages, list) else [messages]
+    for m in items:
+        content = m.content if isinstance(m, BaseMessage) else m
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content if isinstance(content, list) else []:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                images += 1
+            elif isinstance(part, dict):
+                chars += len(str(part.get("text", "")))
+    return chars // 2 + images * _IMAGE_TOKENS + max_output
+
+
+class LLMClient:
+    """
+    chat model 래퍼. judge_engine의 함수들은 llm.invoke(...)만 쓰므로 그대로 넘겨도 된다.
+    같은 chat model/설정을 쓰는 클라이언트끼리 스케줄러를 공유하려면 with_priority()로 파생.
+    """
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        rpm: int = LLM_RPM,
+        tpm: int = LLM_TPM,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        timeout: float = LLM_TIMEOUT_S,
+        priority: int = PRIORITY_INTERACTIVE,
+        _scheduler: Optional[_Scheduler] = None,
+    ):
+        self.llm = llm
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.priority = priority
+        self.loop = _background_loop()
+        self.scheduler = _scheduler or _Scheduler(rpm, tpm, max_concurrency)
+
+    def with_priority(self, priority: int) -> "LLMClient":
+        return LLMClient(
+            self.llm,
+            max_retries=self.max_retries,
+            timeout=self.timeout,
+            priority=priority,
+            _scheduler=self.scheduler,
+        )
+
+    @property
+    def model_name(self) -> str:
+        # json_mode()로 감싼 경우 bound 안쪽 모델 이름
+        llm = getattr(self.llm, "bound", self.llm)
+        return str(getattr(llm, "model_name", "") or "")
+
+    async def _call(self, messages: Any, priority: int, scope: tuple = ("", "")) -> Any:
+        est = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(priority, est)
+            try:
+                resp = await asyncio.wait_for(self.llm.ainvoke(messages), timeout=self.timeout)
+            except Exception as e:
+                self.scheduler.release()
+                kind, retryable = classify_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise LLMCallError(kind, attempt + 1, e) from e
+                delay = _retry_after(e) if kind == "rate_limit" else None
+                await asyncio.sleep(delay if delay is not None else backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            usage = getattr(resp, "usage_metadata", None) or {}
+            if usage.get("total_tokens"):
+                self.scheduler.tpm.adjust(usage["total_tokens"] - est)
+            self.scheduler.release()
+            record(usage, self.model_name, scope)
+            return resp
+
+    async def _astream(
+        self, messages: Any, priority: int, out: "queue.Queue[Any]", scope: tuple = ("", "")
+    ) -> None:
+        """청크를 out 큐로 보낸다. 첫 청크가 나오기 전의 실패만 재시도 (이미 보여준 내용은 되돌릴 수 없음)"""
+        est = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(priority, est)
+            started = False
+            try:
+                stream = self.llm.astream(messages).__aiter__()
+                while True:
+                    try:
+                        # timeout은 청크 사이 최대 대기 시간으로 적용
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    usage = getattr(chunk, "usage_metadata", None) or {}
+                    if usage.get("total_tokens"):
+                        self.scheduler.tpm.adjust(usage["total_tokens"] - est)
+                        record(usage, self.model_name, scope)
+                    out.put(chunk)
+            except Exception as e:
+                self.scheduler.release()
+                kind, retryable = classify_error(e)
+                if started or not retryable or attempt >= self.max_retries:
+                    raise LLMCallError(kind, attempt + 1, e) from e
+                delay = _retry_after(e) if kind == "rate_limit" else None
+                await asyncio.sleep(delay if delay is not None else backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            self.scheduler.release()
+            return
+
+    def stream(self, messages: Any, priority: Optional[int] = None) -> Iterator[Any]:
+        """동기 제너레이터. 청크(AIMessageChunk)를 도착하는 대로 돌려준다."""
+        p = self.priority if priority is None else priority
+        out: "queue.Queue[Any]" = queue.Queue()
+        done = object()
+        scope = current_scope()
+
+        async def _run() -> None:
+            try:
+                await self._astream(messages, p, out, scope)
+                out.put(done)
+            except BaseException as e:
+                out.put(e)
+
+        asyncio.run_coroutine_threadsafe(_run(), self.loop)
+        while True:
+            item = out.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def submit(self, messages: Any, priority: Optional[int] = None) -> Future:
+        p = self.priority if priority is None else priority
+        # 백그라운드 루프에서는 호출한 스레드의 contextvars가 안 보이므로 스코프를 여기서 잡아 넘김
+        return asyncio.run_coroutine_threadsafe(self._call(messages, p, current_scope()), self.loop)
+
+    async def ainvoke(self, messages: Any, priority: Optional[int] = None) -> Any:
+        return await asyncio.wrap_future(self.submit(messages, priority))
+
+    def invoke(self, messages: Any, priority: Optional[int] = None) -> Any:
+        return self.submit(messages, priority).result()
+
+
+ChatLike = Union[BaseChatModel, LLMClient]
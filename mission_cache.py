@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import math
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+
+# =========================================================
+# 미션 템플릿 캐시 (missionGet 결과 재사용)
+# - 버킷 = (카테고리, 정책 버전 policy.policy_version): 정책이 바뀌면 예전 체크리스트는 자동으로 안 쓰임
+# - 1차: 정규화한 세부사항 텍스트(공백 제거)의 해시가 같으면 그대로 사용
+# - 2차: 글자 2~3-gram TF-IDF 코사인 유사도가 기준 이상이고, 아래가 모두 같을 때만 사용
+#   숫자(페이지/개수 등) / 내용 낱말(서로의 낱말이 상대 문장에 다 들어 있음) / 부정 표현(않/말고/금지 등)
+#   → "방 청소"와 "거실 청소", 항목이 하나 더 붙은 미션, "~하지 않기"는 다른 미션으로 본다
+# - 전체 항목 수 기준 LRU, 디스크(.cache/mission_templates.json)에 저장해서 재시작 후에도 유지
+# =========================================================
+TEMPLATE_PATH = os.getenv("MISSION_TEMPLATE_PATH", os.path.join(".cache", "mission_templates.json"))
+TEMPLATE_MAX_ENTRIES = int(os.getenv("MISSION_TEMPLATE_MAX", "500"))
+SIMILARITY_MIN = float(os.getenv("MISSION_SIMILARITY_MIN", "0.8"))
+
+_NGRAMS = (2, 3)
+_HANGUL = re.compile(r"[가-힣]")
+# 내용 낱말에서 빼는 연결 표현
+_FILLERS = frozenset({"하고", "하기", "하지", "해서", "하면", "그리고", "및", "또는"})
+# 낱말 끝 조사 ("방을" → "방")
+_PARTICLE = re.compile(r"(?<=[가-힣])(?:에서|으로|을|를|은|는|이|가|도|에|로|와|과|랑)$")
+_NEGATION = re.compile(r"않|금지|말고|말기|말아|지\s*마|(?:^|\s)(?:안|못)(?=\s|$)|없이")
+
+
+def normalize_details(text: str) -> str:
+    """대소문자/전각/공백/문장부호 차이를 없앤 비교용 문자열"""
+    s = unicodedata.normalize("NFKC", text or "").lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    return " ".join(s.split())
+
+
+def _numbers(norm: str) -> Tuple[str, ...]:
+    return tuple(re.findall(r"\d+", norm))
+
+
+def _compact(norm: str) -> str:
+    # 한국어는 띄어쓰기가 제각각이라 ("방 청소" / "방청소") 비교할 때는 공백을 뺀다
+    return norm.replace(" ", "")
+
+
+def _content_words(norm: str) -> FrozenSet[str]:
+    # 한국어는 조사/어미가 붙으므로 ("청소하고", "장난감을") 앞 두 글자만
+    words = set()
+    for token in norm.split():
+        if token in _FILLERS:
+            continue
+        if _HANGUL.match(token):
+            token = _PARTICLE.sub("", token)[:2]
+        words.add(token)
+    return frozenset(words)
+
+
+def _negations(norm: str) -> int:
+    return len(_NEGATION.findall(norm))
+
+
+def same_mission(a: str, b: str) -> bool:
+    """
+    정규화한 두 세부사항이 같은 체크리스트를 써도 되는 미션인지 (유사도와 별개의 필수 조건).
+    숫자와 부정 표현 수가 같고, 한쪽의 내용 낱말이 모두 다른 쪽 문장(공백 제거)에 들어 있어야 한다
+    """
+    if _numbers(a) != _numbers(b) or _negations(a) != _negations(b):
+        return False
+    ca, cb = _compact(a), _compact(b)
+    return all(w in cb for w in _content_words(a)) and all(w in ca for w in _content_words(b))
+
+
+def _ngrams(norm: str) -> Counter:
+    s = f" {_compact(norm)} "
+    grams: Counter = Counter()
+    for n in _NGRAMS:
+        grams.update(s[i:i + n] for i in range(len(s) - n + 1))
+    return grams
+
+
+def _tfidf(grams: Counter, idf: Dict[str, float]) -> Dict[str, float]:
+    vec = {g: c * idf.get(g, 1.0) for g, c in grams.items()}
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {g: v / norm for g, v in vec.items()}
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(g, 0.0) for g, v in a.items())
+
+
+class MissionTemplateCache:
+    def __init__(
+        self,
+        path: Optional[str] = TEMPLATE_PATH,
+        max_entries: int = TEMPLATE_MAX_ENTRIES,
+        similarity_min: float = SIMILARITY_MIN,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.similarity_min = similarity_min
+        # 키: "버킷|정규화 텍스트 해시" → {"bucket", "norm", "mission"}
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def _bucket(category: str, version: str) -> str:
+        return f"{category}|{version}"
+
+    @staticmethod
+    def _key(bucket: str, norm: str) -> str:
+        return bucket + "|" + hashlib.sha256(_compact(norm).encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return
+        for row in rows[-self.max_entries:]:
+            if isinstance(row, dict) and {"bucket", "norm", "mission"} <= set(row):
+                self._entries[self._key(row["bucket"], row["norm"])] = row
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        d = os.path.dirname(self.path) or "."
+        os.makedirs(d, exist_ok=True)
+        # LRU 순서(오래된 것 → 최근) 그대로 저장
+        fd, tmp = tempfile.mkstemp(dir=d, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(list(self._entries.values()), f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def lookup(self, category: str, details: str, version: str) -> Optional[Tuple[Dict[str, Any], str, float]]:
+        """(저장된 미션 dict, "exact"|"similar", 유사도) 또는 None. version = policy.policy_version(정책)"""
+        bucket = self._bucket(category, version)
+        norm = normalize_details(details)
+        if not norm:
+            return None
+
+        with self._lock:
+            key = self._key(bucket, norm)
+            row = self._entries.get(key)
+            if row is not None:
+                self._entries.move_to_end(key)
+                return dict(row["mission"]), "exact", 1.0
+
+            candidates = [(k, r) for k, r in self._entries.items() if r["bucket"] == bucket]
+            if not candidates:
+                return None
+
+            # IDF는 같은 버킷 문서 + 질의로 계산 (버킷이 작아서 매번 계산해도 수 ms)
+            docs = [_ngrams(r["norm"]) for _, r in candidates]
+            query = _ngrams(norm)
+            df: Counter = Counter()
+            for grams in docs + [query]:
+                df.update(grams.keys())
+            n = len(docs) + 1
+            idf = {g: math.log((1 + n) / (1 + c)) + 1.0 for g, c in df.items()}
+
+            qv = _tfidf(query, idf)
+            best: Optional[Tuple[float, str]] = None
+            for (k, r), grams in zip(candidates, docs):
+                if not same_mission(norm, r["norm"]):
+                    continue  # "3페이지" vs "5페이지", "방" vs "거실", 항목 추가, "~하지 않기"는 다른 미션
+                score = _cosine(qv, _tfidf(grams, idf))
+                if best is None or score > best[0]:
+                    best = (score, k)
+
+            if best is None or best[0] < self.similarity_min:
+                return None
+            self._entries.move_to_end(best[1])
+            return dict(self._entries[best[1]]["mission"]), "similar", round(best[0], 3)
+
+    def put(self, category: str, details: str, version: str, mission: Dict[str, Any]) -> None:
+        bucket = self._bucket(category, version)
+        norm = normalize_details(details)
+        if not norm:
+            return
+        with self._lock:
+            key = self._key(bucket, norm)
+            self._entries[key] = {"bucket": bucket, "norm": norm, "mission": mission}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_templates: Optional[MissionTemplateCache] = None
+_templates_lock = threading.Lock()
+
+
+def get_templates() -> MissionTemplateCache:
+    global _templates
+    with _templates_lock:
+        if _templates is None:
+            _templates = MissionTemplateCache()
+        return _templates
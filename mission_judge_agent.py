@@ -1,394 +1,196 @@
 import os
+import html
 import json
-import base64
-from typing import List, Dict, Any
+import hashlib
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional
 
 import streamlit as st
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
-
-
-st.set_page_config(page_title="미션 인증 판정기", layout="centered")
-st.title("📸 미션 인증 확인")
-
-# ---------- session_state 초기화 ----------
-if "step" not in st.session_state:
-    st.session_state.step = 0  # 0=API, 1=미션입력, 2=미션확인, 3=사진추가, 4=사진요약, 5=최종판정
-
-if "api_key" not in st.session_state:
-    st.session_state.api_key = ""
-
-if "llm" not in st.session_state:
-    st.session_state.llm = None
-
-if "category" not in st.session_state:
-    st.session_state.category = "청소"
-
-if "details" not in st.session_state:
-    st.session_state.details = ""
-
-if "mission_obj" not in st.session_state:
-    st.session_state.mission_obj = None
-
-if "photo_paths" not in st.session_state:
-    st.session_state.photo_paths = []
-
-if "photo_obj" not in st.session_state:
-    st.session_state.photo_obj = None
-
-if "result_obj" not in st.session_state:
-    st.session_state.result_obj = None
-
-
-# ---------- 공통: 정책 ----------
-policy = """
-- 청소: before/after 2장 권장 (정확히 2장이면 비교모드)
-- 숙제: 결과 사진만으로 평가
-- 습관: 증거가 약하면 보수적 판정 + 부모 확인 권장
-- 통과 기준: 60%
-""".strip()
-
-
-# ---------- 공통: 사이드바(현재 입력 확인) ----------
-with st.sidebar:
-    st.subheader("현재 입력 상태")
-    st.write("STEP:", st.session_state.step)
-    st.write("카테고리:", st.session_state.category)
-    st.write("사진 수:", len(st.session_state.photo_paths))
-    if st.session_state.photo_paths:
-        st.caption("사진 목록")
-        for i, p in enumerate(st.session_state.photo_paths[:10], start=1):
-            st.caption(f"{i}. {p}")
+from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import tool
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+
+from image_prep import prepare_image
+from judge_engine import (
+    PIPELINE_MODE,
+    POLICY_TEXT,
+    safe_json_load,
+    mission_get,
+    photo_get,
+    mission_complete,
+    photo_cache_key,
+    grade_cache_key,
+)
+from job_queue import JOB_POLL_S, get_queue
+from key_validation import validate_api_key
+from llm_client import ChatLike
+from photo_change import change_summary_text
+from photo_hash import get_index, submission_warnings
+from photo_quality import screen_photo
+from resources import registry
+from result_cache import ResultCache
+from result_store import get_store, new_id
+from session_store import get_payloads, get_sessions, memory_gauge, memory_tier
+from token_usage import BudgetPlan, bind_session, budget_plan, get_ledger
+from tracing import STATS, span, start_metrics_server
+from upload_store import UPLOAD_TYPES, ingest
+
+MODEL_NAME = "gpt-4o-mini"
 
 
 # =========================================================
-# STEP 0) API 키 입력 + 검증
+# 공통 유틸 (UI 전용)
 # =========================================================
-if st.session_state.step == 0:
-    st.subheader("1) Gemini API Key 입력")
-
-    api_key = st.text_input("Gemini API Key", type="password", placeholder="AIzaSy...")
-    colA, colB = st.columns([1, 1])
-
-    with colA:
-        if st.button("API 키 확인", type="primary"):
-            if not api_key.strip():
-                st.error("API 키를 입력하세요.")
-            else:
-                try:
-                    # build_llm은 기존에 정의된 함수 사용
-                    llm = build_llm(api_key)
-
-                    # 실제 호출로 키 검증 (가벼운 ping)
-                    llm.invoke("ping")
-
-                    st.session_state.api_key = api_key
-                    st.session_state.llm = llm
-                    st.success("API 키 확인 완료")
-                    st.session_state.step = 1
-                    st.rerun()
-                except Exception:
-                    st.error("API 키를 다시 확인해주세요.")
-
-    with colB:
-        st.caption("API 키가 올바르지 않으면 다음 단계로 넘어가지 않습니다.")
-
-    st.stop()
-
-
-# =========================================================
-# STEP 1) 미션 입력
-# =========================================================
-if st.session_state.step == 1:
-    st.subheader("2) 미션 입력")
-
-    category = st.selectbox("미션 카테고리", ["청소", "숙제", "심부름", "습관"], index=["청소", "숙제", "심부름", "습관"].index(st.session_state.category))
-    details = st.text_area("미션 세부사항 (부모 입력)", height=140, value=st.session_state.details)
-
-    col1, col2 = st.columns([1, 1])
-
-    with col1:
-        if st.button("미션 요약 생성", type="primary"):
-            if not details.strip():
-                st.error("미션 세부사항을 입력해주세요.")
-            else:
-                with st.spinner("미션 요약 생성 중..."):
-                    mission_obj = mission_get(st.session_state.llm, category, details, policy)
-
-                st.session_state.category = category
-                st.session_state.details = details
-                st.session_state.mission_obj = mission_obj
-
-                # 저장 (JSON)
-                ensure_dir("outputs")
-                save_json("outputs/mission_summary.json", mission_obj)
-
-                st.session_state.step = 2
-                st.rerun()
-
-    with col2:
-        if st.button("초기화"):
-            st.session_state.category = "청소"
-            st.session_state.details = ""
-            st.session_state.mission_obj = None
-            st.session_state.photo_paths = []
-            st.session_state.photo_obj = None
-            st.session_state.result_obj = None
-            st.session_state.step = 1
-            st.rerun()
-
-    st.stop()
-
+def render_small_list(box, items: List[Any], color: str, empty_text: str) -> None:
+    # 작은 글씨 목록 (st.empty() 자리에 그려서 스트리밍 중에도 같은 자리를 갱신)
+    if items:
+        box.markdown(
+            f"<div style='font-size:12px; line-height:1.5; color:{color};'>"
+            + "<br>".join([f"- {html.escape(str(x))}" for x in items])
+            + "</div>",
+            unsafe_allow_html=True,
+        )
+    elif empty_text:
+        box.caption(empty_text)
+    else:
+        box.empty()
 
-# =========================================================
-# STEP 2) 미션 요약 확인 + 확인 버튼
-# =========================================================
-if st.session_state.step == 2:
-    st.subheader("[1] 미션 요약 (확인 후 다음 단계로 이동)")
 
-    mission_obj = st.session_state.mission_obj or {}
-    st.write("카테고리:", mission_obj.get("category", st.session_state.category))
+def format_bytes(n: int) -> str:
+    if abs(n) >= 1024 * 1024:
+        return f"{n / (1024 * 1024):.1f}MB"
+    return f"{n / 1024:.0f}KB"
 
-    st.write("체크리스트(입력한 세부사항에서 추출):")
-    checklist = mission_obj.get("checklist", [])
-    if checklist:
-        for c in checklist:
-            st.write("- " + str(c.get("item", "")))
-    else:
-        st.warning("체크리스트가 비어 있어요. 미션 세부사항을 더 구체적으로 적어보는 게 좋아요.")
 
-    st.write("입력한 세부사항 전체:")
-    st.info(st.session_state.details)
+def session_llm() -> ChatLike:
+    # 프로세스 공용 클라이언트 (키+모델당 1개, resources.registry). 라우터 설정이 있으면 모델 라우터
+    return registry.llm(st.session_state.api_key, MODEL_NAME)
 
-    col1, col2 = st.columns([1, 1])
 
-    with col1:
-        if st.button("이 내용으로 진행", type="primary"):
-            st.session_state.step = 3
-            st.rerun()
+def load_payload(name: str) -> Optional[str]:
+    # 큰 JSON(mission/photo/result)은 session_state에 핸들(name_ref)만 두고 공용 저장소에서 읽는다
+    return get_payloads().get(st.session_state.get(name + "_ref"))
 
-    with col2:
-        if st.button("미션 다시 수정"):
-            st.session_state.step = 1
-            st.rerun()
 
-    st.stop()
+def save_payload(name: str, text: Optional[str]) -> None:
+    st.session_state[name + "_ref"] = get_payloads().put(text) if text is not None else None
 
 
-# =========================================================
-# STEP 3) 사진 경로 1개씩 추가 + 목록 확인 + 확인 버튼
-# =========================================================
-if st.session_state.step == 3:
-    st.subheader("3) 사진 경로 추가")
+def photo_label(path: str) -> str:
+    # 업로드한 사진은 저장소 경로(sha256) 대신 올린 파일 이름으로 표시
+    return st.session_state.photo_names.get(path, path)
 
-    st.caption("사진은 한 번에 1개씩 추가하세요. 최대 10장까지 사용합니다.")
-    if st.session_state.category == "청소":
-        st.caption("청소는 before/after 2장을 권장합니다. (정확히 2장이면 전후 비교 모드)")
 
-    new_path = st.text_input("사진 경로", placeholder="/Users/.../before.jpg")
+def add_photo(path: str, name: str) -> Optional[str]:
+    """STEP 3 사진 추가 (품질 검사 → 중복 경고 기록 → 목록에 추가). 추가하지 못하면 그 이유"""
+    if path in st.session_state.photo_paths:
+        return "이미 추가된 사진이에요."
+    if len(st.session_state.photo_paths) >= 10:
+        return "최대 10장까지만 추가할 수 있어요."
+    with span("ui.step3.screen"):
+        report = screen_photo(path)
+    if not report.ok:
+        # 흐림/어두움/손상/너무 작음 등은 모델에 보내기 전에 바로 거절
+        return "이 사진은 사용할 수 없어요: " + " / ".join(report.problems)
+    # 같은 제출 안 / 과거 제출과 같은(거의 같은) 사진이면 경고를 남겨 둔다 (추가는 허용)
+    with span("ui.step3.duplicates"):
+        notes = submission_warnings(path, st.session_state.photo_paths, get_index())
+    st.session_state.photo_notes[path] = notes
+    st.session_state.photo_names[path] = name
+    st.session_state.photo_paths.append(path)
+    return None
 
-    col1, col2, col3 = st.columns([1, 1, 1])
 
-    with col1:
-        if st.button("사진 추가"):
-            if not new_path.strip():
-                st.error("경로를 입력해주세요.")
-            else:
-                if len(st.session_state.photo_paths) >= 10:
-                    st.error("최대 10장까지만 추가할 수 있어요.")
-                else:
-                    # 파일 존재 확인(가능한 경우)
-                    if not os.path.exists(new_path):
-                        st.error("해당 경로에 파일이 없습니다. 경로를 다시 확인해주세요.")
-                    else:
-                        st.session_state.photo_paths.append(new_path.strip())
-                        st.success("추가 완료")
-                        st.rerun()
+def current_mission_id() -> str:
+    # 결과 저장소 기록 단위. 보통 STEP 1에서 만들어지지만 없으면 여기서 생성
+    if not st.session_state.get("mission_id"):
+        st.session_state.mission_id = new_id()
+    return st.session_state.mission_id
 
-    with col2:
-        if st.button("마지막 사진 삭제"):
-            if st.session_state.photo_paths:
-                st.session_state.photo_paths.pop()
-                st.rerun()
 
-    with col3:
-        if st.button("사진 전체 초기화"):
-            st.session_state.photo_paths = []
+def step_plan(step: str, *inputs: Any) -> BudgetPlan:
+    """
+    STEP 4/5 캐시 키와 작업에 쓸 예산 단계. 입력이 같은 동안은 처음 정한 값을 유지한다
+    (작업이 쓴 토큰으로 다시 계산하면 끝난 뒤 rerun에서 키가 바뀌어 방금 받은 결과를 못 찾음)
+    """
+    sig = hashlib.sha256(json.dumps(inputs, ensure_ascii=False).encode("utf-8")).hexdigest()
+    saved = st.session_state.budget_plans.get(step)
+    if saved is None or saved[0] != sig:
+        saved = (sig, budget_plan(st.session_state.session_id))
+        st.session_state.budget_plans[step] = saved
+    return saved[1]
+
+
+def job_result(
+    kind: str,
+    key: str,
+    payload: Dict[str, Any],
+    label: str,
+    show_partial: Callable[[Dict[str, Any]], None],
+) -> Dict[str, Any]:
+    """
+    백그라운드 작업(job_queue) 제출 → 끝났으면 결과 dict 반환.
+    아직이면 상태 블록만 fragment로 JOB_POLL_S마다 다시 그리고(페이지 전체 rerun/스크립트 스레드 대기 없음),
+    작업이 끝나면 그때 페이지 전체를 다시 실행하므로 여기서는 반환하지 않는다.
+    작업은 스크립트 밖에서 돌기 때문에 다른 단계로 갔다 와도 이어서 보여 준다.
+    """
+    queue = get_queue()
+    job_id = st.session_state.jobs.get(key)
+    job = queue.get(job_id) if job_id else None
+    if job is None:
+        job = queue.submit(kind, payload, session_llm(), st.session_state.session_id, current_mission_id(), key)
+        st.session_state.jobs[key] = job.id
+    if job.status == "done":
+        return job.result
+
+    if job.status == "error":
+        st.error(f"{label} 실패: {job.error}")
+        if st.button("다시 시도", type="primary"):
+            st.session_state.jobs.pop(key, None)
             st.rerun()
-
-    st.markdown("### 현재 추가된 사진")
-    if not st.session_state.photo_paths:
-        st.warning("아직 사진이 없습니다.")
     else:
-        for i, p in enumerate(st.session_state.photo_paths, start=1):
-            st.write(f"{i}. {p}")
-
-    if st.button("사진 분석 진행", type="primary"):
-        if len(st.session_state.photo_paths) == 0:
-            st.error("사진을 최소 1장 추가해주세요.")
-        else:
-            st.session_state.step = 4
-            st.rerun()
-
+        @st.fragment(run_every=JOB_POLL_S)
+        def _status() -> None:
+            current = queue.get(job.id)
+            if current is None or not current.active:
+                # 끝남(완료/오류) → 결과를 그리도록 페이지 전체를 한 번 다시 실행
+                st.rerun()
+            show_partial(current.partial)
+            ahead = queue.position(current)
+            st.info(f"⏳ {label} 대기 중 (앞에 {ahead}건)" if ahead else f"⏳ {label} 중...")
+
+        _status()
+    if st.button("사진 단계로 돌아가기 (작업은 계속됩니다)"):
+        st.session_state.step = 3
+        st.rerun()
     st.stop()
 
 
-# =========================================================
-# STEP 4) 사진 분석 요약 (작은 글씨) + 확인 버튼
-# =========================================================
-if st.session_state.step == 4:
-    st.subheader("[2] 사진 분석 (확인 후 최종 판정)")
-
-    with st.spinner("사진 분석 중..."):
-        photo_obj = photo_get(
-            st.session_state.llm,
-            st.session_state.category,
-            st.session_state.mission_obj,
-            st.session_state.photo_paths
-        )
-        st.session_state.photo_obj = photo_obj
-
-        # 저장 (JSON)
-        ensure_dir("outputs")
-        save_json("outputs/photo_analysis.json", photo_obj)
-
-    # 작은 글씨 출력
-    observations = photo_obj.get("observations", [])
-    notable_changes = photo_obj.get("notable_changes", [])
-    caveats = photo_obj.get("caveats", [])
-
-    st.markdown("관찰 요약")
-    if observations:
-        st.markdown(
-            "<div style='font-size:12px; line-height:1.5; color:#444;'>"
-            + "<br>".join([f"- {st.escape_markdown(str(x))}" for x in observations])
-            + "</div>",
-            unsafe_allow_html=True
-        )
-    else:
-        st.caption("관찰 요약이 비어 있어요.")
-
-    st.markdown("전후 변화")
-    if notable_changes:
-        st.markdown(
-            "<div style='font-size:12px; line-height:1.5; color:#444;'>"
-            + "<br>".join([f"- {st.escape_markdown(str(x))}" for x in notable_changes])
-            + "</div>",
-            unsafe_allow_html=True
-        )
-    else:
-        st.caption("전후 변화 항목이 없어요. (청소+2장 조건이 아니거나 변화가 불명확할 수 있어요.)")
-
-    st.markdown("한계")
-    if caveats:
-        st.markdown(
-            "<div style='font-size:12px; line-height:1.5; color:#666;'>"
-            + "<br>".join([f"- {st.escape_markdown(str(x))}" for x in caveats])
-            + "</div>",
-            unsafe_allow_html=True
-        )
-    else:
-        st.caption("한계 항목이 없어요.")
-
-    col1, col2 = st.columns([1, 1])
-    with col1:
-        if st.button("최종 판정 보기", type="primary"):
-            st.session_state.step = 5
-            st.rerun()
-    with col2:
-        if st.button("사진 다시 추가/수정"):
-            st.session_state.step = 3
-            st.rerun()
-
-    st.stop()
+def session_agent_executor() -> AgentExecutor:
+    # agent 경로를 쓸 때만 처음 생성
+    return registry.agent_executor(st.session_state.api_key, MODEL_NAME, build_agent_executor)
 
 
 # =========================================================
-# STEP 5) 최종 판정 (한 섹션 / 아이콘 / 색)
+# LangChain Tools (판정 로직은 judge_engine, 여기서는 세션의 llm만 연결)
 # =========================================================
-if st.session_state.step == 5:
-    st.subheader("[3] 최종 판정")
-
-    with st.spinner("최종 판정 중..."):
-        result_obj = mission_complete(
-            st.session_state.llm,
-            st.session_state.mission_obj,
-            st.session_state.photo_obj
-        )
-        st.session_state.result_obj = result_obj
-
-        # 저장 (JSON)
-        ensure_dir("outputs")
-        save_json("outputs/final_grade.json", result_obj)
-
-    passed = bool(result_obj.get("pass", False))
-    percent = result_obj.get("completion_percent", 0)
-
-    # 한 섹션 구성
-    if passed:
-        st.success(f"🟢 통과 ({percent}%)")
-    else:
-        st.error(f"🔴 반려 ({percent}%)")
-
-    st.markdown("근거")
-    for r in result_obj.get("reason_summary", [])[:6]:
-        st.write("- " + str(r))
-
-    if not passed:
-        st.markdown("반려 사유 / 추가 요청")
-        missing = result_obj.get("missing_or_unclear", [])
-        if missing:
-            for m in missing[:6]:
-                st.write("- " + str(m))
-
-        req = result_obj.get("next_request_to_child", [])
-        if req:
-            st.markdown("추가로 요청할 증거")
-            for x in req[:6]:
-                st.write("- " + str(x))
-
-    st.success("판정 완료 및 JSON 저장 완료 (outputs/mission_summary.json, outputs/photo_analysis.json, outputs/final_grade.json)")
-
-    col1, col2 = st.columns([1, 1])
-    with col1:
-        if st.button("처음부터 다시"):
-            st.session_state.step = 0
-            st.session_state.api_key = ""
-            st.session_state.llm = None
-            st.session_state.category = "청소"
-            st.session_state.details = ""
-            st.session_state.mission_obj = None
-            st.session_state.photo_paths = []
-            st.session_state.photo_obj = None
-            st.session_state.result_obj = None
-            st.rerun()
-
-    with col2:
-        if st.button("사진 단계로 돌아가기"):
-            st.session_state.step = 3
-            st.rerun()
-}}
-
-주의:
-- 글씨/채점표시가 안 보이면 '판독 불가/불명확'이라고 적어라.
-- 개인정보/이름 추정 금지.
-""".strip()
-    }]
-
-    for i, p in enumerate(photo_paths, start=1):
-        content.append({"type": "text", "text": f"사진 {i} (path={p})"})
-        content.append({"type": "image_url", "image_url": {"url": image_to_data_url(p)}})
+@tool
+def missionGet(category: str, details: str, policy: str) -> str:
+    """
+    [1] 미션 요약 + 체크리스트 생성.
+    반환: JSON 문자열
+    """
+    return mission_get(session_llm(), category, details, policy)
 
-    msg = HumanMessage(content=content)
-    out = llm.invoke([msg]).content.strip()
-    obj = safe_json_load(out)
 
-    if isinstance(obj, dict):
-        obj.setdefault("mode", mode)
-        obj.setdefault("observations", [])
-        obj.setdefault("notable_changes", [])
-        obj.setdefault("caveats", [])
-    return json.dumps(obj, ensure_ascii=False)
+@tool
+def photoGet(category: str, mission_summary_json: str, photo_paths: List[str]) -> str:
+    """
+    [2] 사진 관찰 요약 / 전후 변화 / 한계.
+    반환: JSON 문자열
+    """
+    return photo_get(session_llm(), category, mission_summary_json, photo_paths)
 
 
 @tool
@@ -397,60 +199,7 @@ def missionComplete(mission_summary_json: str, photo_analysis_json: str) -> str:
     [3] 최종 판정(완수율/통과 여부).
     반환: JSON 문자열
     """
-    llm: ChatOpenAI = st.session_state["llm"]
-
-    mission_obj = safe_json_load(mission_summary_json)
-    photo_obj = safe_json_load(photo_analysis_json)
-
-    prompt = f"""
-너는 '미션 채점관'이다. 아래 데이터만 근거로 평가해라.
-
-[미션 정보]
-{json.dumps({
-  "category": mission_obj.get("category"),
-  "details_raw": mission_obj.get("details_raw"),
-  "mission_summary": mission_obj.get("mission_summary"),
-  "checklist": mission_obj.get("checklist", [])
-}, ensure_ascii=False)}
-
-[사진 분석]
-{json.dumps(photo_obj, ensure_ascii=False)}
-
-채점 규칙:
-- checklist 항목별로 달성=1 / 부분=0.5 / 미달=0
-- 완수율 = 평균 * 100
-- 60% 이상이면 통과(pass=true)
-- 확실하지 않으면 보수적으로(부분/미달) 판정
-- JSON만 출력
-
-스키마:
-{{
-  "completion_percent": number,
-  "pass": boolean,
-  "reason_summary": ["근거 3~6개"],
-  "missing_or_unclear": ["불명확/부족한 점 0~6개"],
-  "next_request_to_child": ["추가 요청 0~6개"]
-}}
-""".strip()
-
-    out = llm.invoke(prompt).content.strip()
-    obj = safe_json_load(out)
-    if not isinstance(obj, dict):
-        obj = {"_raw": out}
-
-    # 보정
-    try:
-        cp = float(obj.get("completion_percent", 0))
-    except Exception:
-        cp = 0.0
-    cp = max(0.0, min(100.0, cp))
-    obj["completion_percent"] = cp
-    obj["pass"] = bool(cp >= 60.0)
-
-    obj.setdefault("reason_summary", [])
-    obj.setdefault("missing_or_unclear", [])
-    obj.setdefault("next_request_to_child", [])
-    return json.dumps(obj, ensure_ascii=False)
+    return mission_complete(session_llm(), mission_summary_json, photo_analysis_json)
 
 
 # =========================================================
@@ -485,18 +234,38 @@ if "step" not in st.session_state:
 
 for k, v in {
     "api_key": "",
-    "llm": None,
-    "agent_executor": None,
     "category": "청소",
     "details": "",
-    "mission_json": None,
+    "mission_ref": None,
     "photo_paths": [],
-    "photo_json": None,
-    "result_json": None,
+    "photo_ref": None,
+    "result_ref": None,
+    "session_id": new_id(),
+    "mission_id": None,
+    "photo_notes": {},
+    "photo_names": {},
+    "uploader_key": 0,
+    "upload_messages": [],
+    "jobs": {},
+    "budget_plans": {},
 }.items():
     if k not in st.session_state:
         st.session_state[k] = v
 
+# 이번 실행(스크립트 스레드)의 모델 호출 토큰을 이 세션으로 기록 → 세션 예산 계산에 사용
+bind_session(st.session_state.session_id)
+# 마지막 실행 시각 + 이 세션이 쓰는 핸들 기록 (오래 조용한 세션의 값은 메모리에서 내림, session_store)
+get_sessions().touch(
+    st.session_state.session_id,
+    [st.session_state.mission_ref, st.session_state.photo_ref, st.session_state.result_ref],
+)
+if st.session_state.step >= 2 and load_payload("mission") is None:
+    # 저장소에서 지워진 값(캐시 정리 등)이면 미션 입력부터 다시
+    st.session_state.step = 1
+    st.warning("저장된 미션 요약을 찾을 수 없어 미션 입력 단계로 돌아왔어요.")
+# METRICS_PORT를 준 경우에만 /metrics 엔드포인트 (프로세스당 1번)
+start_metrics_server()
+
 # ---------- 사이드바 ----------
 with st.sidebar:
     st.subheader("현재 입력 상태")
@@ -506,7 +275,46 @@ with st.sidebar:
     if st.session_state.photo_paths:
         st.caption("사진 목록")
         for i, p in enumerate(st.session_state.photo_paths[:10], start=1):
-            st.caption(f"{i}. {p}")
+            st.caption(f"{i}. {photo_label(p)}")
+
+    usage = get_ledger().totals(session_id=st.session_state.session_id)
+    if usage["calls"]:
+        st.caption(
+            f"토큰: 입력 {usage['input']:,} (캐시 {usage['cached']:,}) / 출력 {usage['output']:,} · 호출 {usage['calls']}회"
+        )
+    plan = budget_plan(st.session_state.session_id)
+    if plan.degraded:
+        note = "채점은 로컬 규칙으로" if plan.local_grading else f"사진 최대 {plan.max_photos}장"
+        st.warning(f"토큰 예산 {plan.used_fraction * 100:.0f}% 사용 — 해상도를 낮추고 {note} 진행합니다.")
+
+    gauge = memory_gauge()
+    st.caption(
+        f"메모리: RSS {format_bytes(gauge['rss_bytes'])} · 공용 캐시 {format_bytes(gauge['lru_bytes'])}"
+        f"/{format_bytes(gauge['lru_max_bytes'])} · 활성 세션 {gauge['active_sessions']}"
+    )
+
+    # 이 세션의 구간별 소요 시간 (사이드바는 단계보다 먼저 그려지므로 직전 실행까지의 기록)
+    breakdown = STATS.session_breakdown(st.session_state.session_id)
+    if breakdown:
+        with st.expander("단계별 소요 시간"):
+            for row in breakdown[:15]:
+                err = f" · 오류 {row['errors']}" if row["errors"] else ""
+                st.caption(
+                    f"{row['stage']}: 최근 {row['last_ms']:.0f}ms · 평균 {row['avg_ms']:.0f}ms · "
+                    f"최대 {row['max_ms']:.0f}ms · {row['count']}회{err}"
+                )
+
+    # MODEL_ROUTER_CONFIG를 준 경우 백엔드별 상태 (같은 키를 쓰는 세션끼리 공유)
+    router = registry.router(st.session_state.api_key) if st.session_state.api_key else None
+    if router is not None:
+        with st.expander("모델 라우터"):
+            for h in router.health():
+                latency = f"{h['latency_ewma_s']:.2f}s" if h["latency_ewma_s"] is not None else "-"
+                state = "정상" if h["healthy"] else "제외 중"
+                st.caption(
+                    f"{h['backend']}: {state} · 지연 {latency} · 오류율 {h['error_ewma'] * 100:.0f}% · "
+                    f"{h['calls']}회 (실패 {h['errors']})"
+                )
 
 
 # =========================================================
@@ -524,12 +332,11 @@ if st.session_state.step == 0:
                 st.error("API 키를 입력하세요.")
             else:
                 try:
-                    llm = build_llm(api_key, model_name="gpt-4o-mini")
-                    llm.invoke("ping")  # 키 검증
-
-                    st.session_state.api_key = api_key
-                    st.session_state.llm = llm
-                    st.session_state.agent_executor = build_agent_executor(llm)
+                    # 키 검증: 최근 확인된 키는 바로 통과, 아니면 모델 조회 API로 가볍게 확인
+                    if not validate_api_key(api_key.strip()):
+                        raise ValueError("invalid api key")
+                    # llm/agent는 세션에 두지 않음 → session_llm() / session_agent_executor()
+                    st.session_state.api_key = api_key.strip()
 
                     st.success("API 키 확인 완료")
                     st.session_state.step = 1
@@ -562,7 +369,7 @@ if st.session_state.step == 1:
             if not details.strip():
                 st.error("미션 세부사항을 입력해주세요.")
             else:
-                with st.spinner("미션 요약 생성 중..."):
+                with st.spinner("미션 요약 생성 중..."), span("ui.step1"):
                     # LangChain tool 호출(직접) — agent로도 가능하지만 단계형이라 명확하게
                     mission_json = missionGet.invoke({
                         "category": category,
@@ -572,10 +379,13 @@ if st.session_state.step == 1:
 
                 st.session_state.category = category
                 st.session_state.details = details
-                st.session_state.mission_json = mission_json
+                save_payload("mission", mission_json)
 
-                ensure_dir("outputs")
-                save_json("outputs/mission_summary.json", safe_json_load(mission_json))
+                # 미션마다 새 ID, 결과는 세션/미션 ID로 저장소에 추가 (고정 파일 덮어쓰기 X)
+                st.session_state.mission_id = new_id()
+                get_store().append(
+                    st.session_state.session_id, st.session_state.mission_id, "mission", safe_json_load(mission_json)
+                )
 
                 st.session_state.step = 2
                 st.rerun()
@@ -584,10 +394,13 @@ if st.session_state.step == 1:
         if st.button("초기화"):
             st.session_state.category = "청소"
             st.session_state.details = ""
-            st.session_state.mission_json = None
+            st.session_state.mission_ref = None
+            st.session_state.mission_id = None
             st.session_state.photo_paths = []
-            st.session_state.photo_json = None
-            st.session_state.result_json = None
+            st.session_state.photo_notes = {}
+            st.session_state.photo_names = {}
+            st.session_state.photo_ref = None
+            st.session_state.result_ref = None
             st.session_state.step = 1
             st.rerun()
 
@@ -600,7 +413,7 @@ if st.session_state.step == 1:
 if st.session_state.step == 2:
     st.subheader("[1] 미션 요약 (확인 후 다음 단계로 이동)")
 
-    mission_obj = safe_json_load(st.session_state.mission_json or "{}")
+    mission_obj = safe_json_load(load_payload("mission") or "{}")
 
     st.write("카테고리:", mission_obj.get("category", st.session_state.category))
 
@@ -612,6 +425,27 @@ if st.session_state.step == 2:
     else:
         st.warning("체크리스트가 비어 있어요. 미션 세부사항을 더 구체적으로 적어보는 게 좋아요.")
 
+    match = mission_obj.get("template_match")
+    if match:
+        if match.get("kind") == "exact":
+            st.caption("이전에 만든 같은 미션의 체크리스트를 재사용했어요.")
+        else:
+            st.warning(
+                f"비슷한 미션(유사도 {match.get('score')})의 체크리스트를 재사용했어요: "
+                f"\"{match.get('details', '')}\" — 내용이 다르면 아래에서 새로 만들어 주세요."
+            )
+    # 템플릿을 보지 않고 모델로 다시 생성 (이 세부사항의 템플릿도 새 결과로 바뀜)
+    if st.button("체크리스트 새로 만들기"):
+        with st.spinner("미션 요약 다시 생성 중..."), span("ui.step2.refresh"):
+            mission_json = mission_get(
+                session_llm(), st.session_state.category, st.session_state.details, POLICY_TEXT, refresh=True
+            )
+        save_payload("mission", mission_json)
+        get_store().append(
+            st.session_state.session_id, current_mission_id(), "mission", safe_json_load(mission_json)
+        )
+        st.rerun()
+
     st.write("입력한 세부사항 전체:")
     st.info(st.session_state.details)
 
@@ -629,42 +463,68 @@ if st.session_state.step == 2:
 
 
 # =========================================================
-# STEP 3) 사진 경로 추가
+# STEP 3) 사진 추가 (업로드)
 # =========================================================
 if st.session_state.step == 3:
-    st.subheader("3) 사진 경로 추가")
+    st.subheader("3) 사진 추가")
 
-    st.caption("사진은 한 번에 1개씩 추가하세요. 최대 10장까지 사용합니다.")
+    st.caption("사진은 여러 장을 한 번에 올릴 수 있어요. 최대 10장까지 사용합니다.")
     if st.session_state.category == "청소":
         st.caption("청소는 before/after 2장을 권장합니다. (정확히 2장이면 전후 비교 모드)")
 
-    new_path = st.text_input("사진 경로", placeholder="/Users/.../before.jpg")
-
-    col1, col2, col3 = st.columns([1, 1, 1])
-    with col1:
+    uploads = st.file_uploader(
+        "사진 업로드",
+        type=list(UPLOAD_TYPES),
+        accept_multiple_files=True,
+        key=f"uploader_{st.session_state.uploader_key}",
+    )
+    if uploads:
+        messages = []
+        for up in uploads:
+            # 청크로 읽으면서 해시 + 저장 (같은 내용이면 기존 파일 재사용)
+            try:
+                with span("ui.step3.upload", bytes=up.size):
+                    stored = ingest(up, up.name)
+            except (OSError, ValueError) as e:
+                messages.append(("error", f"{up.name}: {e}"))
+                continue
+            error = add_photo(stored.path, up.name)
+            messages.append(("error", f"{up.name}: {error}") if error else ("success", f"{up.name} 추가 완료"))
+        # 처리한 파일은 위젯에서 비움 → 다음 실행에서 다시 저장하지 않고, 업로드 바이트도 메모리에서 놓아 줌
+        st.session_state.uploader_key += 1
+        st.session_state.upload_messages = messages
+        st.rerun()
+    for level, text in st.session_state.upload_messages:
+        (st.error if level == "error" else st.success)(text)
+    st.session_state.upload_messages = []
+
+    with st.expander("서버에 있는 파일 경로로 추가"):
+        new_path = st.text_input("사진 경로", placeholder="/Users/.../before.jpg")
         if st.button("사진 추가"):
             if not new_path.strip():
                 st.error("경로를 입력해주세요.")
+            elif not os.path.exists(new_path.strip()):
+                st.error("해당 경로에 파일이 없습니다. 경로를 다시 확인해주세요.")
             else:
-                if len(st.session_state.photo_paths) >= 10:
-                    st.error("최대 10장까지만 추가할 수 있어요.")
+                error = add_photo(new_path.strip(), new_path.strip())
+                if error:
+                    st.error(error)
                 else:
-                    if not os.path.exists(new_path):
-                        st.error("해당 경로에 파일이 없습니다. 경로를 다시 확인해주세요.")
-                    else:
-                        st.session_state.photo_paths.append(new_path.strip())
-                        st.success("추가 완료")
-                        st.rerun()
+                    st.success("추가 완료")
+                    st.rerun()
 
-    with col2:
+    col1, col2 = st.columns([1, 1])
+    with col1:
         if st.button("마지막 사진 삭제"):
             if st.session_state.photo_paths:
                 st.session_state.photo_paths.pop()
                 st.rerun()
 
-    with col3:
+    with col2:
         if st.button("사진 전체 초기화"):
             st.session_state.photo_paths = []
+            st.session_state.photo_notes = {}
+            st.session_state.photo_names = {}
             st.rerun()
 
     st.markdown("### 현재 추가된 사진")
@@ -672,7 +532,9 @@ if st.session_state.step == 3:
         st.warning("아직 사진이 없습니다.")
     else:
         for i, p in enumerate(st.session_state.photo_paths, start=1):
-            st.write(f"{i}. {p}")
+            st.write(f"{i}. {photo_label(p)}")
+            for note in st.session_state.photo_notes.get(p, []):
+                st.caption(f"⚠️ {note}")
 
     if st.button("사진 분석 진행", type="primary"):
         if len(st.session_state.photo_paths) == 0:
@@ -690,55 +552,88 @@ if st.session_state.step == 3:
 if st.session_state.step == 4:
     st.subheader("[2] 사진 분석 (확인 후 최종 판정)")
 
-    with st.spinner("사진 분석 중..."):
-        photo_json = photoGet.invoke({
-            "category": st.session_state.category,
-            "mission_summary_json": st.session_state.mission_json,
-            "photo_paths": st.session_state.photo_paths
-        })
-        st.session_state.photo_json = photo_json
-
-        ensure_dir("outputs")
-        save_json("outputs/photo_analysis.json", safe_json_load(photo_json))
-
-    photo_obj = safe_json_load(st.session_state.photo_json or "{}")
-
-    observations = photo_obj.get("observations", [])
-    notable_changes = photo_obj.get("notable_changes", [])
-    caveats = photo_obj.get("caveats", [])
+    # 입력(카테고리/미션/사진 내용/프롬프트 버전)이 같으면 캐시 결과 사용 → rerun마다 LLM 호출 안 함
+    cache = ResultCache(memory_tier())
+    mission_json = load_payload("mission")
+    plan = step_plan("photo", st.session_state.category, mission_json, st.session_state.photo_paths)
+    # 사진 선택의 체크리스트 관련도는 저장소 경로(sha256)가 아니라 올린 파일 이름으로
+    photo_labels = [photo_label(p) for p in st.session_state.photo_paths]
+    photo_key = photo_cache_key(
+        st.session_state.category,
+        mission_json,
+        st.session_state.photo_paths,
+        plan=plan,
+        photo_labels=photo_labels,
+    )
 
     st.markdown("관찰 요약")
-    if observations:
-        st.markdown(
-            "<div style='font-size:12px; line-height:1.5; color:#444;'>"
-            + "<br>".join([f"- {st.escape_markdown(str(x))}" for x in observations])
-            + "</div>",
-            unsafe_allow_html=True,
-        )
-    else:
-        st.caption("관찰 요약이 비어 있어요.")
-
+    obs_box = st.empty()
     st.markdown("전후변화")
-    if notable_changes:
-        st.markdown(
-            "<div style='font-size:12px; line-height:1.5; color:#444;'>"
-            + "<br>".join([f"- {st.escape_markdown(str(x))}" for x in notable_changes])
-            + "</div>",
-            unsafe_allow_html=True,
-        )
-    else:
-        st.caption("전후변화 항목이 없어요. (청소+2장 조건이 아니거나 변화가 불명확할 수 있어요.)")
-
+    chg_box = st.empty()
     st.markdown("한계")
-    if caveats:
-        st.markdown(
-            "<div style='font-size:12px; line-height:1.5; color:#666;'>"
-            + "<br>".join([f"- {st.escape_markdown(str(x))}" for x in caveats])
-            + "</div>",
-            unsafe_allow_html=True,
+    cav_box = st.empty()
+
+    def show_photo_sections(obj: Dict[str, Any], final: bool) -> None:
+        # 스트리밍 중(final=False)에는 빈 항목 안내문을 띄우지 않음
+        render_small_list(obs_box, obj.get("observations", []), "#444",
+                          "관찰 요약이 비어 있어요." if final else "")
+        render_small_list(chg_box, obj.get("notable_changes", []), "#444",
+                          "전후변화 항목이 없어요. (청소+2장 조건이 아니거나 변화가 불명확할 수 있어요.)" if final else "")
+        render_small_list(cav_box, obj.get("caveats", []), "#666",
+                          "한계 항목이 없어요." if final else "")
+
+    photo_json = cache.get(photo_key)
+    if photo_json is None:
+        # 분석은 백그라운드 작업으로 (fused면 판정까지 한 번에 → STEP 5는 같은 캐시에서 읽는다)
+        kind = "fused" if PIPELINE_MODE == "fused" else "photo"
+        result = job_result(
+            kind,
+            photo_key,
+            {
+                "category": st.session_state.category,
+                "mission_json": mission_json,
+                "photo_paths": st.session_state.photo_paths,
+                "budget": asdict(plan),
+                "photo_labels": photo_labels,
+            },
+            "사진 분석 및 판정" if kind == "fused" else "사진 분석",
+            lambda part: show_photo_sections(part, final=False),
         )
-    else:
-        st.caption("한계 항목이 없어요.")
+        photo_json = result["photo_json"]
+        cache.put(photo_key, photo_json)
+        if kind == "fused":
+            save_payload("result", result["result_json"])
+    save_payload("photo", photo_json)
+
+    photo_obj = safe_json_load(photo_json or "{}") or {}
+    show_photo_sections(photo_obj, final=True)
+
+    if photo_obj.get("reused_photos"):
+        nums = ", ".join(str(i) for i in photo_obj["reused_photos"])
+        st.caption(f"사진 {nums}은(는) 이전 분석 결과를 재사용했어요. (추가/변경된 사진만 새로 분석)")
+
+    if photo_obj.get("change_metrics"):
+        with st.expander("전후 변화 측정 (로컬)"):
+            st.caption(change_summary_text(photo_obj["change_metrics"]))
+
+    # 전처리 리포트 (사진별 절감 용량)
+    reports = []
+    for p in st.session_state.photo_paths:
+        try:
+            reports.append(prepare_image(p).report())
+        except OSError:
+            continue
+    if reports:
+        total_before = sum(r["original_bytes"] for r in reports)
+        total_after = sum(r["encoded_bytes"] for r in reports)
+        with st.expander(f"이미지 전처리: {format_bytes(total_before)} → {format_bytes(total_after)}"):
+            for i, r in enumerate(reports, start=1):
+                note = "" if r["processed"] else " (디코딩 실패, 원본 전송)"
+                st.caption(
+                    f"{i}. {os.path.basename(photo_label(r['path']))}: "
+                    f"{format_bytes(r['original_bytes'])} → {format_bytes(r['encoded_bytes'])} "
+                    f"({format_bytes(r['saved_bytes'])} 절감){note}"
+                )
 
     col1, col2 = st.columns([1, 1])
     with col1:
@@ -759,30 +654,56 @@ if st.session_state.step == 4:
 if st.session_state.step == 5:
     st.subheader("[3] 최종 판정")
 
-    with st.spinner("최종 판정 중..."):
-        result_json = missionComplete.invoke({
-            "mission_summary_json": st.session_state.mission_json,
-            "photo_analysis_json": st.session_state.photo_json
-        })
-        st.session_state.result_json = result_json
-
-        ensure_dir("outputs")
-        save_json("outputs/final_grade.json", safe_json_load(result_json))
+    cache = ResultCache(memory_tier())
+    mission_json = load_payload("mission")
+    photo_json = load_payload("photo")
+    if PIPELINE_MODE == "fused":
+        # fused는 STEP 4 작업이 판정까지 그 단계의 키로 저장해 둠
+        plan = step_plan("photo", st.session_state.category, mission_json, st.session_state.photo_paths)
+    else:
+        plan = step_plan("grade", mission_json, photo_json)
+    grade_key = grade_cache_key(
+        st.session_state.category,
+        mission_json,
+        st.session_state.photo_paths,
+        photo_json,
+        plan=plan,
+    )
+    verdict_box = st.empty()
+    st.markdown("근거")
+    reason_box = st.empty()
+
+    def show_reasons(reasons: List[Any]) -> None:
+        with reason_box.container():
+            for r in reasons[:6]:
+                st.write("- " + str(r))
+
+    result_json = cache.get(grade_key)
+    if result_json is None:
+        # 완수율/통과 여부는 보정(clamp, 정책의 통과 기준)이 끝난 최종값으로만 표시
+        result = job_result(
+            "grade",
+            grade_key,
+            {"mission_json": mission_json, "photo_json": photo_json, "budget": asdict(plan)},
+            "최종 판정",
+            lambda part: show_reasons(part.get("reason_summary", [])),
+        )
+        result_json = result["result_json"]
+        cache.put(grade_key, result_json)
+    save_payload("result", result_json)
 
-    result_obj = safe_json_load(st.session_state.result_json or "{}")
+    result_obj = safe_json_load(result_json or "{}") or {}
 
     passed = bool(result_obj.get("pass", False))
     percent = result_obj.get("completion_percent", 0)
 
     # 아이콘 + 색상
     if passed:
-        st.success(f"🟢 통과 ({percent}%)")
+        verdict_box.success(f"🟢 통과 ({percent}%)")
     else:
-        st.error(f"🔴 반려 ({percent}%)")
+        verdict_box.error(f"🔴 반려 ({percent}%)")
 
-    st.markdown("근거")
-    for r in result_obj.get("reason_summary", [])[:6]:
-        st.write("- " + str(r))
+    show_reasons(result_obj.get("reason_summary", []))
 
     if not passed:
         st.markdown("반려시 이유")
@@ -793,21 +714,28 @@ if st.session_state.step == 5:
         for x in result_obj.get("next_request_to_child", [])[:6]:
             st.write("- " + str(x))
 
-    st.success("판정 완료 및 JSON 저장 완료 (outputs/)")
+    if result_obj.get("item_scores"):
+        # 로컬 채점(GRADE_MODE=rules)일 때 항목별 점수표
+        with st.expander(f"항목별 채점 (통과 기준 {result_obj.get('pass_threshold', 60):g}%)"):
+            for it in result_obj["item_scores"]:
+                st.caption(f"{it['item']}: {it['status']} ({it['score']:g} × {it['weight']:g}) {it.get('evidence', '')}")
+
+    st.success(f"판정 완료 및 저장 완료 (미션 ID: {current_mission_id()})")
 
     col1, col2 = st.columns([1, 1])
     with col1:
         if st.button("처음부터 다시"):
             st.session_state.step = 0
             st.session_state.api_key = ""
-            st.session_state.llm = None
-            st.session_state.agent_executor = None
             st.session_state.category = "청소"
             st.session_state.details = ""
-            st.session_state.mission_json = None
+            st.session_state.mission_ref = None
+            st.session_state.mission_id = None
             st.session_state.photo_paths = []
-            st.session_state.photo_json = None
-            st.session_state.result_json = None
+            st.session_state.photo_notes = {}
+            st.session_state.photo_names = {}
+            st.session_state.photo_ref = None
+            st.session_state.result_ref = None
             st.rerun()
 
     with col2:
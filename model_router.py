@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.messages import BaseMessage
+
+from llm_client import LLMCallError, LLMClient
+from structured_output import json_mode, validate
+from token_usage import current_scope
+
+
+# =========================================================
+# 모델 라우터 (단계별 공급자/모델 목록 + 장애 전환 + 승급)
+# - 단계(token_usage의 stage: mission / photo / grade / fused)마다 백엔드 목록을 싼 것부터 순서대로 둔다
+# - 호출마다 백엔드별 지연/오류율 EWMA를 갱신하고, 연속 실패하면 잠시 빼 둔다(cooldown)
+#   → 건강한 백엔드 중 목록 앞쪽부터 쓰고, 호출이 실패하면 다음 백엔드로 넘어간다
+# - 파싱 실패/낮은 신뢰도면 judge_engine이 escalation()으로 목록의 다음(더 강한) 모델에 다시 묻는다
+# - 이미지가 든 요청은 vision 백엔드로만 보낸다
+# - LLMClient와 같은 invoke/stream 인터페이스라 judge_engine 함수에 llm으로 그대로 넘기면 된다
+# MODEL_ROUTER_CONFIG(JSON 파일)가 없으면 쓰지 않음 (기존처럼 모델 1개)
+# =========================================================
+ROUTER_CONFIG_PATH = os.getenv("MODEL_ROUTER_CONFIG", "")
+# 오류율 EWMA가 이 값 이상이면 뒤로 미룸
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+# 지연 EWMA가 이 값(초)을 넘으면 뒤로 미룸 (0이면 지연은 안 봄)
+ROUTER_LATENCY_TARGET_S = float(os.getenv("ROUTER_LATENCY_TARGET_S", "0"))
+ROUTER_COOLDOWN_FAILS = int(os.getenv("ROUTER_COOLDOWN_FAILS", "3"))
+ROUTER_COOLDOWN_S = float(os.getenv("ROUTER_COOLDOWN_S", "30"))
+# 백엔드 1개 안에서의 재시도 (나머지는 다음 백엔드로 넘어가서 해결)
+ROUTER_BACKEND_RETRIES = int(os.getenv("ROUTER_BACKEND_RETRIES", "1"))
+# 사진 분석 항목 중 unclear 비율이 이 이상이면 낮은 신뢰도로 보고 승급
+ROUTER_UNCLEAR_FRACTION = float(os.getenv("ROUTER_UNCLEAR_FRACTION", "0.5"))
+
+_EWMA_ALPHA = 0.2
+
+# 이번 컨텍스트(스레드)에서 단계별로 마지막에 응답한 백엔드 → 승급 시작점
+_served: contextvars.ContextVar = contextvars.ContextVar("model_router_served", default=None)
+
+
+def has_images(messages: Any) -> bool:
+    items = messages if isinstance(messages, list) else [messages]
+    for m in items:
+        content = m.content if isinstance(m, BaseMessage) else m
+        if isinstance(content, list) and any(isinstance(p, dict) and p.get("type") == "image_url" for p in content):
+            return True
+    return False
+
+
+@dataclass
+class BackendHealth:
+    latency_ewma: Optional[float] = None    # 성공한 호출의 지연(초)
+    error_ewma: float = 0.0                 # 0~1
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0
+    calls: int = 0
+    errors: int = 0
+
+    def observe(self, ok: bool, latency: float, now: float) -> None:
+        self.calls += 1
+        self.error_ewma += _EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_ewma)
+        if ok:
+            self.consecutive_failures = 0
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                self.latency_ewma + _EWMA_ALPHA * (latency - self.latency_ewma)
+            )
+            return
+        self.errors += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= ROUTER_COOLDOWN_FAILS:
+            self.cooldown_until = now + ROUTER_COOLDOWN_S
+
+    def healthy(self, now: float) -> bool:
+        if now < self.cooldown_until or self.error_ewma >= ROUTER_MAX_ERROR_RATE:
+            return False
+        if ROUTER_LATENCY_TARGET_S > 0 and self.latency_ewma is not None:
+            return self.latency_ewma <= ROUTER_LATENCY_TARGET_S
+        return True
+
+
+@dataclass
+class Backend:
+    name: str
+    client: Any                 # LLMClient 또는 invoke/stream이 있는 chat model
+    vision: bool = True
+
+
+class _State:
+    """같은 라우터에서 파생된(승급) 라우터들이 공유하는 상태"""
+
+    def __init__(self, backends: Dict[str, Backend], routes: Dict[str, List[str]], clock: Callable[[], float]):
+        self.backends = backends
+        self.routes = routes
+        self.clock = clock
+        self.health: Dict[str, BackendHealth] = {name: BackendHealth() for name in backends}
+        self.lock = threading.Lock()
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        backends: List[Backend],
+        routes: Dict[str, List[str]],
+        clock: Callable[[], float] = time.monotonic,
+        _state: Optional[_State] = None,
+        _floor: int = 0,
+    ):
+        if _state is None:
+            by_name = {b.name: b for b in backends}
+            for stage, names in routes.items():
+                unknown = [n for n in names if n not in by_name]
+                if unknown:
+                    raise ValueError(f"라우터 설정: {stage} 단계의 백엔드 {unknown}가 정의되지 않음")
+            _state = _State(by_name, routes, clock)
+        self._state = _state
+        self._floor = _floor
+
+    # ---------- 선택 ----------
+    def chain(self, stage: Optional[str] = None) -> List[str]:
+        """단계의 백엔드 목록 (없으면 "default", 그것도 없으면 정의된 순서)"""
+        stage = current_scope()[1] if stage is None else stage
+        routes = self._state.routes
+        return list(routes.get(stage) or routes.get("default") or self._state.backends)
+
+    def candidates(self, messages: Any, stage: Optional[str] = None) -> List[str]:
+        """이번 호출에서 시도할 순서: 건강한 백엔드(목록 순) → 나머지(오류율/지연 낮은 순)"""
+        chain = self.chain(stage)[self._floor:]
+        if has_images(messages):
+            chain = [n for n in chain if self._state.backends[n].vision]
+        now = self._state.clock()
+        with self._state.lock:
+            health = {n: self._state.health[n] for n in chain}
+            good = [n for n in chain if health[n].healthy(now)]
+            rest = sorted(
+                (n for n in chain if n not in good),
+                key=lambda n: (now < health[n].cooldown_until, health[n].error_ewma, health[n].latency_ewma or 0.0),
+            )
+        return good + rest
+
+    def _observe(self, name: str, ok: bool, latency: float) -> None:
+        with self._state.lock:
+            self._state.health[name].observe(ok, latency, self._state.clock())
+
+    def _mark_served(self, name: str) -> None:
+        served = dict(_served.get() or {})
+        served[current_scope()[1]] = name
+        _served.set(served)
+
+    # ---------- 호출 (LLMClient와 같은 모양) ----------
+    def invoke(self, messages: Any, priority: Optional[int] = None) -> Any:
+        names = self.candidates(messages)
+        if not names:
+            raise ValueError("라우터: 이 요청을 처리할 백엔드가 없습니다 (이미지 요청인데 vision 백엔드 없음 등)")
+        last: Optional[BaseException] = None
+        for name in names:
+            client = self._state.backends[name].client
+            t0 = time.perf_counter()
+            try:
+                resp = client.invoke(messages, priority) if isinstance(client, LLMClient) else client.invoke(messages)
+            except Exception as e:
+                self._observe(name, False, time.perf_counter() - t0)
+                last = e
+                continue
+            self._observe(name, True, time.perf_counter() - t0)
+            self._mark_served(name)
+            return resp
+        raise last if last is not None else LLMCallError("client", 0, RuntimeError("no backend"))
+
+    def stream(self, messages: Any, priority: Optional[int] = None) -> Iterator[Any]:
+        """첫 청크 전에 실패하면 다음 백엔드로, 청크가 나온 뒤의 실패는 그대로 올린다"""
+        names = self.candidates(messages)
+        if not names:
+            raise ValueError("라우터: 이 요청을 처리할 백엔드가 없습니다 (이미지 요청인데 vision 백엔드 없음 등)")
+        last: Optional[BaseException] = None
+        for name in names:
+            client = self._state.backends[name].client
+            t0 = time.perf_counter()
+            started = False
+            try:
+                chunks = client.stream(messages, priority) if isinstance(client, LLMClient) else client.stream(messages)
+                for chunk in chunks:
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self._observe(name, False, time.perf_counter() - t0)
+                if started:
+                    raise
+                last = e
+                continue
+            self._observe(name, True, time.perf_counter() - t0)
+            self._mark_served(name)
+            return
+        raise last if last is not None else LLMCallError("client", 0, RuntimeError("no backend"))
+
+    # ---------- 승급 ----------
+    def escalate(self, stage: Optional[str] = None) -> Optional["ModelRouter"]:
+        """이번 단계에서 마지막에 응답한 백엔드보다 뒤(더 강한) 백엔드만 쓰는 라우터. 더 없으면 None"""
+        stage = current_scope()[1] if stage is None else stage
+        chain = self.chain(stage)
+        served = (_served.get() or {}).get(stage)
+        pos = chain.index(served) if served in chain else self._floor
+        if pos + 1 >= len(chain):
+            return None
+        return ModelRouter([], {}, _state=self._state, _floor=pos + 1)
+
+    @property
+    def model_name(self) -> str:
+        served = (_served.get() or {}).get(current_scope()[1])
+        return served or "router"
+
+    def health(self) -> List[Dict[str, Any]]:
+        now = self._state.clock()
+        with self._state.lock:
+            return [
+                {
+                    "backend": name,
+                    "calls": h.calls,
+                    "errors": h.errors,
+                    "error_ewma": round(h.error_ewma, 3),
+                    "latency_ewma_s": round(h.latency_ewma, 3) if h.latency_ewma is not None else None,
+                    "healthy": h.healthy(now),
+                }
+                for name, h in self._state.health.items()
+            ]
+
+
+# =========================================================
+# 승급 판단 (judge_engine이 파싱 직후 호출)
+# =========================================================
+def low_confidence(kind: str, obj: Dict[str, Any]) -> bool:
+    """
+    kind: mission / photo / grade / fused / photo_unit.
+    photo_unit(mapreduce의 사진 1장·1쌍)은 찍히지 않은 항목을 unclear로 두는 게 정상이라 여기서는 보지 않는다
+    → 병합 결과를 "photo"로 따로 검사 (judge_engine.photo_get)
+    """
+    if kind == "mission":
+        return not obj.get("checklist")
+    if kind in ("photo", "fused"):
+        items = [it for it in obj.get("items") or [] if isinstance(it, dict)]
+        unclear = sum(1 for it in items if str(it.get("status", "")).lower() == "unclear")
+        if not obj.get("observations") or (items and unclear / len(items) >= ROUTER_UNCLEAR_FRACTION):
+            return True
+    if kind in ("grade", "fused"):
+        return not isinstance(obj.get("completion_percent"), (int, float))
+    return False
+
+
+def escalation(llm: Any, obj: Any, schema: Dict[str, Any], kind: str) -> Optional["ModelRouter"]:
+    """파싱 실패(스키마 오류 포함)나 낮은 신뢰도이고 더 강한 모델이 있으면 그 라우터, 아니면 None"""
+    if not isinstance(llm, ModelRouter):
+        return None
+    _, errors = validate(obj, schema)
+    if not errors and not low_confidence(kind, obj):
+        return None
+    return llm.escalate()
+
+
+def confidence_escalation(llm: Any, obj: Any, kind: str) -> Optional["ModelRouter"]:
+    """이미 검증된 결과(병합 결과 등)의 신뢰도만 보고 승급 (스키마는 보지 않음)"""
+    if not isinstance(llm, ModelRouter) or not isinstance(obj, dict) or not low_confidence(kind, obj):
+        return None
+    return llm.escalate()
+
+
+# =========================================================
+# 설정 파일 → 라우터
+# {"backends": {"mini": {"provider": "openai", "model": "gpt-4o-mini"},
+#               "4o": {"provider": "openai", "model": "gpt-4o"},
+#               "flash": {"provider": "google", "model": "gemini-1.5-flash", "api_key_env": "GOOGLE_API_KEY"}},
+#  "routes": {"mission": ["mini", "flash"], "photo": ["mini", "4o"], "grade": ["mini", "4o"], "default": ["mini"]}}
+# openai 백엔드는 api_key_env가 없으면 화면에서 입력한 키를 쓴다. base_url로 가짜 서버도 지정 가능
+# =========================================================
+def load_config(path: str = ROUTER_CONFIG_PATH) -> Optional[Dict[str, Any]]:
+    if not path:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _build_chat(spec: Dict[str, Any], api_key: str) -> Any:
+    provider = spec.get("provider", "openai")
+    key = os.getenv(spec["api_key_env"], "") if spec.get("api_key_env") else api_key
+    if provider == "openai":
+        # 순환 import 방지 (judge_engine → model_router)
+        from judge_engine import build_llm
+        return build_llm(key, model_name=spec["model"], base_url=spec.get("base_url"), max_retries=0)
+    if provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=spec["model"], google_api_key=key, temperature=0, max_retries=0)
+    raise ValueError(f"라우터 설정: 알 수 없는 provider {provider}")
+
+
+def build_router(api_key: str, config: Dict[str, Any], **client_kwargs: Any) -> ModelRouter:
+    client_kwargs.setdefault("max_retries", ROUTER_BACKEND_RETRIES)
+    backends = [
+        Backend(name, LLMClient(json_mode(_build_chat(spec, api_key)), **client_kwargs), bool(spec.get("vision", True)))
+        for name, spec in config.get("backends", {}).items()
+    ]
+    return ModelRouter(backends, config.get("routes", {}))
@@ -0,0 +1,59 @@
+import re
+import json
+from typing import Any, Dict, Iterable
+
+
+# =========================================================
+# 스트리밍 중인 JSON 텍스트에서 "지금까지 완성된" 값만 꺼내기
+# - 리스트 키: 닫힌 원소만 순서대로 반환 (마지막 원소가 쓰이는 중이면 제외)
+# - 스칼라 키: 값이 끝까지 나온 경우만 반환
+# 최종 결과는 반드시 safe_json_load로 다시 파싱할 것 (여기 결과는 화면 미리보기용)
+# =========================================================
+_decoder = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+def _key_pos(text: str, key: str) -> int:
+    m = re.search(r'"%s"\s*:\s*' % re.escape(key), text)
+    return m.end() if m else -1
+
+
+def _decode_complete(text: str, i: int):
+    """text[i:]에서 JSON 값 1개를 읽는다. 숫자/true 등은 뒤에 글자가 더 와야 완성으로 본다."""
+    value, end = _decoder.raw_decode(text, i)
+    if not isinstance(value, (str, list, dict)) and end >= len(text):
+        raise ValueError("value may be truncated")
+    return value, end
+
+
+def parse_partial(text: str, list_keys: Iterable[str] = (), scalar_keys: Iterable[str] = ()) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+
+    for key in list_keys:
+        i = _key_pos(text, key)
+        if i < 0 or i >= len(text) or text[i] != "[":
+            continue
+        i += 1
+        items = []
+        while True:
+            while i < len(text) and (text[i] in _WS or text[i] == ","):
+                i += 1
+            if i >= len(text) or text[i] == "]":
+                break
+            try:
+                value, i = _decode_complete(text, i)
+            except ValueError:
+                break
+            items.append(value)
+        out[key] = items
+
+    for key in scalar_keys:
+        i = _key_pos(text, key)
+        if i < 0:
+            continue
+        try:
+            out[key], _ = _decode_complete(text, i)
+        except ValueError:
+            continue
+
+    return out
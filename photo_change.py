@@ -0,0 +1,135 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+# =========================================================
+# 청소 비교모드: before/after 로컬 변화 측정 (NumPy, CPU)
+# 1) 두 사진을 같은 크기의 흑백으로 축소 (JPEG는 디코딩 단계에서 축소)
+# 2) 위상 상관(phase correlation)으로 평행 이동 보정 → 겹치는 영역만 비교
+# 3) 밝기 정규화 후 차이 → 변화 마스크 / 변화 비율 / 변화가 몰린 영역
+# 4) 경계(에지) 밀도 전후 비교 → 어지러움 증감의 대략적 지표
+# 결과는 사진 분석 프롬프트와 photo_json(change_metrics)에 들어가 채점 근거로 쓰인다
+# =========================================================
+CHANGE_EDGE = 256
+SHIFT_MAX_FRACTION = 0.25
+ALIGN_MIN_PEAK = 0.05
+DIFF_Z_THRESHOLD = 0.8
+EDGE_THRESHOLD = 24.0
+REGION_MIN_FRACTION = 0.05
+NO_CHANGE_FRACTION = float(os.getenv("PHOTO_NO_CHANGE_FRACTION", "0.005"))
+
+_ROWS = ("위", "가운데", "아래")
+_COLS = ("왼쪽", "가운데", "오른쪽")
+
+
+def _load_gray(path: str, size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    with Image.open(path) as im:
+        im.draft("L", (CHANGE_EDGE * 2, CHANGE_EDGE * 2))
+        im = ImageOps.exif_transpose(im).convert("L")
+        if size is None:
+            im.thumbnail((CHANGE_EDGE, CHANGE_EDGE))
+        else:
+            im = im.resize(size, Image.BILINEAR)
+        return np.asarray(im, dtype=np.float32)
+
+
+def phase_correlation(a: np.ndarray, b: np.ndarray) -> Tuple[int, int, float]:
+    """b가 a에서 (dy, dx)만큼 이동했다고 볼 때의 이동량과 피크 높이(0~1, 클수록 확실)"""
+    h, w = a.shape
+    win = np.outer(np.hanning(h), np.hanning(w)).astype(np.float32)
+    fa = np.fft.rfft2((a - a.mean()) * win)
+    fb = np.fft.rfft2((b - b.mean()) * win)
+    r = fb * np.conj(fa)
+    r /= np.abs(r) + 1e-9
+    corr = np.fft.irfft2(r, s=(h, w))
+    py, px = np.unravel_index(int(np.argmax(corr)), corr.shape)
+    dy = py - h if py > h // 2 else py
+    dx = px - w if px > w // 2 else px
+    return int(dy), int(dx), float(corr[py, px])
+
+
+def _overlap(a: np.ndarray, b: np.ndarray, dy: int, dx: int) -> Tuple[np.ndarray, np.ndarray]:
+    h, w = a.shape
+    hh, ww = h - abs(dy), w - abs(dx)
+    ay, ax = max(0, -dy), max(0, -dx)
+    by, bx = max(0, dy), max(0, dx)
+    return a[ay:ay + hh, ax:ax + ww], b[by:by + hh, bx:bx + ww]
+
+
+def _smooth(a: np.ndarray) -> np.ndarray:
+    """3x3 평균 (노이즈/JPEG 블록 완화)"""
+    p = np.pad(a, 1, mode="edge")
+    h, w = a.shape
+    return sum(p[y:y + h, x:x + w] for y in range(3) for x in range(3)) / 9.0
+
+
+def _zscore(a: np.ndarray) -> np.ndarray:
+    return (a - a.mean()) / (a.std() + 1e-6)
+
+
+def edge_density(a: np.ndarray) -> float:
+    gx = np.abs(np.diff(a, axis=1))[:-1, :]
+    gy = np.abs(np.diff(a, axis=0))[:, :-1]
+    return float(((gx + gy) > EDGE_THRESHOLD).mean())
+
+
+def _regions(mask: np.ndarray) -> List[str]:
+    h, w = mask.shape
+    cells = []
+    for i, row in enumerate(_ROWS):
+        for j, col in enumerate(_COLS):
+            frac = float(mask[i * h // 3:(i + 1) * h // 3, j * w // 3:(j + 1) * w // 3].mean())
+            if frac >= REGION_MIN_FRACTION:
+                name = "가운데" if row == col == "가운데" else f"{row}-{col}"
+                cells.append((frac, name))
+    return [name for _, name in sorted(cells, reverse=True)]
+
+
+def measure_change(before_path: str, after_path: str) -> Dict[str, Any]:
+    """
+    before/after 변화 지표. 사진 크기가 달라도 after를 before 크기로 맞춰서 비교.
+    프롬프트와 캐시된 결과에 그대로 들어가므로 실행마다 달라지는 값(소요 시간 등)은 넣지 않는다 (시간은 "change" 구간에 기록)
+    """
+    a = _load_gray(before_path)
+    b = _load_gray(after_path, size=(a.shape[1], a.shape[0]))
+
+    dy, dx, peak = phase_correlation(a, b)
+    h, w = a.shape
+    aligned = peak >= ALIGN_MIN_PEAK and abs(dy) <= h * SHIFT_MAX_FRACTION and abs(dx) <= w * SHIFT_MAX_FRACTION
+    if not aligned:
+        dy = dx = 0
+    ca, cb = _overlap(a, b, dy, dx)
+
+    mask = np.abs(_smooth(_zscore(ca)) - _smooth(_zscore(cb))) > DIFF_Z_THRESHOLD
+    ed_before, ed_after = edge_density(ca), edge_density(cb)
+
+    return {
+        "shift_px": [dx, dy],
+        "align_peak": round(peak, 3),
+        "aligned": aligned,
+        "changed_fraction": round(float(mask.mean()), 4),
+        "changed_regions": _regions(mask),
+        "edge_density_before": round(ed_before, 4),
+        "edge_density_after": round(ed_after, 4),
+        "edge_density_delta": round(ed_after - ed_before, 4),
+    }
+
+
+def is_unchanged(metrics: Dict[str, Any]) -> bool:
+    """정렬이 된 상태에서 변화 면적이 사실상 0이면 모델 호출 없이 '변화 없음'으로 본다"""
+    return bool(metrics.get("aligned")) and metrics.get("changed_fraction", 1.0) < NO_CHANGE_FRACTION
+
+
+def change_summary_text(metrics: Dict[str, Any]) -> str:
+    """프롬프트용 한 줄 요약 (모델이 참고하는 객관 지표)"""
+    delta = metrics["edge_density_delta"]
+    trend = "줄어듦(정돈된 쪽)" if delta < -0.01 else "늘어남(어지러워진 쪽)" if delta > 0.01 else "비슷함"
+    regions = ", ".join(metrics["changed_regions"]) or "뚜렷한 영역 없음"
+    return (
+        f"변화 면적 {metrics['changed_fraction'] * 100:.1f}% / 변화가 큰 영역: {regions} / "
+        f"경계 밀도 {metrics['edge_density_before']:.3f} → {metrics['edge_density_after']:.3f} ({trend})"
+        + ("" if metrics["aligned"] else " / 구도가 많이 달라 정렬 실패(참고용)")
+    )
@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from upload_store import digest_for
+
+
+# =========================================================
+# 사진 지각 해시(pHash / dHash) 인덱스
+# - 분석한 사진마다 (sha256, dHash, pHash) 기록 → 같은 사진/거의 같은 사진 재제출 감지
+# - 사진별 분석 결과(mapreduce 모드)를 해시 + 분석 맥락(미션/프롬프트) 기준으로 저장해서 재사용
+#   (청소 비교모드의 전후 1쌍은 두 사진 해시의 조합으로 저장)
+# - 청소 비교모드에서 before/after가 같은 사진이면 LLM 호출 없이 바로 판정 가능
+# 해밍 거리(64비트 중 다른 비트 수)가 작을수록 비슷한 사진
+# =========================================================
+INDEX_PATH = os.getenv("PHOTO_INDEX_PATH", os.path.join(".cache", "photo_index.sqlite3"))
+NEAR_DUP_DISTANCE = int(os.getenv("PHOTO_NEAR_DUP_DISTANCE", "8"))
+SAME_PHOTO_DISTANCE = int(os.getenv("PHOTO_SAME_DISTANCE", "4"))
+
+_DCT_N = 32
+_DCT_K = 8
+
+
+@dataclass(frozen=True)
+class PhotoHashes:
+    sha256: str
+    dhash: int
+    phash: int
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT = _dct_matrix(_DCT_N)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    out = 0
+    for b in bits.ravel():
+        out = (out << 1) | int(b)
+    return out
+
+
+def dhash(gray: Image.Image) -> int:
+    """가로 방향 밝기 차이 9x8 → 64비트"""
+    a = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    return _bits_to_int(a[:, 1:] > a[:, :-1])
+
+
+def phash(gray: Image.Image) -> int:
+    """32x32 DCT의 저주파 8x8 계수를 중앙값과 비교 → 64비트"""
+    a = np.asarray(gray.resize((_DCT_N, _DCT_N), Image.BILINEAR), dtype=np.float64)
+    coeffs = (_DCT @ a @ _DCT.T)[:_DCT_K, :_DCT_K].ravel()
+    med = np.median(coeffs[1:])  # DC 성분 제외
+    return _bits_to_int(coeffs > med)
+
+
+_memo: Dict[Tuple[str, int, int], PhotoHashes] = {}
+_memo_lock = threading.Lock()
+
+
+def image_hashes(path: str) -> PhotoHashes:
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _memo_lock:
+        if key in _memo:
+            return _memo[key]
+
+    sha = digest_for(path)
+    if sha is None:
+        with open(path, "rb") as f:
+            sha = hashlib.sha256(f.read()).hexdigest()
+    with Image.open(path) as im:
+        im = ImageOps.exif_transpose(im)
+        im.draft("L", (256, 256))  # JPEG는 디코딩 단계에서 축소 → 큰 사진도 빠름
+        gray = im.convert("L")
+        h = PhotoHashes(sha, dhash(gray), phash(gray))
+
+    with _memo_lock:
+        if len(_memo) > 1024:
+            _memo.clear()
+        _memo[key] = h
+    return h
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def distance(a: PhotoHashes, b: PhotoHashes) -> int:
+    """0이면 같은 파일. pHash/dHash 중 큰 쪽 (둘 다 가까워야 비슷한 사진으로 본다)"""
+    if a.sha256 == b.sha256:
+        return 0
+    return max(hamming(a.phash, b.phash), hamming(a.dhash, b.dhash))
+
+
+def _to_signed(h: int) -> int:
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def _to_unsigned(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+
+@dataclass
+class Match:
+    sha256: str
+    path: str
+    distance: int
+    first_seen: float
+
+    @property
+    def exact(self) -> bool:
+        return self.distance == 0
+
+
+class PhotoIndex:
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # 근접 검색용 메모리 사본 (행 수가 바뀌면 다시 읽음)
+        self._cache_rows = -1
+        self._shas: List[str] = []
+        self._paths: List[str] = []
+        self._seen: np.ndarray = np.zeros(0)
+        self._ph = np.zeros(0, dtype=np.uint64)
+        self._dh = np.zeros(0, dtype=np.uint64)
+
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS photos (
+                    sha256     TEXT PRIMARY KEY,
+                    dhash      INTEGER NOT NULL,
+                    phash      INTEGER NOT NULL,
+                    path       TEXT NOT NULL,
+                    first_seen REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS analyses (
+                    sha256      TEXT NOT NULL,
+                    context_key TEXT NOT NULL,
+                    payload     TEXT NOT NULL,
+                    created_at  REAL NOT NULL,
+                    PRIMARY KEY (sha256, context_key)
+                );
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def add(self, h: PhotoHashes, path: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO photos (sha256, dhash, phash, path, first_seen) VALUES (?, ?, ?, ?, ?)",
+                (h.sha256, _to_signed(h.dhash), _to_signed(h.phash), path, time.time()),
+            )
+
+    def _refresh(self) -> None:
+        conn = self._conn()
+        n = conn.execute("SELECT COUNT(*) FROM photos").fetchone()[0]
+        if n == self._cache_rows:
+            return
+        rows = conn.execute("SELECT sha256, dhash, phash, path, first_seen FROM photos").fetchall()
+        self._shas = [r[0] for r in rows]
+        self._paths = [r[3] for r in rows]
+        self._dh = np.array([_to_unsigned(r[1]) for r in rows], dtype=np.uint64)
+        self._ph = np.array([_to_unsigned(r[2]) for r in rows], dtype=np.uint64)
+        self._seen = np.array([r[4] for r in rows], dtype=np.float64)
+        self._cache_rows = n
+
+    def find_similar(self, h: PhotoHashes, max_distance: int = NEAR_DUP_DISTANCE) -> List[Match]:
+        with self._lock:
+            self._refresh()
+            if not self._shas:
+                return []
+            # 64비트 XOR → 바이트로 펼쳐서 비트 수 세기 (전체 인덱스를 한 번에 계산)
+            ph = np.unpackbits((self._ph ^ np.uint64(h.phash)).view(np.uint8)).reshape(-1, 64).sum(axis=1)
+            dh = np.unpackbits((self._dh ^ np.uint64(h.dhash)).view(np.uint8)).reshape(-1, 64).sum(axis=1)
+            dist = np.maximum(ph, dh)
+            out = []
+            for i in np.nonzero(dist <= max_distance)[0]:
+                d = 0 if self._shas[i] == h.sha256 else int(dist[i])
+                out.append(Match(self._shas[i], self._paths[i], d, float(self._seen[i])))
+        return sorted(out, key=lambda m: (m.distance, m.first_seen))
+
+    def get_analysis(self, h: PhotoHashes, context_key: str, max_distance: int = SAME_PHOTO_DISTANCE) -> Optional[Any]:
+        """같은 맥락에서 분석한 적 있는 같은/거의 같은 사진의 결과"""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT payload FROM analyses WHERE sha256 = ? AND context_key = ?", (h.sha256, context_key)
+        ).fetchone()
+        if row:
+            return json.loads(row[0])
+        for m in self.find_similar(h, max_distance):
+            row = conn.execute(
+                "SELECT payload FROM analyses WHERE sha256 = ? AND context_key = ?", (m.sha256, context_key)
+            ).fetchone()
+            if row:
+                return json.loads(row[0])
+        return None
+
+    def put_analysis(self, h: PhotoHashes, context_key: str, obj: Any) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (sha256, context_key, payload, created_at) VALUES (?, ?, ?, ?)",
+                (h.sha256, context_key, json.dumps(obj, ensure_ascii=False), time.time()),
+            )
+
+    def _candidates(self, h: PhotoHashes, max_distance: int) -> List[str]:
+        """h 자신 + 인덱스의 거의 같은 사진들의 sha256 (가까운 순)"""
+        out = [h.sha256]
+        for m in self.find_similar(h, max_distance):
+            if m.sha256 not in out:
+                out.append(m.sha256)
+        return out
+
+    def get_pair_analysis(
+        self,
+        before: PhotoHashes,
+        after: PhotoHashes,
+        context_key: str,
+        max_distance: int = SAME_PHOTO_DISTANCE,
+    ) -> Optional[Any]:
+        """같은 맥락에서 분석한 적 있는 (before, after) 쌍의 결과. 양쪽 모두 같은/거의 같은 사진이어야 함"""
+        conn = self._conn()
+        for b in self._candidates(before, max_distance):
+            for a in self._candidates(after, max_distance):
+                row = conn.execute(
+                    "SELECT payload FROM analyses WHERE sha256 = ? AND context_key = ?", (pair_key(b, a), context_key)
+                ).fetchone()
+                if row:
+                    return json.loads(row[0])
+        return None
+
+    def put_pair_analysis(self, before: PhotoHashes, after: PhotoHashes, context_key: str, obj: Any) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (sha256, context_key, payload, created_at) VALUES (?, ?, ?, ?)",
+                (pair_key(before.sha256, after.sha256), context_key, json.dumps(obj, ensure_ascii=False), time.time()),
+            )
+
+
+def pair_key(before_sha: str, after_sha: str) -> str:
+    # analyses 테이블의 sha256 칸을 같이 쓰되 사진 1장 결과와 섞이지 않게 접두어
+    return f"pair:{before_sha}:{after_sha}"
+
+
+def submission_warnings(new_path: str, existing_paths: List[str], index: Optional[PhotoIndex] = None) -> List[str]:
+    """STEP 3에서 사진을 추가할 때 보여줄 중복 경고 (제출 안 / 과거 기록)"""
+    try:
+        h = image_hashes(new_path)
+    except Exception:
+        return []
+
+    warnings = []
+    for i, p in enumerate(existing_paths, start=1):
+        try:
+            d = distance(h, image_hashes(p))
+        except Exception:
+            continue
+        if d == 0:
+            warnings.append(f"{i}번 사진과 같은 사진입니다.")
+        elif d <= NEAR_DUP_DISTANCE:
+            warnings.append(f"{i}번 사진과 거의 같은 사진입니다.")
+
+    if index is not None:
+        matches = index.find_similar(h)
+        if matches:
+            m = matches[0]
+            when = time.strftime("%Y-%m-%d", time.localtime(m.first_seen))
+            kind = "같은" if m.exact else "거의 같은"
+            warnings.append(f"이전에 제출된 사진과 {kind} 사진입니다. (최초 제출 {when})")
+    return warnings
+
+
+_index: Optional[PhotoIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> PhotoIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PhotoIndex()
+        return _index
+
+
+def set_index(index: Optional[PhotoIndex]) -> Optional[PhotoIndex]:
+    """프로세스 공용 인덱스 교체 (비교 실행처럼 이전 결과 재사용을 막을 때) → 이전 인덱스"""
+    global _index
+    with _index_lock:
+        previous, _index = _index, index
+        return previous
@@ -0,0 +1,160 @@
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+
+# =========================================================
+# 사진 분석 map-reduce
+# - map: 사진 1장(비교모드는 before/after 1쌍)씩 동시에 분석 (스레드 풀, 동시 실행 수 제한)
+# - reduce: 사진별 결과를 기존 스키마(observations / notable_changes / caveats / items)로 병합
+# - 한 장이 실패/시간 초과여도 나머지 결과로 부분 결과를 만든다
+# =========================================================
+@dataclass
+class PhotoUnit:
+    index: int              # 1부터 (화면/프롬프트의 "사진 i"와 동일)
+    paths: List[str]
+    mode: str               # "single" | "compare"
+
+    @property
+    def label(self) -> str:
+        if self.mode == "compare":
+            return "사진 1-2(전후)"
+        return f"사진 {self.index}"
+
+
+@dataclass
+class UnitResult:
+    unit: PhotoUnit
+    obj: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+
+@dataclass
+class _Running:
+    unit: PhotoUnit
+    started: Optional[float] = None
+
+
+def build_units(photo_paths: List[str], mode: str) -> List[PhotoUnit]:
+    if mode == "compare":
+        return [PhotoUnit(1, list(photo_paths[:2]), "compare")]
+    return [PhotoUnit(i, [p], "single") for i, p in enumerate(photo_paths, start=1)]
+
+
+def run_map(
+    analyze: Callable[[PhotoUnit], Dict[str, Any]],
+    units: List[PhotoUnit],
+    max_workers: int = 4,
+    timeout: float = 60.0,
+    on_result: Optional[Callable[[UnitResult], None]] = None,
+) -> List[UnitResult]:
+    """
+    units를 동시에 analyze. 반환 순서는 units 순서와 같다.
+    timeout은 각 단위가 '실행을 시작한 시점'부터 잰다 (대기열에 있던 시간은 제외).
+    on_result: 단위가 끝날 때마다(실패/시간 초과 포함) 호출한 스레드에서 불린다.
+    """
+    results: Dict[int, UnitResult] = {}
+    running: Dict[Any, _Running] = {}
+
+    def _call(r: _Running) -> Dict[str, Any]:
+        r.started = time.monotonic()
+        return analyze(r.unit)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="photo-map")
+    try:
+        for u in units:
+            r = _Running(u)
+            # 호출한 쪽 contextvars(토큰 사용량 스코프 등)를 작업 스레드에서도 보이게
+            running[pool.submit(contextvars.copy_context().run, _call, r)] = r
+
+        while running:
+            done, _ = wait(list(running), timeout=0.05, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+
+            for fut in done:
+                r = running.pop(fut)
+                elapsed = now - r.started if r.started is not None else 0.0
+                try:
+                    obj = fut.result()
+                    if isinstance(obj, dict):
+                        results[r.unit.index] = UnitResult(r.unit, obj=obj, elapsed=elapsed)
+                    else:
+                        results[r.unit.index] = UnitResult(r.unit, error="JSON 파싱 실패", elapsed=elapsed)
+                except Exception as e:
+                    results[r.unit.index] = UnitResult(r.unit, error=type(e).__name__, elapsed=elapsed)
+                if on_result is not None:
+                    on_result(results[r.unit.index])
+
+            for fut, r in list(running.items()):
+                if r.started is not None and now - r.started > timeout:
+                    # 실행 중인 스레드는 멈출 수 없으므로 결과만 버린다
+                    running.pop(fut)
+                    results[r.unit.index] = UnitResult(r.unit, error="시간 초과", elapsed=now - r.started)
+                    if on_result is not None:
+                        on_result(results[r.unit.index])
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return [results[u.index] for u in units]
+
+
+def _extend_unique(dst: List[str], items: Any, prefix: str, seen: set) -> None:
+    if not isinstance(items, list):
+        return
+    for x in items:
+        text = str(x).strip()
+        if not text or text in seen:
+            continue
+        seen.add(text)
+        dst.append(f"{prefix}: {text}" if prefix else text)
+
+
+# 여러 사진이 같은 체크리스트 항목을 보고한 경우 더 강한 상태를 채택
+_STATUS_RANK = {"done": 3, "partial": 2, "missing": 1, "unclear": 0}
+
+
+def _merge_items(merged: List[Dict[str, Any]], items: Any, prefix: str) -> None:
+    if not isinstance(items, list):
+        return
+    for i, it in enumerate(items):
+        if not isinstance(it, dict):
+            continue
+        status = str(it.get("status", "unclear")).strip().lower()
+        evidence = str(it.get("evidence") or "").strip()
+        if prefix and evidence:
+            evidence = f"{prefix}: {evidence}"
+        if i >= len(merged):
+            merged.append({"item": it.get("item", ""), "status": status, "evidence": evidence})
+        elif _STATUS_RANK.get(status, 0) > _STATUS_RANK.get(merged[i]["status"], 0):
+            merged[i].update(status=status, evidence=evidence)
+
+
+def merge_results(results: List[UnitResult], mode: str) -> Dict[str, Any]:
+    observations: List[str] = []
+    notable_changes: List[str] = []
+    caveats: List[str] = []
+    items: List[Dict[str, Any]] = []
+    seen_obs, seen_chg, seen_cav = set(), set(), set()
+
+    multi = len(results) > 1
+    for r in results:
+        prefix = r.unit.label if multi else ""
+        if r.obj is None:
+            caveats.append(f"{r.unit.label} 분석 실패({r.error}) — 이 사진은 판정 근거에서 제외됨")
+            continue
+        _extend_unique(observations, r.obj.get("observations"), prefix, seen_obs)
+        _extend_unique(notable_changes, r.obj.get("notable_changes"), prefix, seen_chg)
+        _extend_unique(caveats, r.obj.get("caveats"), prefix, seen_cav)
+        _merge_items(items, r.obj.get("items"), prefix)
+
+    return {
+        "mode": mode,
+        "observations": observations,
+        "notable_changes": notable_changes if mode == "compare" else [],
+        "caveats": caveats,
+        "items": items,
+        "partial": any(r.obj is None for r in results),
+    }
@@ -0,0 +1,140 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+# =========================================================
+# 사진 사전 검사 (모델 호출 전, 로컬에서 수 ms)
+# - 파일 형식 확인(매직 바이트) → 디코딩 → 해상도 → 노출(히스토그램) → 흐림(라플라시안 분산)
+# - 검사는 긴 변 SCREEN_EDGE로 줄인 흑백 사본에서 NumPy로 한 번에 계산
+# - 통과 못 한 사진은 STEP 3에서 바로 거절하고, 엔진(photo_get)에서도 모델에 보내지 않는다
+# =========================================================
+MIN_EDGE = int(os.getenv("PHOTO_MIN_EDGE", "320"))
+BLUR_MIN_VAR = float(os.getenv("PHOTO_BLUR_MIN_VAR", "20"))
+DARK_LEVEL = 16
+BRIGHT_LEVEL = 240
+EXPOSURE_MAX_FRACTION = float(os.getenv("PHOTO_EXPOSURE_MAX_FRACTION", "0.95"))
+FLAT_MAX_STD = 4.0
+SCREEN_EDGE = 512
+
+# (매직 바이트, 오프셋, 형식) — Pillow로 열 수 있고 모델에 보낼 수 있는 것만
+_SIGNATURES: Tuple[Tuple[bytes, int, str], ...] = (
+    (b"\xff\xd8\xff", 0, "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", 0, "PNG"),
+    (b"GIF87a", 0, "GIF"),
+    (b"GIF89a", 0, "GIF"),
+    (b"WEBP", 8, "WEBP"),
+    (b"BM", 0, "BMP"),
+)
+
+
+@dataclass
+class QualityReport:
+    path: str
+    problems: List[str] = field(default_factory=list)
+    metrics: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    for magic, offset, fmt in _SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            if fmt == "WEBP" and head[:4] != b"RIFF":
+                continue
+            return fmt
+    return None
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """4-이웃 라플라시안의 분산. 작을수록 흐림 (경계가 없음)"""
+    g = gray.astype(np.float32)
+    lap = g[1:-1, :-2] + g[1:-1, 2:] + g[:-2, 1:-1] + g[2:, 1:-1] - 4.0 * g[1:-1, 1:-1]
+    return float(lap.var())
+
+
+def _screen(path: str) -> QualityReport:
+    report = QualityReport(path)
+
+    try:
+        with open(path, "rb") as f:
+            head = f.read(16)
+    except OSError:
+        report.problems.append("파일을 읽을 수 없습니다.")
+        return report
+
+    fmt = sniff_format(head)
+    report.metrics["format"] = fmt
+    if fmt is None:
+        report.problems.append("지원하지 않는 파일 형식입니다. (JPEG/PNG/WEBP/GIF/BMP 사진만 가능)")
+        return report
+
+    try:
+        with Image.open(path) as im:
+            width, height = im.size
+            im.draft("L", (SCREEN_EDGE, SCREEN_EDGE))
+            im = ImageOps.exif_transpose(im)
+            gray = im.convert("L")
+            gray.thumbnail((SCREEN_EDGE, SCREEN_EDGE))
+            a = np.asarray(gray)
+    except Exception:
+        report.problems.append("사진 파일이 손상되어 열 수 없습니다.")
+        return report
+
+    report.metrics["size"] = (width, height)
+    if min(width, height) < MIN_EDGE:
+        report.problems.append(f"사진이 너무 작습니다. ({width}x{height}, 짧은 변 {MIN_EDGE}px 이상 필요)")
+        return report
+
+    hist = np.bincount(a.ravel(), minlength=256)
+    total = float(a.size)
+    dark = hist[:DARK_LEVEL].sum() / total
+    bright = hist[BRIGHT_LEVEL:].sum() / total
+    std = float(a.std())
+    report.metrics.update({
+        "dark_fraction": round(float(dark), 3),
+        "bright_fraction": round(float(bright), 3),
+        "std": round(std, 1),
+    })
+
+    if dark >= EXPOSURE_MAX_FRACTION:
+        report.problems.append("사진이 너무 어둡습니다. 밝은 곳에서 다시 찍어주세요.")
+    elif bright >= EXPOSURE_MAX_FRACTION:
+        report.problems.append("사진이 너무 밝습니다(빛 번짐). 다시 찍어주세요.")
+    elif std < FLAT_MAX_STD:
+        report.problems.append("사진에 아무것도 보이지 않습니다. (단색 화면)")
+    else:
+        blur = laplacian_variance(a)
+        report.metrics["blur_var"] = round(blur, 1)
+        if blur < BLUR_MIN_VAR:
+            report.problems.append("사진이 흐립니다. 초점을 맞춰 다시 찍어주세요.")
+    return report
+
+
+_memo: Dict[Tuple[str, int, int], QualityReport] = {}
+_memo_lock = threading.Lock()
+
+
+def screen_photo(path: str) -> QualityReport:
+    """같은 파일(경로/수정시각/크기)은 한 번만 검사"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return QualityReport(path, problems=["해당 경로에 파일이 없습니다."])
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _memo_lock:
+        if key in _memo:
+            return _memo[key]
+
+    report = _screen(path)
+    with _memo_lock:
+        if len(_memo) > 1024:
+            _memo.clear()
+        _memo[key] = report
+    return report
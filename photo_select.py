@@ -0,0 +1,294 @@
+import io
+import os
+import re
+import math
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps
+
+from image_prep import PrepSettings
+from photo_hash import SAME_PHOTO_DISTANCE, PhotoHashes, distance
+from photo_quality import screen_photo
+
+
+# =========================================================
+# 사진 선택 (모델에 보내기 전, 로컬)
+# - 사진마다 선명도(라플라시안 분산) / 새로움(이미 고른 사진과의 pHash 거리) / 체크리스트 관련도를 점수로
+#   → 점수가 높은 사진부터 하나씩 고른다 (고를 때마다 새로움을 다시 계산, 동점은 제출 순서)
+# - 이미 고른 사진과 같은/거의 같은 사진은 빼고, 바이트/토큰 예산에 맞을 때까지
+#   해상도를 한 단계씩 낮춘 뒤, 그래도 넘으면 점수 낮은 사진부터 뺀다
+# - 관련도는 사진에 붙은 글자(사용자가 올린 파일 이름, 로컬 사진은 파일 이름)에 체크리스트 낱말이
+#   들어 있는 정도만 본다. 업로드 저장소 경로(sha256)가 아니라 원래 이름을 넘겨야 의미가 있고,
+#   이름에 정보가 없으면(IMG_1234 등) 모든 사진이 0이라 순서에 영향 없음 (이미지 내용과 체크리스트를 비교하는 로컬 모델은 없음)
+# 같은 사진/설정이면 항상 같은 결과 (난수/시간 없음). 예산이 둘 다 0이면 꺼짐
+# =========================================================
+# 인코딩된 이미지 바이트 합계 상한 (base64 전)
+PHOTO_SELECT_MAX_BYTES = int(os.getenv("PHOTO_SELECT_MAX_BYTES", "0"))
+# 이미지 입력 토큰 추정치 합계 상한
+PHOTO_SELECT_MAX_TOKENS = int(os.getenv("PHOTO_SELECT_MAX_TOKENS", "0"))
+# 해상도는 이 아래로 낮추지 않음 (긴 변 px)
+PHOTO_SELECT_MIN_EDGE = int(os.getenv("PHOTO_SELECT_MIN_EDGE", "512"))
+
+# 예산에 맞출 때 시도하는 긴 변 후보 (위에서부터)
+EDGE_STEPS = (2048, 1568, 1280, 1024, 768, 640, 512, 384)
+_W_SHARP = 0.4
+_W_NOVEL = 0.4
+_W_RELEVANT = 0.2
+# 선명도 점수 1.0에 해당하는 라플라시안 분산
+_SHARP_FULL = 2000.0
+# 새로움 점수 1.0에 해당하는 해시 거리 (64비트 중)
+_NOVEL_FULL = 24
+
+_WORD = re.compile(r"[0-9a-z가-힣]{2,}")
+_HANGUL = re.compile(r"[가-힣]")
+
+
+def selection_enabled() -> bool:
+    return PHOTO_SELECT_MAX_BYTES > 0 or PHOTO_SELECT_MAX_TOKENS > 0
+
+
+def selection_tag(labels: Sequence[str] = ()) -> str:
+    """결과 캐시 키에 넣을 선택 설정 + 관련도에 쓰는 사진 이름 (꺼져 있으면 빈 문자열)"""
+    if not selection_enabled():
+        return ""
+    names = "\n".join(_label_text(label) for label in labels)
+    digest = hashlib.sha256(names.encode("utf-8")).hexdigest()[:12]
+    return f"sel-b{PHOTO_SELECT_MAX_BYTES}-t{PHOTO_SELECT_MAX_TOKENS}-e{PHOTO_SELECT_MIN_EDGE}-{digest}"
+
+
+def _label_text(label: str) -> str:
+    return os.path.splitext(os.path.basename(label or ""))[0].lower()
+
+
+def _stem(word: str) -> str:
+    # 한국어는 조사/어미가 붙으므로 ("책상을", "정리하기") 앞 두 글자만 비교
+    return word[:2] if _HANGUL.match(word) else word
+
+
+def checklist_words(mission_obj: Dict[str, Any]) -> List[str]:
+    """체크리스트 항목 낱말 (중복 없이, 나온 순서)"""
+    words: List[str] = []
+    for it in mission_obj.get("checklist") or []:
+        text = str(it.get("item", "") if isinstance(it, dict) else it)
+        for w in _WORD.findall(text.lower()):
+            w = _stem(w)
+            if w not in words:
+                words.append(w)
+    return words
+
+
+def relevance(label: str, words: Sequence[str]) -> float:
+    """사진 이름에 체크리스트 낱말이 들어 있는 정도 (0~1, 2개 이상이면 1)"""
+    if not words:
+        return 0.0
+    text = _label_text(label)
+    hits = sum(1 for w in words if w in text)
+    return min(1.0, hits / 2.0)
+
+
+def scaled_size(size: Tuple[int, int], max_edge: int) -> Tuple[int, int]:
+    """image_prep과 같은 규칙(긴 변 기준 축소, 확대 없음)으로 줄인 크기"""
+    w, h = size
+    if max(w, h) <= max_edge or w <= 0 or h <= 0:
+        return w, h
+    s = max_edge / max(w, h)
+    return max(1, round(w * s)), max(1, round(h * s))
+
+
+def image_tokens(size: Tuple[int, int]) -> int:
+    """
+    OpenAI 비전 입력 토큰 추정 (detail=high):
+    2048x2048 안으로 축소 → 짧은 변 768로 축소 → 512px 타일 수 × 170 + 85
+    """
+    w, h = size
+    if w <= 0 or h <= 0:
+        return 85 + 170 * 4  # 크기를 모르면 타일 4개로 가정
+    s = min(1.0, 2048 / max(w, h))
+    w, h = w * s, h * s
+    s = min(1.0, 768 / min(w, h))
+    w, h = w * s, h * s
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+@dataclass
+class Candidate:
+    number: int                 # 원래 제출 번호
+    path: str
+    hashes: Optional[PhotoHashes]
+    size: Tuple[int, int]
+    sharpness: float            # 0~1
+    relevance: float            # 0~1
+    # 가장 낮은 해상도(PHOTO_SELECT_MIN_EDGE)로 인코딩한 실제 바이트/크기 → 더 큰 해상도는 면적 비율로 추정
+    probe_bytes: int
+    probe_size: Tuple[int, int]
+
+    def cost(self, edge: int) -> Tuple[int, int]:
+        """긴 변 edge로 보낼 때 (바이트, 토큰) 추정"""
+        size = scaled_size(self.size, edge)
+        pw, ph = self.probe_size
+        area = max(1, pw * ph)
+        # 축소본에서 면적 비율로 늘리면 실제보다 조금 크게 나와서 예산 쪽으로 안전함
+        nbytes = int(self.probe_bytes * max(1.0, size[0] * size[1] / area))
+        return nbytes, image_tokens(size)
+
+
+@dataclass
+class Selection:
+    paths: List[str]                    # 보낼 사진 (제출 순서 유지)
+    numbers: List[int]
+    hashes: List[Optional[PhotoHashes]]
+    max_edge: int
+    est_bytes: int
+    est_tokens: int
+    dropped: List[Dict[str, Any]] = field(default_factory=list)   # {"index", "path", "reason"}
+    ranking: List[Dict[str, Any]] = field(default_factory=list)   # 점수 내역 (고른 순서)
+
+
+_probe_memo: Dict[Tuple[str, int, int, PrepSettings, int], Tuple[int, Tuple[int, int]]] = {}
+_probe_lock = threading.Lock()
+
+
+def probe_encode(path: str, settings: PrepSettings, edge: int) -> Tuple[int, Tuple[int, int]]:
+    """
+    긴 변 edge로 줄여 인코딩했을 때의 (바이트, 크기). 예산 계산용이라 디스크에 남기지 않고,
+    JPEG는 draft로 축소 디코딩해서 큰 사진도 빠르게 잰다. 열 수 없는 파일은 원본 크기.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, settings, edge)
+    with _probe_lock:
+        if key in _probe_memo:
+            return _probe_memo[key]
+    try:
+        with Image.open(path) as im:
+            im.draft("RGB", (edge, edge))
+            im = ImageOps.exif_transpose(im).convert("RGB")
+            im.thumbnail((edge, edge), Image.LANCZOS)
+            buf = io.BytesIO()
+            im.save(buf, format=settings.fmt, quality=settings.quality, optimize=True)
+            out = (len(buf.getvalue()), im.size)
+    except Exception:
+        out = (stat.st_size, (0, 0))
+    with _probe_lock:
+        if len(_probe_memo) > 1024:
+            _probe_memo.clear()
+        _probe_memo[key] = out
+    return out
+
+
+def make_candidate(number: int, path: str, h: Optional[PhotoHashes], settings: PrepSettings,
+                   probe_edge: int = PHOTO_SELECT_MIN_EDGE, label: Optional[str] = None,
+                   words: Sequence[str] = ()) -> Candidate:
+    report = screen_photo(path)
+    size = tuple(report.metrics.get("size") or (0, 0))
+    blur = float(report.metrics.get("blur_var") or 0.0)
+    sharp = min(1.0, math.log1p(blur) / math.log1p(_SHARP_FULL))
+    probe_bytes, probe_size = probe_encode(path, settings, min(settings.max_edge, probe_edge))
+    rel = relevance(label if label is not None else path, words)
+    return Candidate(number, path, h, size, round(sharp, 4), rel, probe_bytes, probe_size)
+
+
+def _novelty(c: Candidate, chosen: List[Candidate]) -> Tuple[float, int]:
+    """(새로움 점수, 가장 가까운 고른 사진과의 거리). 해시가 없으면 새롭다고 본다"""
+    if c.hashes is None:
+        return 1.0, 64
+    d = min((distance(c.hashes, o.hashes) for o in chosen if o.hashes is not None), default=64)
+    return min(1.0, d / _NOVEL_FULL), d
+
+
+def rank(cands: List[Candidate]) -> Tuple[List[Candidate], List[Candidate], List[Dict[str, Any]]]:
+    """(고른 순서, 이미 고른 사진과 거의 같아서 뺀 사진, 점수 내역)"""
+    left = list(cands)
+    order: List[Candidate] = []
+    dups: List[Candidate] = []
+    scores: List[Dict[str, Any]] = []
+    while left:
+        best, best_key, best_info = None, None, None
+        for c in left:
+            novel, d = _novelty(c, order)
+            score = _W_SHARP * c.sharpness + _W_NOVEL * novel + _W_RELEVANT * c.relevance
+            key = (round(score, 6), -c.number)
+            if best_key is None or key > best_key:
+                best, best_key, best_info = c, key, {"distance": d, "novelty": round(novel, 3)}
+        left.remove(best)
+        if order and best_info["distance"] <= SAME_PHOTO_DISTANCE:
+            dups.append(best)
+            continue
+        order.append(best)
+        scores.append({
+            "index": best.number,
+            "score": best_key[0],
+            "sharpness": best.sharpness,
+            "relevance": best.relevance,
+            **best_info,
+        })
+    return order, dups, scores
+
+
+def _fits(total: Tuple[int, int], max_bytes: int, max_tokens: int) -> bool:
+    return (max_bytes <= 0 or total[0] <= max_bytes) and (max_tokens <= 0 or total[1] <= max_tokens)
+
+
+def _total(cands: Sequence[Candidate], edge: int) -> Tuple[int, int]:
+    costs = [c.cost(edge) for c in cands]
+    return sum(b for b, _ in costs), sum(t for _, t in costs)
+
+
+def select_photos(
+    paths: List[str],
+    numbers: List[int],
+    hashes: List[Optional[PhotoHashes]],
+    settings: PrepSettings,
+    keep_all: bool = False,
+    max_bytes: int = PHOTO_SELECT_MAX_BYTES,
+    max_tokens: int = PHOTO_SELECT_MAX_TOKENS,
+    min_edge: int = PHOTO_SELECT_MIN_EDGE,
+    labels: Optional[Sequence[str]] = None,
+    words: Sequence[str] = (),
+) -> Selection:
+    """
+    예산에 맞는 사진/해상도 고르기.
+    keep_all=True면(청소 전후 비교) 사진은 빼지 않고 해상도만 낮춘다.
+    labels: 사진별 관련도용 이름 (paths와 같은 순서, 없으면 경로), words: checklist_words(미션)
+    """
+    labels = list(labels) if labels is not None else list(paths)
+    cands = [
+        make_candidate(n, p, h, settings, min_edge, label, words)
+        for n, p, h, label in zip(numbers, paths, hashes, labels)
+    ]
+    if keep_all:
+        order, dups, scores = cands, [], []
+    else:
+        order, dups, scores = rank(cands)
+    dropped = [{"index": c.number, "path": c.path, "reason": "다른 사진과 거의 같음"} for c in dups]
+
+    top = settings.max_edge
+    edges = [top] + [e for e in EDGE_STEPS if min_edge <= e < top]
+    edge = edges[-1]
+    for e in edges:
+        if _fits(_total(order, e), max_bytes, max_tokens):
+            edge = e
+            break
+    else:
+        # 가장 낮은 해상도로도 넘치면 점수 낮은 사진부터 뺀다 (최소 1장은 보냄)
+        keep = 1
+        while not keep_all and keep < len(order) and _fits(_total(order[:keep + 1], edge), max_bytes, max_tokens):
+            keep += 1
+        if not keep_all:
+            dropped += [{"index": c.number, "path": c.path, "reason": "용량 예산 초과"} for c in order[keep:]]
+            order = order[:keep]
+
+    kept = sorted(order, key=lambda c: c.number)
+    est_bytes, est_tokens = _total(kept, edge)
+    return Selection(
+        paths=[c.path for c in kept],
+        numbers=[c.number for c in kept],
+        hashes=[c.hashes for c in kept],
+        max_edge=edge,
+        est_bytes=est_bytes,
+        est_tokens=est_tokens,
+        dropped=sorted(dropped, key=lambda d: d["index"]),
+        ranking=scores,
+    )
@@ -0,0 +1,96 @@
+import os
+import json
+import copy
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+
+# =========================================================
+# 판정 정책 설정 (예전 POLICY_TEXT 문자열을 대신함)
+# - 카테고리별: 사진 안내문, 통과 기준(%), 항목 상태별 점수, 항목 가중치(키워드)
+# - 기본값은 아래 DEFAULT_POLICY, POLICY_CONFIG_PATH(JSON)가 있으면 그 값으로 덮어씀
+# - 프롬프트에 들어가는 정책 문구와 로컬 채점(scoring)이 같은 설정을 쓴다
+# =========================================================
+logger = logging.getLogger(__name__)
+
+POLICY_CONFIG_PATH = os.getenv("POLICY_CONFIG_PATH", "")
+
+# 사진 단계에서 체크리스트 항목마다 매기는 상태
+ITEM_STATUSES = ("done", "partial", "missing", "unclear")
+
+DEFAULT_POLICY: Dict[str, Any] = {
+    "pass_threshold": 60.0,
+    "status_scores": {"done": 1.0, "partial": 0.5, "missing": 0.0, "unclear": 0.0},
+    "categories": {
+        "청소": {
+            "rule": "before/after 2장 권장 (정확히 2장이면 비교모드)",
+        },
+        "숙제": {
+            "rule": "결과 사진만으로 평가",
+        },
+        "습관": {
+            "rule": "증거가 약하면 보수적 판정 + 부모 확인 권장",
+            # 증거가 약한 부분 달성은 점수를 덜 준다
+            "status_scores": {"partial": 0.25},
+        },
+    },
+    # 체크리스트 항목 문구에 match가 들어 있으면 weight 적용 (기본 1.0)
+    # 예: {"match": "정리", "weight": 2.0}
+    "item_weights": [],
+}
+
+
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    out = copy.deepcopy(base)
+    for k, v in override.items():
+        if isinstance(v, dict) and isinstance(out.get(k), dict):
+            out[k] = _merge(out[k], v)
+        else:
+            out[k] = copy.deepcopy(v)
+    return out
+
+
+def load_policy(path: Optional[str] = POLICY_CONFIG_PATH) -> Dict[str, Any]:
+    if not path or not os.path.exists(path):
+        return copy.deepcopy(DEFAULT_POLICY)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            override = json.load(f)
+    except (OSError, ValueError):
+        logger.exception("policy: %s 읽기 실패 → 기본 정책 사용", path)
+        return copy.deepcopy(DEFAULT_POLICY)
+    return _merge(DEFAULT_POLICY, override if isinstance(override, dict) else {})
+
+
+def category_policy(policy: Dict[str, Any], category: str) -> Dict[str, Any]:
+    """공통 설정 위에 카테고리 설정을 덮어쓴 결과"""
+    cat = (policy.get("categories") or {}).get(category, {})
+    return {
+        "rule": cat.get("rule", ""),
+        "pass_threshold": float(cat.get("pass_threshold", policy.get("pass_threshold", 60.0))),
+        "status_scores": {**policy.get("status_scores", {}), **cat.get("status_scores", {})},
+        "item_weights": list(cat.get("item_weights", [])) + list(policy.get("item_weights", [])),
+    }
+
+
+def policy_text(policy: Dict[str, Any]) -> str:
+    """프롬프트용 정책 문구"""
+    lines = [f"- {name}: {cat.get('rule', '')}" for name, cat in (policy.get("categories") or {}).items()]
+    thresholds = {
+        name: category_policy(policy, name)["pass_threshold"] for name in (policy.get("categories") or {})
+    }
+    base = float(policy.get("pass_threshold", 60.0))
+    lines.append(f"- 통과 기준: {base:g}%")
+    for name, th in thresholds.items():
+        if th != base:
+            lines.append(f"  - {name}: {th:g}%")
+    return "\n".join(lines)
+
+
+def policy_version(policy: Dict[str, Any]) -> str:
+    raw = json.dumps(policy, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+POLICY = load_policy()
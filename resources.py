@@ -0,0 +1,112 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from judge_engine import build_llm
+from key_validation import key_fingerprint
+from llm_client import ChatLike, LLMClient
+from model_router import ModelRouter, build_router, load_config
+from structured_output import json_mode
+
+
+# =========================================================
+# 프로세스 공용 리소스 레지스트리
+# - chat model / LLMClient는 (키 지문, 모델명)당 1개만 만들어 모든 세션이 공유
+# - AgentExecutor는 agent 경로를 실제로 쓸 때 처음 한 번만 생성
+# - 세션(st.session_state)에는 객체를 두지 않고 api_key만 둔다
+# - MODEL_ROUTER_CONFIG가 있으면 단계별 호출은 키당 1개의 모델 라우터(model_router)로
+# 모듈 전역이라 Streamlit rerun/세션이 바뀌어도 프로세스가 살아 있는 동안 유지됨
+# =========================================================
+MAX_CREDENTIALS = int(os.getenv("RESOURCE_MAX_CREDENTIALS", "64"))
+ROUTER_CONFIG = load_config()
+
+
+class _Entry:
+    def __init__(self, chat: Any, client: LLMClient):
+        self.chat = chat
+        self.client = client
+        self.agent_executor: Any = None
+        self.lock = threading.Lock()
+
+
+class ResourceRegistry:
+    def __init__(
+        self,
+        max_entries: int = MAX_CREDENTIALS,
+        factory: Callable[..., Any] = build_llm,
+        router_config: Optional[Dict[str, Any]] = ROUTER_CONFIG,
+    ):
+        self.max_entries = max_entries
+        self.factory = factory
+        self.router_config = router_config
+        self._entries: "OrderedDict[Tuple[str, str, Optional[str]], _Entry]" = OrderedDict()
+        self._routers: "OrderedDict[str, ModelRouter]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, api_key: str, model_name: str, base_url: Optional[str] = None) -> _Entry:
+        key = (key_fingerprint(api_key), model_name, base_url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+            # 재시도는 LLMClient가 하므로 chat model 자체는 max_retries=0
+            chat = self.factory(api_key, model_name=model_name, base_url=base_url, max_retries=0)
+            # 단계별 호출은 JSON 모드, agent는 원래 chat model 그대로
+            entry = _Entry(chat, LLMClient(json_mode(chat)))
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def chat_model(self, api_key: str, model_name: str, base_url: Optional[str] = None) -> Any:
+        return self._entry(api_key, model_name, base_url).chat
+
+    def client(self, api_key: str, model_name: str, base_url: Optional[str] = None) -> LLMClient:
+        return self._entry(api_key, model_name, base_url).client
+
+    def router(self, api_key: str) -> Optional[ModelRouter]:
+        """라우터 설정이 없으면 None. 백엔드별 지연/오류 통계는 같은 키의 세션끼리 공유"""
+        if not self.router_config:
+            return None
+        key = key_fingerprint(api_key)
+        with self._lock:
+            router = self._routers.get(key)
+            if router is None:
+                router = build_router(api_key, self.router_config)
+                self._routers[key] = router
+                while len(self._routers) > self.max_entries:
+                    self._routers.popitem(last=False)
+            self._routers.move_to_end(key)
+            return router
+
+    def llm(self, api_key: str, model_name: str, base_url: Optional[str] = None) -> ChatLike:
+        """단계별 판정 호출에 넘길 llm: 라우터가 설정돼 있으면 라우터, 아니면 (키, 모델)의 LLMClient"""
+        router = self.router(api_key)
+        return router if router is not None else self.client(api_key, model_name, base_url)
+
+    def agent_executor(
+        self,
+        api_key: str,
+        model_name: str,
+        build: Callable[[Any], Any],
+        base_url: Optional[str] = None,
+    ) -> Any:
+        entry = self._entry(api_key, model_name, base_url)
+        with entry.lock:
+            if entry.agent_executor is None:
+                entry.agent_executor = build(entry.chat)
+            return entry.agent_executor
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "credentials": len(self._entries),
+                "routers": len(self._routers),
+                "agent_executors": sum(1 for e in self._entries.values() if e.agent_executor is not None),
+            }
+
+
+registry = ResourceRegistry()
@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import tempfile
+from typing import List, Optional, MutableMapping
+
+from upload_store import digest_for
+
+
+# =========================================================
+# 분석/판정 결과 캐시 (내용 주소 기반)
+# - 키 = sha256(단계, 카테고리, 미션 JSON, 사진 바이트(순서대로), 프롬프트 버전, ...)
+# - 1차: session_state 딕셔너리 / 2차: 로컬 디스크(.cache/results/<key>.json)
+# - 입력이 실제로 바뀔 때만 LLM을 다시 호출하기 위함
+# =========================================================
+CACHE_DIR = os.path.join(".cache", "results")
+_CHUNK = 1024 * 1024
+
+
+def _update_field(h, data: bytes) -> None:
+    # 길이를 같이 넣어서 필드 경계가 섞이지 않게 함 ("ab"+"c" != "a"+"bc")
+    h.update(len(data).to_bytes(8, "big"))
+    h.update(data)
+
+
+def _update_file(h, path: str) -> None:
+    digest = digest_for(path)
+    if digest is not None:
+        # 업로드 저장소 파일은 이름이 곧 내용 해시 → 다시 읽지 않음
+        _update_field(h, ("sha256:" + digest).encode("utf-8"))
+        return
+    try:
+        size = os.path.getsize(path)
+        h.update(size.to_bytes(8, "big"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                h.update(chunk)
+    except OSError:
+        # 읽을 수 없는 파일은 경로만 반영 (다음에 파일이 생기면 키가 달라짐)
+        _update_field(h, ("missing:" + path).encode("utf-8"))
+
+
+def result_key(
+    kind: str,
+    category: str,
+    mission_json: Optional[str],
+    photo_paths: List[str],
+    prompt_version: str,
+    *extra: Optional[str],
+) -> str:
+    """
+    결과 캐시 키 생성.
+    사진은 경로가 아니라 파일 내용으로 해시하므로, 같은 경로의 파일이 바뀌면 키도 바뀐다.
+    """
+    h = hashlib.sha256()
+    for field in (kind, category, mission_json or "", prompt_version):
+        _update_field(h, field.encode("utf-8"))
+
+    h.update(len(photo_paths).to_bytes(4, "big"))
+    for p in photo_paths:
+        _update_file(h, p)
+
+    for field in extra:
+        _update_field(h, (field or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    session_state(메모리) + 디스크 2단 캐시.
+    값은 tool 반환값 그대로(JSON 문자열)를 저장한다.
+    """
+
+    def __init__(self, memory: Optional[MutableMapping[str, str]] = None, root: str = CACHE_DIR):
+        self.memory = memory if memory is not None else {}
+        self.root = root
+
+    def path(self, key: str) -> str:
+        """key의 디스크 파일 경로 (파일이 없을 수도 있음)"""
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[str]:
+        if key in self.memory:
+            return self.memory[key]
+
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+            json.loads(value)  # 깨진 파일이면 캐시 미스로 처리
+        except (OSError, ValueError):
+            return None
+
+        self.memory[key] = value
+        return value
+
+    def put(self, key: str, value: str, overwrite: bool = True) -> None:
+        """
+        overwrite=False: 디스크에 이미 있으면 다시 쓰지 않고 수정 시각만 갱신
+        (키가 내용 해시라 같은 키 = 같은 값인 경우. 수정 시각은 디스크 정리의 나이 기준)
+        """
+        self.memory[key] = value
+
+        path = self.path(key)
+        if not overwrite:
+            try:
+                os.utime(path)
+                return
+            except OSError:
+                pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 임시 파일에 쓰고 rename → 동시에 읽는 쪽이 반쯤 쓰인 파일을 보지 않음
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(value)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from tracing import traced
+
+
+# =========================================================
+# 판정 결과 저장소 (SQLite, WAL 모드)
+# - 기록 단위: (session_id, mission_id, kind) — kind: mission / photo / grade
+# - 추가 전용(append-only): 같은 미션을 다시 판정해도 덮어쓰지 않고 새 줄을 쌓는다
+# - 한 번의 INSERT = 한 트랜잭션이라 반쯤 쓰인 기록을 읽는 일이 없음
+# - 여러 세션/프로세스가 동시에 써도 WAL + busy_timeout으로 직렬화
+# =========================================================
+STORE_PATH = os.getenv("RESULT_STORE_PATH", os.path.join("outputs", "results.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id  TEXT NOT NULL,
+    mission_id  TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    payload     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_mission ON records (session_id, mission_id, kind, id);
+CREATE INDEX IF NOT EXISTS idx_records_kind_time ON records (kind, created_at);
+"""
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class ResultStore:
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 연결은 스레드 간 공유하지 않음 → 스레드마다 1개
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @traced("store.append")
+    def append(self, session_id: str, mission_id: str, kind: str, obj: Any) -> int:
+        payload = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO records (session_id, mission_id, kind, created_at, payload) VALUES (?, ?, ?, ?, ?)",
+                (session_id, mission_id, kind, time.time(), payload),
+            )
+        return int(cur.lastrowid)
+
+    def latest(self, session_id: str, mission_id: str, kind: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT payload FROM records WHERE session_id = ? AND mission_id = ? AND kind = ? "
+            "ORDER BY id DESC LIMIT 1",
+            (session_id, mission_id, kind),
+        ).fetchone()
+        return json.loads(row["payload"]) if row else None
+
+    def history(
+        self,
+        session_id: Optional[str] = None,
+        kind: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        where, args = [], []
+        if session_id is not None:
+            where.append("session_id = ?")
+            args.append(session_id)
+        if kind is not None:
+            where.append("kind = ?")
+            args.append(kind)
+        if since is not None:
+            where.append("created_at >= ?")
+            args.append(since)
+        sql = "SELECT id, session_id, mission_id, kind, created_at, payload FROM records"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+
+        return [
+            {
+                "id": r["id"],
+                "session_id": r["session_id"],
+                "mission_id": r["mission_id"],
+                "kind": r["kind"],
+                "created_at": r["created_at"],
+                "data": json.loads(r["payload"]),
+            }
+            for r in self._conn().execute(sql, args)
+        ]
+
+
+_store: Optional[ResultStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ResultStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultStore()
+        return _store
@@ -0,0 +1,110 @@
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from policy import category_policy
+
+
+# =========================================================
+# 로컬 채점 (GRADE_MODE=rules)
+# 사진 단계가 체크리스트 항목별로 준 상태(done/partial/missing/unclear)+근거만으로
+# 완수율/통과 여부/근거/부족한 점을 계산한다. 같은 입력이면 항상 같은 점수.
+#   완수율 = Σ(가중치 × 상태 점수) / Σ가중치 × 100
+# =========================================================
+_STATUS_ALIASES = {
+    "done": "done", "complete": "done", "completed": "done", "yes": "done", "달성": "done", "완료": "done",
+    "partial": "partial", "부분": "partial",
+    "missing": "missing", "no": "missing", "not_done": "missing", "미달": "missing", "미완료": "missing",
+    "unclear": "unclear", "unknown": "unclear", "불명확": "unclear", "판독 불가": "unclear",
+}
+
+_STATUS_LABELS = {"done": "달성", "partial": "부분", "missing": "미달", "unclear": "불명확"}
+
+
+def normalize_status(value: Any) -> str:
+    s = str(value or "").strip().lower()
+    return _STATUS_ALIASES.get(s, "unclear")
+
+
+def _norm(text: str) -> str:
+    s = unicodedata.normalize("NFKC", str(text or "")).lower()
+    return re.sub(r"[\W_]+", "", s)
+
+
+def item_weight(item: str, weights: List[Dict[str, Any]]) -> float:
+    for w in weights:
+        if w.get("match") and str(w["match"]) in item:
+            return float(w.get("weight", 1.0))
+    return 1.0
+
+
+def match_items(checklist: List[str], reported: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    체크리스트 항목 ↔ 사진 단계가 돌려준 항목 대응.
+    문구가 같으면(정규화 기준) 그 항목, 아니면 아직 안 쓰인 같은 순서의 항목, 없으면 None(불명확 처리).
+    """
+    out: List[Optional[Dict[str, Any]]] = [None] * len(checklist)
+    used = set()
+    for i, item in enumerate(checklist):
+        for j, r in enumerate(reported):
+            if j not in used and _norm(r.get("item", "")) == _norm(item):
+                out[i] = r
+                used.add(j)
+                break
+    for i in range(len(checklist)):
+        if out[i] is None and i < len(reported) and i not in used:
+            out[i] = reported[i]
+            used.add(i)
+    return out
+
+
+def score_mission(mission_obj: Dict[str, Any], photo_obj: Dict[str, Any], policy: Dict[str, Any]) -> Dict[str, Any]:
+    """GRADE_SCHEMA와 같은 모양의 판정 dict"""
+    cat = category_policy(policy, str(mission_obj.get("category") or ""))
+    scores = cat["status_scores"]
+
+    checklist = [str(c.get("item", "")) if isinstance(c, dict) else str(c) for c in mission_obj.get("checklist", [])]
+    checklist = [c for c in checklist if c.strip()]
+    reported = [r for r in photo_obj.get("items", []) if isinstance(r, dict)]
+
+    reasons: List[str] = []
+    missing: List[str] = []
+    requests: List[str] = []
+    item_scores: List[Dict[str, Any]] = []
+    total_w = earned = 0.0
+
+    for item, r in zip(checklist, match_items(checklist, reported)):
+        status = normalize_status(r.get("status")) if r else "unclear"
+        evidence = str(r.get("evidence") or "").strip() if r else ""
+        w = item_weight(item, cat["item_weights"])
+        s = float(scores.get(status, 0.0))
+        total_w += w
+        earned += w * s
+        item_scores.append({"item": item, "status": status, "score": s, "weight": w, "evidence": evidence})
+
+        label = _STATUS_LABELS[status]
+        if status in ("done", "partial"):
+            reasons.append(f"{item}: {label}" + (f" — {evidence}" if evidence else ""))
+        if status != "done":
+            missing.append(f"{item}: {label}" + (f" — {evidence}" if evidence else " — 사진에서 확인되지 않음"))
+            if status == "unclear":
+                requests.append(f"'{item}'이(가) 잘 보이게 다시 찍어서 보내주세요.")
+            else:
+                requests.append(f"'{item}'을(를) 마저 하고 사진을 보내주세요.")
+
+    cp = round(earned / total_w * 100.0, 1) if total_w else 0.0
+    if not checklist:
+        missing.append("체크리스트가 비어 있어 채점할 수 없음")
+    for c in photo_obj.get("caveats", [])[:3]:
+        missing.append(f"사진 분석 한계: {c}")
+
+    return {
+        "completion_percent": cp,
+        "pass": bool(cp >= cat["pass_threshold"]),
+        "reason_summary": reasons,
+        "missing_or_unclear": missing,
+        "next_request_to_child": requests,
+        "item_scores": item_scores,
+        "pass_threshold": cat["pass_threshold"],
+        "scoring": "rules",
+    }
@@ -0,0 +1,272 @@
+import os
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, MutableMapping, Optional, Set
+
+from result_cache import ResultCache
+from tracing import STATS, add_metrics_source
+
+
+# =========================================================
+# 세션 상태 경량화 (session_state에는 핸들만)
+# - 미션/사진 분석/판정 JSON처럼 큰 값은 내용 해시(sha256)를 핸들로 공용 저장소에 두고,
+#   session_state에는 핸들 문자열만 남긴다
+#   1차: 프로세스 공용 LRU 메모리(바이트 상한) / 2차: 디스크(.cache/payloads, ResultCache 형식)
+# - 결과 캐시(ResultCache)의 메모리 계층도 세션별 dict 대신 같은 LRU를 쓴다
+#   → 세션 수와 상관없이 메모리 사용량 상한이 고정
+# - 세션마다 마지막 실행 시각과 쓰는 핸들을 기록하고, SESSION_IDLE_S 동안 조용한 세션은
+#   그 세션만 쓰던 값을 메모리에서 내린다 (디스크에는 남으므로 다시 들어오면 그대로 이어짐)
+# - 같은 정리 주기에 디스크(.cache/payloads)도 SESSION_PAYLOAD_MAX_AGE_S보다 오래됐거나
+#   SESSION_PAYLOAD_MAX_BYTES를 넘는 만큼 오래된 파일부터 지운다 (활성 세션이 쓰는 핸들은 남김)
+# - memory_gauge(): RSS / LRU 사용량 / 활성 세션 수 → 사이드바와 /metrics
+# =========================================================
+SESSION_MEMORY_MAX_BYTES = int(os.getenv("SESSION_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_IDLE_S = float(os.getenv("SESSION_IDLE_S", "1800"))
+SESSION_PAYLOAD_MAX_BYTES = int(os.getenv("SESSION_PAYLOAD_MAX_BYTES", str(512 * 1024 * 1024)))
+SESSION_PAYLOAD_MAX_AGE_S = float(os.getenv("SESSION_PAYLOAD_MAX_AGE_S", str(7 * 24 * 3600)))
+PAYLOAD_DIR = os.path.join(".cache", "payloads")
+
+# 유휴 세션 정리는 이 간격(초)보다 자주 돌리지 않음
+_SWEEP_INTERVAL_S = 60.0
+
+
+def current_rss() -> int:
+    """현재 RSS(바이트). /proc/self/statm이 없으면 프로세스 최대 RSS"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * (os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LRUMemory(MutableMapping):
+    """
+    바이트 상한이 있는 str 값 LRU (스레드 안전).
+    ResultCache의 memory로 그대로 넘길 수 있다. 상한을 넘으면 오래 안 쓴 값부터 버린다(디스크 값은 그대로).
+    """
+
+    def __init__(self, max_bytes: int = SESSION_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def __getitem__(self, key: str) -> str:
+        with self._lock:
+            value = self._data[key]
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: str, value: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._size(key, self._data.pop(key))
+            self._data[key] = value
+            self.nbytes += self._size(key, value)
+            # 방금 넣은 값 하나는 상한보다 커도 남긴다
+            while self.nbytes > self.max_bytes and len(self._data) > 1:
+                old_key, old = self._data.popitem(last=False)
+                self.nbytes -= self._size(old_key, old)
+                self.evictions += 1
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            self.nbytes -= self._size(key, self._data.pop(key))
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class PayloadStore:
+    """JSON 문자열 ↔ 핸들(sha256). 같은 내용이면 같은 핸들이라 세션끼리 저장 공간을 공유한다"""
+
+    def __init__(
+        self,
+        memory: MutableMapping[str, str],
+        root: str = PAYLOAD_DIR,
+        max_bytes: int = SESSION_PAYLOAD_MAX_BYTES,
+        max_age_s: float = SESSION_PAYLOAD_MAX_AGE_S,
+    ):
+        self.memory = memory
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.disk_bytes = 0
+        self.disk_evictions = 0
+        self._cache = ResultCache(memory, root)
+
+    def put(self, text: str) -> str:
+        handle = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        # 같은 내용이 이미 디스크에 있으면 다시 쓰지 않음 (수정 시각만 갱신 → 정리 대상에서 뒤로)
+        self._cache.put(handle, text, overwrite=False)
+        return handle
+
+    def get(self, handle: Optional[str]) -> Optional[str]:
+        """없는 핸들(디스크에서 지워진 경우 등)이면 None"""
+        return self._cache.get(handle) if handle else None
+
+    def prune(self, keep: Iterable[str] = (), now: Optional[float] = None) -> int:
+        """
+        디스크 계층 정리 → 지운 파일 수.
+        max_age_s(0이면 끔)보다 오래된 파일, 그다음 합계가 max_bytes(0이면 끔)를 넘는 만큼 오래된 것부터.
+        keep(활성 세션이 쓰는 핸들)은 지우지 않는다.
+        """
+        now = time.time() if now is None else now
+        keep = set(keep)
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                handle, ext = os.path.splitext(name)
+                if ext != ".json":
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, handle, path))
+        files.sort()
+
+        total = sum(size for _, size, _, _ in files)
+        removed = 0
+        for mtime, size, handle, path in files:
+            expired = self.max_age_s > 0 and now - mtime > self.max_age_s
+            over = self.max_bytes > 0 and total > self.max_bytes
+            if not (expired or over):
+                # 오래된 순이라 이후 파일은 만료도 아님 (용량은 이미 상한 안)
+                break
+            if handle in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.memory.pop(handle, None)
+            total -= size
+            removed += 1
+        self.disk_bytes = total
+        self.disk_evictions += removed
+        return removed
+
+
+class SessionTracker:
+    """세션별 마지막 실행 시각 + 쓰는 핸들. 유휴 세션의 메모리 정리 + payloads 디스크 정리 담당"""
+
+    def __init__(
+        self,
+        memory: MutableMapping[str, str],
+        idle_s: float = SESSION_IDLE_S,
+        payloads: Optional[PayloadStore] = None,
+    ):
+        self.memory = memory
+        self.idle_s = idle_s
+        self.payloads = payloads
+        self.evicted = 0
+        self._seen: Dict[str, float] = {}
+        self._handles: Dict[str, Set[str]] = {}
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def touch(self, session_id: str, handles: Iterable[Optional[str]] = (), now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._seen[session_id] = now
+            self._handles[session_id] = {h for h in handles if h}
+            due = now - self._last_sweep >= _SWEEP_INTERVAL_S
+        if due:
+            self.evict_idle(now)
+
+    def evict_idle(self, now: Optional[float] = None) -> List[str]:
+        """idle_s 넘게 조용한 세션 정리 → 정리한 session_id 목록"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._last_sweep = now
+            idle = [sid for sid, t in self._seen.items() if now - t > self.idle_s]
+            dropped: Set[str] = set()
+            for sid in idle:
+                del self._seen[sid]
+                dropped |= self._handles.pop(sid, set())
+            # 다른 활성 세션도 쓰는 값은 남긴다
+            in_use: Set[str] = set().union(*self._handles.values())
+            dropped -= in_use
+            self.evicted += len(idle)
+        for handle in dropped:
+            self.memory.pop(handle, None)
+        for sid in idle:
+            STATS.forget(sid)
+        if self.payloads is not None:
+            self.payloads.prune(in_use, now)
+        return idle
+
+    def active(self) -> int:
+        with self._lock:
+            return len(self._seen)
+
+
+_memory = LRUMemory()
+_payloads = PayloadStore(_memory)
+_sessions = SessionTracker(_memory, payloads=_payloads)
+
+
+def memory_tier() -> LRUMemory:
+    """세션 공용 메모리 계층 (ResultCache(memory_tier())로 결과 캐시에도 사용)"""
+    return _memory
+
+
+def get_payloads() -> PayloadStore:
+    return _payloads
+
+
+def get_sessions() -> SessionTracker:
+    return _sessions
+
+
+def memory_gauge() -> Dict[str, Any]:
+    return {
+        "rss_bytes": current_rss(),
+        "lru_bytes": _memory.nbytes,
+        "lru_max_bytes": _memory.max_bytes,
+        "lru_entries": len(_memory),
+        "lru_evictions": _memory.evictions,
+        "active_sessions": _sessions.active(),
+        "evicted_sessions": _sessions.evicted,
+        "payload_disk_bytes": _payloads.disk_bytes,
+        "payload_disk_evictions": _payloads.disk_evictions,
+    }
+
+
+def prometheus_text() -> str:
+    g = memory_gauge()
+    rows = [
+        ("judge_process_rss_bytes", "프로세스 RSS", g["rss_bytes"]),
+        ("judge_session_store_bytes", "세션 공용 LRU 메모리 사용량", g["lru_bytes"]),
+        ("judge_session_store_entries", "세션 공용 LRU 항목 수", g["lru_entries"]),
+        ("judge_active_sessions", "최근 SESSION_IDLE_S 안에 실행된 세션 수", g["active_sessions"]),
+        ("judge_payload_disk_bytes", "세션 값 디스크 계층(.cache/payloads) 크기 (마지막 정리 기준)", g["payload_disk_bytes"]),
+    ]
+    out = []
+    for name, help_text, value in rows:
+        out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(out) + "\n"
+
+
+add_metrics_source(prometheus_text)
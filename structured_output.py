@@ -0,0 +1,306 @@
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_openai import ChatOpenAI
+
+
+# =========================================================
+# 모델 출력 → 구조화 JSON
+# 1) JSON 모드: 지원하는 모델(ChatOpenAI)은 response_format=json_object 로 요청
+# 2) 복구: 코드펜스/앞뒤 설명/꼬리 쉼표/파이썬 리터럴/잘린 출력(닫는 괄호 누락) 보정
+# 3) 스키마 검증: 미션/사진/판정 객체의 필수 키/타입 확인 및 보정 ("75%" → 75.0 등)
+# 4) 그래도 실패하면 이미지 없이 "이 JSON 고쳐줘" 짧은 호출 1번 (전체 멀티모달 재요청 안 함)
+# =========================================================
+logger = logging.getLogger(__name__)
+
+STRUCTURED_JSON_MODE = os.getenv("STRUCTURED_JSON_MODE", "1") == "1"
+
+# ---------- 스키마 ----------
+# 타입 표기: str / float / bool / [원소타입] / {"키": 타입}
+# required: 없으면 검증 실패로 보고 수정 호출 대상
+MISSION_SCHEMA: Dict[str, Any] = {
+    "name": "mission",
+    "required": ("checklist",),
+    "fields": {
+        "category": str,
+        "details_raw": str,
+        "mission_summary": str,
+        "checklist": [{"item": str}],
+    },
+}
+
+PHOTO_SCHEMA: Dict[str, Any] = {
+    "name": "photo",
+    "required": ("observations",),
+    "fields": {
+        "mode": str,
+        "observations": [str],
+        "notable_changes": [str],
+        "caveats": [str],
+        "items": [{"item": str, "status": str, "evidence": str}],
+    },
+}
+
+GRADE_SCHEMA: Dict[str, Any] = {
+    "name": "grade",
+    "required": ("completion_percent",),
+    "fields": {
+        "completion_percent": float,
+        "pass": bool,
+        "reason_summary": [str],
+        "missing_or_unclear": [str],
+        "next_request_to_child": [str],
+    },
+}
+
+# 사진 분석 + 판정을 한 번에 (PIPELINE_MODE=fused)
+FUSED_SCHEMA: Dict[str, Any] = {
+    "name": "fused",
+    "required": ("observations", "completion_percent"),
+    "fields": {**PHOTO_SCHEMA["fields"], **GRADE_SCHEMA["fields"]},
+}
+
+
+def json_mode(llm: Any) -> Any:
+    """JSON 모드를 지원하는 모델이면 response_format을 붙인 runnable을 돌려준다."""
+    if STRUCTURED_JSON_MODE and isinstance(llm, ChatOpenAI):
+        return llm.bind(response_format={"type": "json_object"})
+    return llm
+
+
+# ---------- 복구 ----------
+def _strip_wrapping(text: str) -> str:
+    s = text.strip()
+    if s.startswith("```"):
+        s = s.split("\n", 1)[1] if "\n" in s else s.strip("`")
+        if s.rstrip().endswith("```"):
+            s = s.rstrip()[:-3]
+    start = s.find("{")
+    if start > 0:
+        s = s[start:]
+    end = s.rfind("}")
+    # 마지막 '}' 뒤의 설명 문장 제거. 뒤가 JSON의 연속(쉼표 등)이면 잘린 출력이므로 그대로 둠
+    tail = s[end + 1:].strip() if end != -1 else ""
+    if tail and not tail.startswith((",", "]", "}", '"', ":")):
+        s = s[:end + 1]
+    return s.strip()
+
+
+def _clean_tokens(s: str) -> str:
+    """문자열 밖의 꼬리 쉼표 제거, True/False/None → true/false/null"""
+    out: List[str] = []
+    i, n = 0, len(s)
+    in_str = esc = False
+    while i < n:
+        ch = s[i]
+        if in_str:
+            out.append(ch)
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            i += 1
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch == ",":
+            j = i + 1
+            while j < n and s[j] in " \t\r\n":
+                j += 1
+            if j < n and s[j] in "}]":
+                i += 1
+                continue
+        else:
+            for py, js in (("True", "true"), ("False", "false"), ("None", "null")):
+                if s.startswith(py, i) and not (i and (s[i - 1].isalnum() or s[i - 1] == "_")):
+                    out.append(js)
+                    i += len(py)
+                    break
+            else:
+                out.append(ch)
+                i += 1
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _close_truncated(s: str) -> Tuple[str, List[int]]:
+    """열린 문자열/괄호를 닫은 문자열과, 잘라낼 수 있는 위치(최상위가 아닌 쉼표)들"""
+    stack: List[str] = []
+    cuts: List[int] = []
+    in_str = esc = False
+    for i, ch in enumerate(s):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+        elif ch == "," and stack:
+            cuts.append(i)
+
+    closed = s + ('"' if in_str else "")
+    closed = closed.rstrip().rstrip(",")
+    if closed.endswith(":"):
+        closed += " null"
+    closed += "".join("}" if c == "{" else "]" for c in reversed(stack))
+    return closed, cuts
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """복구 가능한 범위에서 파싱. 실패하면 None."""
+    if not text or not text.strip():
+        return None
+    s = _clean_tokens(_strip_wrapping(text))
+    try:
+        return json.loads(s)
+    except ValueError:
+        pass
+
+    # 잘린 출력: 닫아 보고, 안 되면 마지막 원소를 하나씩 버리면서 다시 시도
+    for _ in range(8):
+        closed, cuts = _close_truncated(s)
+        try:
+            return json.loads(_clean_tokens(closed))
+        except ValueError:
+            if not cuts:
+                return None
+            s = s[:cuts[-1]]
+    return None
+
+
+# ---------- 스키마 검증 ----------
+def _coerce(value: Any, spec: Any) -> Tuple[Any, bool]:
+    if spec is str:
+        if isinstance(value, (dict, list)) or value is None:
+            return None, False
+        return str(value), True
+    if spec is float:
+        if isinstance(value, bool):
+            return None, False
+        try:
+            return float(str(value).strip().rstrip("%")), True
+        except (TypeError, ValueError):
+            return None, False
+    if spec is bool:
+        if isinstance(value, bool):
+            return value, True
+        if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+            return value.strip().lower() == "true", True
+        return None, False
+    if isinstance(spec, list):
+        if not isinstance(value, list):
+            value = [value] if value not in (None, "") else []
+        items = []
+        for v in value:
+            coerced, ok = _coerce(v, spec[0])
+            if ok:
+                items.append(coerced)
+        return items, True
+    if isinstance(spec, dict):
+        # {"item": str} 처럼 필드 1개짜리는 문자열만 와도 받아준다
+        if isinstance(value, str) and len(spec) == 1:
+            return {next(iter(spec)): value}, True
+        if not isinstance(value, dict):
+            return None, False
+        out = dict(value)
+        for k, sub in spec.items():
+            if k in out:
+                coerced, ok = _coerce(out[k], sub)
+                if not ok:
+                    return None, False
+                out[k] = coerced
+        return out, True
+    return value, True
+
+
+def validate(obj: Any, schema: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """(보정된 객체, 오류 목록). 오류가 있으면 객체는 None일 수 있음."""
+    if not isinstance(obj, dict):
+        return None, [f"{schema['name']}: 최상위가 객체가 아님"]
+
+    errors: List[str] = []
+    out = dict(obj)
+    for key, spec in schema["fields"].items():
+        if key not in out:
+            if key in schema["required"]:
+                errors.append(f"{key}: 없음")
+            continue
+        coerced, ok = _coerce(out[key], spec)
+        if ok:
+            out[key] = coerced
+        elif key in schema["required"]:
+            errors.append(f"{key}: 타입 오류")
+        else:
+            del out[key]
+    return out, errors
+
+
+def _schema_hint(schema: Dict[str, Any]) -> str:
+    def fmt(spec: Any) -> Any:
+        if spec is str:
+            return "string"
+        if spec is float:
+            return "number"
+        if spec is bool:
+            return "boolean"
+        if isinstance(spec, list):
+            return [fmt(spec[0])]
+        if isinstance(spec, dict):
+            return {k: fmt(v) for k, v in spec.items()}
+        return "any"
+
+    return json.dumps({k: fmt(v) for k, v in schema["fields"].items()}, ensure_ascii=False)
+
+
+def fix_prompt(text: str, schema: Dict[str, Any], errors: List[str]) -> str:
+    return f"""
+아래 텍스트는 JSON으로 파싱되지 않거나 스키마와 맞지 않는다. 내용은 바꾸지 말고 올바른 JSON으로만 고쳐서 출력해라.
+
+[문제]
+{"; ".join(errors) or "JSON 파싱 실패"}
+
+[스키마]
+{_schema_hint(schema)}
+
+[고칠 텍스트]
+{text[:6000]}
+""".strip()
+
+
+def parse_model_json(llm: Any, text: str, schema: Dict[str, Any], allow_fix: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    모델 출력 텍스트 → 스키마에 맞는 dict. 복구 → 검증 → (필요하면) 텍스트 전용 수정 호출 1회.
+    끝내 실패하면 None.
+    """
+    obj, errors = validate(repair_json(text), schema)
+    if obj is not None and not errors:
+        return obj
+
+    if allow_fix and llm is not None:
+        logger.info("structured output: %s 수정 호출 (%s)", schema["name"], errors)
+        try:
+            fixed = llm.invoke(fix_prompt(text, schema, errors)).content
+        except Exception:
+            logger.exception("structured output: 수정 호출 실패")
+            fixed = ""
+        obj2, errors2 = validate(repair_json(fixed), schema)
+        if obj2 is not None and not errors2:
+            return obj2
+
+    # 필수 키가 빠졌어도 파싱된 부분이 있으면 살려서 돌려준다 (호출부에서 기본값 처리)
+    return obj
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm_server import FakeLLMConfig, start_server  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _workdir(tmp_path, monkeypatch):
+    """캐시/사용량 DB(.cache/...)가 저장소를 더럽히지 않게 테스트마다 빈 작업 폴더에서 실행"""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def fake_server():
+    """fake_server(**FakeLLMConfig 인자 또는 cfg=...) → (cfg, base_url). 테스트가 끝나면 서버 종료"""
+    servers = []
+
+    def start(cfg=None, **kwargs):
+        cfg = cfg if cfg is not None else FakeLLMConfig(**kwargs)
+        server = start_server(cfg)
+        servers.append(server)
+        return cfg, f"http://127.0.0.1:{server.server_port}/v1"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
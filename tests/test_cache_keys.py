@@ -0,0 +1,33 @@
+import pytest
+
+import judge_engine
+from judge_engine import grade_cache_key, photo_cache_key
+from token_usage import NORMAL_PLAN, BudgetPlan
+
+MINIMAL = BudgetPlan("minimal", 1.2, 2, 768, True)
+ARGS = ("청소", '{"checklist": [{"item": "바닥 정리"}]}', [])
+
+
+@pytest.fixture
+def over_budget(monkeypatch):
+    """이후 budget_plan()이 예산 초과를 돌려주게 (작업이 토큰을 쓰고 난 뒤의 rerun)"""
+    def use_up():
+        monkeypatch.setattr(judge_engine, "budget_plan", lambda *a, **k: MINIMAL)
+    monkeypatch.setattr(judge_engine, "budget_plan", lambda *a, **k: NORMAL_PLAN)
+    return use_up
+
+
+def test_photo_key_keeps_submitted_plan(over_budget):
+    submitted = photo_cache_key(*ARGS, plan=NORMAL_PLAN)
+    assert photo_cache_key(*ARGS) == submitted
+    over_budget()
+    assert photo_cache_key(*ARGS, plan=NORMAL_PLAN) == submitted
+    assert photo_cache_key(*ARGS) != submitted
+
+
+def test_grade_key_keeps_submitted_plan(over_budget, monkeypatch):
+    monkeypatch.setattr(judge_engine, "GRADE_MODE", "llm")
+    submitted = grade_cache_key(*ARGS, "{}", plan=NORMAL_PLAN)
+    over_budget()
+    assert grade_cache_key(*ARGS, "{}", plan=NORMAL_PLAN) == submitted
+    assert grade_cache_key(*ARGS, "{}") == grade_cache_key(*ARGS, "{}", plan=MINIMAL) != submitted
@@ -0,0 +1,141 @@
+import time
+
+import pytest
+
+import llm_client
+from fake_llm_server import FakeLLMConfig
+from judge_engine import build_llm
+from llm_client import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMCallError, LLMClient, TokenBucket, shared_http_clients
+
+MESSAGES = [("human", "안녕")]
+
+
+class FlakyConfig(FakeLLMConfig):
+    """앞의 fail_first개 요청만 error_status로 실패시키는 설정"""
+
+    def __init__(self, fail_first: int, **kwargs):
+        super().__init__(error_rate=1.0, **kwargs)
+        self.fail_first = fail_first
+
+    def roll(self) -> float:
+        with self.lock:
+            self.requests += 1
+            return 0.0 if self.requests <= self.fail_first else 1.0
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """backoff_delay 호출을 기록하고 기다리지 않게 (attempt 목록)"""
+    calls = []
+
+    def fake(attempt, base=0.5, cap=20.0):
+        calls.append(attempt)
+        return 0.0
+
+    monkeypatch.setattr(llm_client, "backoff_delay", fake)
+    return calls
+
+
+def client_for(base_url, **kwargs):
+    return LLMClient(build_llm("sk-test", base_url=base_url, max_retries=0), **kwargs)
+
+
+def test_server_error_retried_until_max_retries(fake_server, backoffs):
+    cfg, url = fake_server(error_rate=1.0)
+    with pytest.raises(LLMCallError) as info:
+        client_for(url, max_retries=2).invoke(MESSAGES)
+    assert info.value.kind == "server"
+    assert info.value.attempts == 3
+    assert cfg.requests == 3
+    assert backoffs == [0, 1]
+
+
+def test_rate_limit_waits_retry_after(fake_server, backoffs):
+    cfg, url = fake_server(rate_limit_rate=1.0)
+    t0 = time.monotonic()
+    with pytest.raises(LLMCallError) as info:
+        client_for(url, max_retries=2).invoke(MESSAGES)
+    assert info.value.kind == "rate_limit"
+    assert info.value.attempts == 3
+    assert cfg.requests == 3
+    # 429는 retry-after(0.1초) 헤더대로 기다리고 지수 백오프는 쓰지 않음
+    assert backoffs == []
+    assert time.monotonic() - t0 >= 0.2
+
+
+def test_client_error_not_retried(fake_server, backoffs):
+    cfg, url = fake_server(error_rate=1.0, error_status=400)
+    with pytest.raises(LLMCallError) as info:
+        client_for(url, max_retries=3).invoke(MESSAGES)
+    assert info.value.kind == "client"
+    assert info.value.attempts == 1
+    assert cfg.requests == 1
+
+
+def test_recovers_after_transient_errors(fake_server, backoffs):
+    cfg, url = fake_server(FlakyConfig(2, content='{"ok": true}'))
+    resp = client_for(url, max_retries=3).invoke(MESSAGES)
+    assert resp.content == '{"ok": true}'
+    assert cfg.requests == 3
+
+
+def test_stream_retries_before_first_chunk(fake_server, backoffs):
+    cfg, url = fake_server(FlakyConfig(1, content='{"ok": true}'))
+    text = "".join(chunk.content for chunk in client_for(url, max_retries=2).stream(MESSAGES))
+    assert text == '{"ok": true}'
+    assert cfg.requests == 2
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(60, capacity=2)  # 초당 1개
+    assert bucket.wait_time(1) == 0.0
+    bucket.take(2)
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+    # 용량보다 큰 요청은 가득 찼을 때 통과
+    assert bucket.wait_time(10) == pytest.approx(2.0, abs=0.05)
+
+
+def test_scheduler_throttles_to_rpm(fake_server):
+    cfg, url = fake_server()
+    client = client_for(url)
+    client.scheduler.rpm = TokenBucket(600, capacity=1)  # 0.1초에 1회
+    t0 = time.monotonic()
+    for _ in range(4):
+        client.invoke(MESSAGES)
+    assert cfg.requests == 4
+    assert time.monotonic() - t0 >= 0.25
+
+
+def test_timeout_is_retried_then_reported(fake_server, backoffs):
+    _, url = fake_server(latency=0.5, latency_dist="fixed")
+    with pytest.raises(LLMCallError) as info:
+        client_for(url, max_retries=1, timeout=0.1).invoke(MESSAGES)
+    assert info.value.kind == "timeout"
+    assert info.value.attempts == 2
+
+
+def test_interactive_calls_go_ahead_of_batch(fake_server):
+    seen = []
+
+    def responder(req):
+        seen.append(req["messages"][-1]["content"])
+        return '{"ok": true}'
+
+    _, url = fake_server(latency=0.2, latency_dist="fixed", responder=responder)
+    client = client_for(url, max_concurrency=1)
+    batch = client.with_priority(PRIORITY_BATCH)
+
+    first = client.submit([("human", "first")])
+    time.sleep(0.05)  # first가 실행 중인 동안 나머지는 대기열에
+    later = [batch.submit([("human", "batch-1")]), batch.submit([("human", "batch-2")])]
+    later.append(client.submit([("human", "interactive")], PRIORITY_INTERACTIVE))
+    for fut in [first] + later:
+        fut.result(timeout=10)
+    assert seen == ["first", "interactive", "batch-1", "batch-2"]
+
+
+def test_models_share_one_connection_pool():
+    sync_client, async_client = shared_http_clients()
+    for llm in (build_llm("sk-test", base_url="http://127.0.0.1:1/v1"), build_llm("sk-test", "gpt-4o")):
+        assert llm.http_client is sync_client
+        assert llm.http_async_client is async_client
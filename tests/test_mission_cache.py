@@ -0,0 +1,53 @@
+import pytest
+
+from mission_cache import MissionTemplateCache, same_mission, normalize_details
+
+STORED = "방 청소하고 장난감 정리하기"
+MISSION = {"details_raw": STORED, "checklist": [{"item": "방 청소"}, {"item": "장난감 정리"}]}
+
+
+@pytest.fixture
+def templates(tmp_path):
+    cache = MissionTemplateCache(path=str(tmp_path / "templates.json"))
+    cache.put("청소", STORED, "v1", MISSION)
+    cache.put("숙제", "수학 숙제 3페이지 풀기", "v1", {"checklist": [{"item": "3페이지"}]})
+    return cache
+
+
+@pytest.mark.parametrize("details", [
+    "방 청소하고 장난감 정리하고 침대 정리하기",     # 항목 추가
+    "방 청소하고 장난감 정리하지 않기",              # 부정
+    "거실 청소하고 장난감 정리하기",                 # 다른 장소
+    "장난감 정리하기",                               # 항목 빠짐
+])
+def test_near_miss_is_not_reused(templates, details):
+    assert templates.lookup("청소", details, "v1") is None
+
+
+def test_numbers_must_match(templates):
+    assert templates.lookup("숙제", "수학 숙제 5페이지 풀기", "v1") is None
+    assert templates.lookup("숙제", "수학숙제 3페이지 풀기!", "v1")[1] == "exact"
+
+
+def test_rephrased_mission_passes_guard():
+    assert same_mission(normalize_details(STORED), normalize_details("방을 청소하고, 장난감을 정리하기!"))
+    assert same_mission(normalize_details(STORED), normalize_details("방청소 하고 장난감 정리하기"))
+
+
+def test_similar_hit_above_threshold(tmp_path):
+    cache = MissionTemplateCache(path=None, similarity_min=0.7)
+    cache.put("청소", STORED, "v1", MISSION)
+    obj, kind, score = cache.lookup("청소", "방청소 하고, 장난감을 정리하기!", "v1")
+    assert kind == "similar" and score >= 0.7
+    assert obj["checklist"] == MISSION["checklist"]
+
+
+def test_bucket_is_category_and_policy_version(templates):
+    assert templates.lookup("청소", STORED, "v1")[1] == "exact"
+    assert templates.lookup("청소", STORED, "v2") is None
+    assert templates.lookup("숙제", STORED, "v1") is None
+
+
+def test_persisted_across_instances(templates):
+    reloaded = MissionTemplateCache(path=templates.path)
+    assert reloaded.lookup("청소", STORED, "v1")[0]["checklist"] == MISSION["checklist"]
@@ -0,0 +1,155 @@
+import json
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+import model_router
+from judge_engine import build_llm, complete_json
+from llm_client import LLMCallError, LLMClient
+from model_router import Backend, ModelRouter, confidence_escalation, escalation, low_confidence
+from structured_output import MISSION_SCHEMA, PHOTO_SCHEMA, json_mode
+from token_usage import usage_scope
+
+GOOD = json.dumps({"category": "청소", "checklist": [{"item": "바닥 정리"}]}, ensure_ascii=False)
+EMPTY = json.dumps({"category": "청소", "checklist": []}, ensure_ascii=False)
+MESSAGES = [("human", "방 청소")]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def router(fake_server, clock):
+    """router({"이름": FakeLLMConfig 인자, ...}, vision={...}) → (라우터, {이름: cfg}). 이름 순서 = mission 단계 승급 순서"""
+
+    def build(specs, vision=None):
+        cfgs, backends = {}, []
+        for name, kwargs in specs.items():
+            cfgs[name], url = fake_server(**kwargs)
+            client = LLMClient(json_mode(build_llm("sk-test", base_url=url, max_retries=0)), max_retries=0)
+            backends.append(Backend(name, client, (vision or {}).get(name, True)))
+        return ModelRouter(backends, {"mission": list(specs)}, clock=clock), cfgs
+
+    return build
+
+
+def requests_of(cfgs):
+    return {name: cfg.requests for name, cfg in cfgs.items()}
+
+
+# ---------- 장애 대응(failover) ----------
+@pytest.mark.parametrize("failure", [{"error_rate": 1.0}, {"rate_limit_rate": 1.0}])
+def test_failover_follows_chain_order(router, failure):
+    r, cfgs = router({"a": failure, "b": {"content": GOOD}, "c": {"content": GOOD}})
+    with usage_scope(stage="mission"):
+        assert r.invoke(MESSAGES).content == GOOD
+        assert r.model_name == "b"
+    assert requests_of(cfgs) == {"a": 1, "b": 1, "c": 0}
+
+
+def test_all_backends_down_raises_last_error(router):
+    r, cfgs = router({"a": {"error_rate": 1.0}, "b": {"error_rate": 1.0}})
+    with usage_scope(stage="mission"), pytest.raises(LLMCallError):
+        r.invoke(MESSAGES)
+    assert requests_of(cfgs) == {"a": 1, "b": 1}
+
+
+def test_cooldown_skips_then_retries_backend(router, clock, monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTER_COOLDOWN_FAILS", 2)
+    monkeypatch.setattr(model_router, "ROUTER_COOLDOWN_S", 30.0)
+    monkeypatch.setattr(model_router, "ROUTER_MAX_ERROR_RATE", 1.1)  # 쿨다운만 보도록 오류율 기준은 끔
+    r, cfgs = router({"a": {"error_rate": 1.0}, "b": {"content": GOOD}})
+    with usage_scope(stage="mission"):
+        for _ in range(2):
+            r.invoke(MESSAGES)
+        assert requests_of(cfgs) == {"a": 2, "b": 2}
+        assert r.candidates(MESSAGES) == ["b", "a"]
+
+        # 쿨다운 중에는 a를 건너뛴다
+        r.invoke(MESSAGES)
+        assert requests_of(cfgs) == {"a": 2, "b": 3}
+
+        # 쿨다운이 끝나면 다시 목록 순서대로 a부터
+        clock.now += 31
+        assert r.candidates(MESSAGES) == ["a", "b"]
+        r.invoke(MESSAGES)
+        assert requests_of(cfgs) == {"a": 3, "b": 4}
+
+
+def test_image_requests_skip_text_only_backends(router):
+    r, _ = router({"mini": {}, "big": {}}, vision={"mini": False})
+    image = [HumanMessage(content=[{"type": "text", "text": "x"}, {"type": "image_url", "image_url": {"url": "data:,"}}])]
+    assert r.candidates(image, "mission") == ["big"]
+    assert r.candidates(MESSAGES, "mission") == ["mini", "big"]
+
+
+# ---------- 승급(escalation) ----------
+def test_no_escalation_when_confident(router):
+    r, cfgs = router({"mini": {"content": GOOD}, "big": {"content": GOOD}})
+    with usage_scope(stage="mission"):
+        obj, _ = complete_json(r, MESSAGES, MISSION_SCHEMA, "mission")
+    assert obj["checklist"] == [{"item": "바닥 정리"}]
+    assert requests_of(cfgs) == {"mini": 1, "big": 0}
+
+
+def test_escalates_on_low_confidence(router):
+    r, cfgs = router({"mini": {"content": EMPTY}, "big": {"content": GOOD}})
+    with usage_scope(stage="mission"):
+        obj, _ = complete_json(r, MESSAGES, MISSION_SCHEMA, "mission")
+        assert r.model_name == "big"
+    assert obj["checklist"] == [{"item": "바닥 정리"}]
+    assert requests_of(cfgs) == {"mini": 1, "big": 1}
+
+
+def test_escalates_on_parse_failure(router):
+    r, cfgs = router({"mini": {"content": "체크리스트를 못 만들었어요"}, "big": {"content": GOOD}})
+    with usage_scope(stage="mission"):
+        obj, _ = complete_json(r, MESSAGES, MISSION_SCHEMA, "mission")
+    assert obj["checklist"] == [{"item": "바닥 정리"}]
+    # mini: 본 호출 + 수정 호출 1회, 그래도 실패해서 big으로
+    assert requests_of(cfgs) == {"mini": 2, "big": 1}
+
+
+def test_strongest_backend_result_is_kept(router):
+    r, cfgs = router({"mini": {"content": EMPTY}})
+    with usage_scope(stage="mission"):
+        obj, _ = complete_json(r, MESSAGES, MISSION_SCHEMA, "mission")
+    assert obj["checklist"] == []
+    assert requests_of(cfgs) == {"mini": 1}
+
+
+def test_failover_is_not_escalation(router):
+    # 장애로 big이 응답했으면 그보다 강한 모델이 없으므로 신뢰도가 낮아도 다시 묻지 않는다
+    r, cfgs = router({"mini": {"error_rate": 1.0}, "big": {"content": EMPTY}})
+    with usage_scope(stage="mission"):
+        obj, _ = complete_json(r, MESSAGES, MISSION_SCHEMA, "mission")
+    assert obj["checklist"] == []
+    assert requests_of(cfgs) == {"mini": 1, "big": 1}
+
+
+def test_photo_units_do_not_escalate(router):
+    r, _ = router({"mini": {}, "big": {}})
+    unit = {"observations": ["바닥이 보임"], "items": [{"item": "바닥 정리", "status": "unclear", "evidence": ""}]}
+    assert not low_confidence("photo_unit", unit)
+    assert low_confidence("photo", unit)
+    with usage_scope(stage="mission"):
+        r.invoke(MESSAGES)  # mini가 응답한 상태
+        # 사진 1장 단위 결과는 unclear가 많아도 승급하지 않고, 병합 결과("photo")만 본다
+        assert escalation(r, unit, PHOTO_SCHEMA, "photo_unit") is None
+        assert escalation(r, unit, PHOTO_SCHEMA, "photo") is not None
+        assert confidence_escalation(r, unit, "photo").candidates(MESSAGES) == ["big"]
+        assert confidence_escalation(r, {**unit, "items": []}, "photo") is None
+
+
+def test_escalation_needs_router():
+    assert escalation(object(), {}, MISSION_SCHEMA, "mission") is None
@@ -0,0 +1,43 @@
+import numpy as np
+from PIL import Image
+
+from image_prep import PrepSettings
+from photo_hash import image_hashes
+from photo_select import checklist_words, relevance, select_photos
+
+MISSION = {"checklist": [{"item": "책상을 정리하기"}, {"item": "바닥 청소"}, {"item": "tidy desk"}]}
+
+
+def noise_photo(path, seed):
+    rng = np.random.default_rng(seed)
+    Image.fromarray((rng.random((60, 80, 3)) * 255).astype("uint8")).resize((800, 600), Image.NEAREST).save(path)
+    return str(path)
+
+
+def test_checklist_words_use_hangul_stems():
+    assert checklist_words(MISSION) == ["책상", "정리", "바닥", "청소", "tidy", "desk"]
+
+
+def test_relevance_from_original_name():
+    words = checklist_words(MISSION)
+    assert relevance("책상정리_후.jpg", words) == 1.0
+    assert relevance("/uploads/ab/바닥.png", words) == 0.5
+    assert relevance("IMG_1234.jpg", words) == 0.0
+    assert relevance("책상.jpg", []) == 0.0
+
+
+def test_relevant_photo_kept_under_budget(tmp_path):
+    paths = [noise_photo(tmp_path / f"{i}.png", i) for i in range(3)]
+    hashes = [image_hashes(p) for p in paths]
+    labels = ["IMG_0001.jpg", "IMG_0002.jpg", "책상정리.jpg"]
+    kwargs = dict(max_bytes=1, min_edge=384, words=checklist_words(MISSION))
+
+    # 예산이 사진 1장 분량뿐이면 이름이 체크리스트와 맞는 사진을 남긴다
+    sel = select_photos(paths, [1, 2, 3], hashes, PrepSettings.from_env(), labels=labels, **kwargs)
+    assert sel.numbers == [3]
+    assert sel.ranking[0]["relevance"] == 1.0
+
+    # 이름에 정보가 없으면 관련도는 순서에 영향 없음 (동점은 제출 순서)
+    plain = ["IMG_0001.jpg", "IMG_0002.jpg", "IMG_0003.jpg"]
+    sel = select_photos(paths, [1, 2, 3], hashes, PrepSettings.from_env(), labels=plain, **kwargs)
+    assert all(r["relevance"] == 0.0 for r in sel.ranking)
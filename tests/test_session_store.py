@@ -0,0 +1,60 @@
+import os
+
+from result_cache import ResultCache
+from session_store import LRUMemory, PayloadStore, SessionTracker
+
+
+def disk_path(store, handle):
+    return ResultCache(root=store.root).path(handle)
+
+
+def put_aged(store, text, mtime):
+    handle = store.put(text)
+    os.utime(disk_path(store, handle), (mtime, mtime))
+    return handle
+
+
+def test_put_same_content_keeps_file_and_refreshes_mtime(tmp_path):
+    store = PayloadStore(LRUMemory(), root=str(tmp_path))
+    handle = put_aged(store, '{"a": 1}', 100.0)
+    assert store.put('{"a": 1}') == handle
+    assert os.path.getmtime(disk_path(store, handle)) > 100.0
+    assert store.get(handle) == '{"a": 1}'
+
+
+def test_prune_by_age_keeps_active_handles(tmp_path):
+    store = PayloadStore(LRUMemory(), root=str(tmp_path), max_bytes=0, max_age_s=60)
+    old = put_aged(store, '{"old": 1}', 1000.0)
+    kept = put_aged(store, '{"kept": 1}', 1000.0)
+    fresh = put_aged(store, '{"fresh": 1}', 1100.0)
+
+    assert store.prune(keep={kept}, now=1120.0) == 1
+    assert store.get(old) is None
+    assert store.get(kept) == '{"kept": 1}'
+    assert store.get(fresh) == '{"fresh": 1}'
+
+
+def test_prune_by_size_removes_oldest_first(tmp_path):
+    text = '{"v": "%s"}'
+    store = PayloadStore(LRUMemory(), root=str(tmp_path), max_bytes=0, max_age_s=0)
+    handles = [put_aged(store, text % i, 1000.0 + i) for i in range(4)]
+    size = os.path.getsize(disk_path(store, handles[0]))
+    store.max_bytes = 2 * size
+
+    assert store.prune(now=2000.0) == 2
+    assert [os.path.exists(disk_path(store, h)) for h in handles] == [False, False, True, True]
+    assert store.disk_bytes == 2 * size
+
+
+def test_idle_sweep_prunes_disk(tmp_path):
+    memory = LRUMemory()
+    store = PayloadStore(memory, root=str(tmp_path), max_bytes=0, max_age_s=60)
+    tracker = SessionTracker(memory, idle_s=180, payloads=store)
+    idle = put_aged(store, '{"idle": 1}', 1000.0)
+    active = put_aged(store, '{"active": 1}', 1000.0)
+    tracker.touch("s1", [idle], now=1000.0)
+    tracker.touch("s2", [active], now=1030.0)
+
+    assert tracker.evict_idle(now=1200.0) == ["s1"]
+    assert not os.path.exists(disk_path(store, idle))
+    assert os.path.exists(disk_path(store, active))
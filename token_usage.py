@@ -0,0 +1,237 @@
+import os
+import time
+import sqlite3
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+# =========================================================
+# 토큰 사용량 기록 + 예산
+# - 모델 응답의 usage_metadata에서 입력/출력/캐시 적중(cache_read) 입력 토큰을 호출마다 기록 (SQLite, WAL)
+# - 어느 세션/단계의 호출인지는 usage_scope(...)로 지정 (contextvars라 스레드마다 따로)
+# - 세션/하루(로컬 날짜) 예산: 다 써 가면 사진 수/해상도를 줄이고, 다 쓰면 채점을 로컬 규칙으로
+#   → 호출을 막지 않고 품질을 조금씩 낮춰서 계속 판정한다 (budget_plan)
+# 예산은 입력+출력 토큰 합계 기준, 0이면 제한 없음
+# =========================================================
+USAGE_PATH = os.getenv("TOKEN_USAGE_PATH", os.path.join("outputs", "token_usage.sqlite3"))
+TOKEN_BUDGET_SESSION = int(os.getenv("TOKEN_BUDGET_SESSION", "0"))
+TOKEN_BUDGET_DAY = int(os.getenv("TOKEN_BUDGET_DAY", "0"))
+# 예산의 이 비율을 넘으면 줄이기 시작
+TOKEN_BUDGET_SOFT = float(os.getenv("TOKEN_BUDGET_SOFT", "0.8"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    day            TEXT NOT NULL,
+    session_id     TEXT NOT NULL,
+    stage          TEXT NOT NULL,
+    model          TEXT NOT NULL,
+    created_at     REAL NOT NULL,
+    input_tokens   INTEGER NOT NULL,
+    output_tokens  INTEGER NOT NULL,
+    cached_tokens  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_usage_day ON usage (day);
+CREATE INDEX IF NOT EXISTS idx_usage_session ON usage (session_id);
+"""
+
+# (세션 id, 단계). 스코프 밖의 호출은 ("", "")로 기록
+_scope: contextvars.ContextVar = contextvars.ContextVar("token_usage_scope", default=("", ""))
+
+
+@contextmanager
+def usage_scope(session_id: Optional[str] = None, stage: Optional[str] = None) -> Iterator[None]:
+    """안쪽 호출의 기록 단위 지정. 안 준 값은 바깥 스코프 값을 그대로 쓴다"""
+    outer_session, outer_stage = _scope.get()
+    token = _scope.set((outer_session if session_id is None else session_id, outer_stage if stage is None else stage))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def bind_session(session_id: str) -> None:
+    """
+    지금 컨텍스트의 이후 호출을 session_id로 기록 (되돌리지 않음).
+    Streamlit 스크립트 실행 스레드처럼 한 세션 전용인 곳에서 실행 시작 시 1번 호출.
+    """
+    _scope.set((session_id, _scope.get()[1]))
+
+
+def with_stage(stage: str) -> Callable:
+    """함수 안의 모델 호출(수정 호출 포함)을 stage 단계로 기록하는 데코레이터"""
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with usage_scope(stage=stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def current_scope() -> tuple:
+    return _scope.get()
+
+
+def today() -> str:
+    return time.strftime("%Y-%m-%d")
+
+
+def usage_counts(usage: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """usage_metadata → {"input", "output", "cached"}"""
+    usage = usage or {}
+    details = usage.get("input_token_details") or {}
+    return {
+        "input": int(usage.get("input_tokens") or 0),
+        "output": int(usage.get("output_tokens") or 0),
+        "cached": int(details.get("cache_read") or 0),
+    }
+
+
+class UsageLedger:
+    def __init__(self, path: str = USAGE_PATH):
+        self.path = path
+        self._local = threading.local()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def add(self, session_id: str, stage: str, model: str, counts: Dict[str, int]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO usage (day, session_id, stage, model, created_at, input_tokens, output_tokens, "
+                "cached_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (today(), session_id, stage, model, time.time(), counts["input"], counts["output"], counts["cached"]),
+            )
+
+    def totals(self, session_id: Optional[str] = None, day: Optional[str] = None) -> Dict[str, int]:
+        where, args = [], []
+        if session_id is not None:
+            where.append("session_id = ?")
+            args.append(session_id)
+        if day is not None:
+            where.append("day = ?")
+            args.append(day)
+        sql = (
+            "SELECT COUNT(*), COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0), "
+            "COALESCE(SUM(cached_tokens), 0) FROM usage"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        calls, inp, out, cached = self._conn().execute(sql, args).fetchone()
+        return {"calls": calls, "input": inp, "output": out, "cached": cached, "total": inp + out}
+
+    def by_stage(self, session_id: str) -> Dict[str, Dict[str, int]]:
+        rows = self._conn().execute(
+            "SELECT stage, COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(cached_tokens) "
+            "FROM usage WHERE session_id = ? GROUP BY stage ORDER BY stage",
+            (session_id,),
+        ).fetchall()
+        return {
+            stage or "-": {"calls": c, "input": i, "output": o, "cached": k, "total": i + o}
+            for stage, c, i, o, k in rows
+        }
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> UsageLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger()
+        return _ledger
+
+
+def record(usage: Optional[Dict[str, Any]], model: str = "", scope: Optional[tuple] = None) -> None:
+    """
+    호출 1번의 사용량 기록. scope를 안 주면 현재 usage_scope.
+    (LLMClient는 호출한 스레드의 스코프를 잡아 두었다가 백그라운드 루프에서 넘긴다)
+    """
+    counts = usage_counts(usage)
+    if not (counts["input"] or counts["output"]):
+        return
+    session_id, stage = scope if scope is not None else _scope.get()
+    try:
+        get_ledger().add(session_id, stage, model, counts)
+    except sqlite3.Error:
+        pass  # 기록 실패로 판정을 멈추지 않음
+
+
+# =========================================================
+# 예산에 따른 단계적 축소
+# =========================================================
+@dataclass(frozen=True)
+class BudgetPlan:
+    level: str                  # "normal" | "reduced" | "minimal"
+    used_fraction: float        # 세션/하루 예산 중 더 많이 쓴 쪽의 비율
+    max_photos: int
+    max_edge: Optional[int]     # None이면 IMAGE_MAX_EDGE 그대로
+    local_grading: bool         # True면 채점을 모델 대신 로컬 규칙(scoring)으로
+
+    @property
+    def degraded(self) -> bool:
+        return self.level != "normal"
+
+
+NORMAL_PLAN = BudgetPlan("normal", 0.0, 10, None, False)
+_REDUCED = dict(level="reduced", max_photos=4, max_edge=1024, local_grading=False)
+_MINIMAL = dict(level="minimal", max_photos=2, max_edge=768, local_grading=True)
+
+
+def used_fraction(
+    session_id: Optional[str],
+    session_budget: int = TOKEN_BUDGET_SESSION,
+    day_budget: int = TOKEN_BUDGET_DAY,
+    ledger: Optional[UsageLedger] = None,
+) -> float:
+    if session_budget <= 0 and day_budget <= 0:
+        return 0.0
+    ledger = ledger or get_ledger()
+    frac = 0.0
+    if session_budget > 0 and session_id:
+        frac = max(frac, ledger.totals(session_id=session_id)["total"] / session_budget)
+    if day_budget > 0:
+        frac = max(frac, ledger.totals(day=today())["total"] / day_budget)
+    return frac
+
+
+def budget_plan(
+    session_id: Optional[str] = None,
+    session_budget: int = TOKEN_BUDGET_SESSION,
+    day_budget: int = TOKEN_BUDGET_DAY,
+    ledger: Optional[UsageLedger] = None,
+) -> BudgetPlan:
+    """현재 스코프(또는 session_id)의 사용량으로 이번 판정에 쓸 축소 수준"""
+    if session_budget <= 0 and day_budget <= 0:
+        return NORMAL_PLAN
+    session_id = session_id if session_id is not None else _scope.get()[0]
+    try:
+        frac = used_fraction(session_id, session_budget, day_budget, ledger)
+    except sqlite3.Error:
+        return NORMAL_PLAN
+    frac = round(frac, 3)
+    if frac >= 1.0:
+        return BudgetPlan(used_fraction=frac, **_MINIMAL)
+    if frac >= TOKEN_BUDGET_SOFT:
+        return BudgetPlan(used_fraction=frac, **_REDUCED)
+    return BudgetPlan("normal", frac, NORMAL_PLAN.max_photos, None, False)
@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import functools
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from token_usage import current_scope
+
+
+# =========================================================
+# 가벼운 구간 측정(tracing)
+# - with span("이름"): ... → 시작/끝 시각, 부모 구간, 속성, 예외 여부를 기록 (contextvars로 부모 연결)
+# - 내보내기 1: TRACE_EXPORT_PATH(JSONL)에 OpenTelemetry OTLP/JSON 형식으로 구간마다 1줄
+#   (otel collector의 otlpjsonfile receiver 등으로 그대로 읽을 수 있음)
+# - 내보내기 2: METRICS_PORT를 주면 /metrics 에 Prometheus 텍스트 형식 (구간별 소요 시간 히스토그램)
+# - 화면용: 세션별 구간 통계(메모리, 최근 세션만) → 사이드바 "단계별 소요 시간"
+# 집계 이름은 "부모/자식" (예: photoGet/model, missionComplete/model)
+# 세션 구분은 token_usage의 스코프(bind_session/usage_scope)를 그대로 쓴다
+# =========================================================
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "mission-judge")
+
+# Prometheus 히스토그램 구간 경계(초)
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_MAX_SESSIONS = 200
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent: Optional["Span"]
+    start_ns: int
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    duration_ns: int = 0
+    error: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.parent.name}/{self.name}" if self.parent is not None else self.name
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration_ns / 1e6
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("tracing_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def _attr_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def otlp_json(s: Span, session_id: str = "") -> Dict[str, Any]:
+    """구간 1개 → OTLP/JSON (ExportTraceServiceRequest 1건)"""
+    attrs = dict(s.attrs)
+    if session_id:
+        attrs["session.id"] = session_id
+    span: Dict[str, Any] = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,  # INTERNAL
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.start_ns + s.duration_ns),
+        "attributes": [{"key": k, "value": _attr_value(v)} for k, v in attrs.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent is not None:
+        span["parentSpanId"] = s.parent.span_id
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [span]}],
+        }]
+    }
+
+
+class _JsonlExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = None
+
+    def write(self, s: Span, session_id: str) -> None:
+        line = json.dumps(otlp_json(s, session_id), ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._f is None:
+                d = os.path.dirname(self.path)
+                if d:
+                    os.makedirs(d, exist_ok=True)
+                self._f = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._f.write(line + "\n")
+
+
+class SpanStats:
+    """구간 이름별 집계: 세션별(화면용) + 전체 히스토그램(Prometheus용)"""
+
+    def __init__(self, max_sessions: int = _MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, Dict[str, float]]]" = OrderedDict()
+        self._hist: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, session_id: str, key: str, ms: float, error: bool) -> None:
+        with self._lock:
+            if session_id:
+                stages = self._sessions.setdefault(session_id, {})
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                st = stages.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0, "errors": 0})
+                st["count"] += 1
+                st["total_ms"] += ms
+                st["max_ms"] = max(st["max_ms"], ms)
+                st["last_ms"] = ms
+                st["errors"] += int(error)
+
+            h = self._hist.setdefault(key, {"buckets": [0] * len(_BUCKETS), "sum": 0.0, "count": 0, "errors": 0})
+            sec = ms / 1000.0
+            for i, le in enumerate(_BUCKETS):
+                if sec <= le:
+                    h["buckets"][i] += 1
+            h["sum"] += sec
+            h["count"] += 1
+            h["errors"] += int(error)
+
+    def forget(self, session_id: str) -> None:
+        """세션 화면용 통계 삭제 (유휴 세션 정리, 전체 히스토그램은 그대로)"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def session_breakdown(self, session_id: str) -> List[Dict[str, Any]]:
+        """[{"stage", "count", "avg_ms", "max_ms", "last_ms", "total_ms", "errors"}] 총 소요 시간 큰 순"""
+        with self._lock:
+            stages = {k: dict(v) for k, v in self._sessions.get(session_id, {}).items()}
+        rows = [
+            {
+                "stage": k,
+                "count": int(v["count"]),
+                "avg_ms": round(v["total_ms"] / v["count"], 1) if v["count"] else 0.0,
+                "max_ms": round(v["max_ms"], 1),
+                "last_ms": round(v["last_ms"], 1),
+                "total_ms": round(v["total_ms"], 1),
+                "errors": int(v["errors"]),
+            }
+            for k, v in stages.items()
+        ]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def prometheus_text(self) -> str:
+        out = [
+            "# HELP judge_span_duration_seconds 판정 파이프라인 구간별 소요 시간",
+            "# TYPE judge_span_duration_seconds histogram",
+        ]
+        errors = ["# HELP judge_span_errors_total 예외로 끝난 구간 수", "# TYPE judge_span_errors_total counter"]
+        with self._lock:
+            for key in sorted(self._hist):
+                h = self._hist[key]
+                label = key.replace("\\", "\\\\").replace('"', '\\"')
+                for le, n in zip(_BUCKETS, h["buckets"]):
+                    out.append(f'judge_span_duration_seconds_bucket{{span="{label}",le="{le:g}"}} {n}')
+                out.append(f'judge_span_duration_seconds_bucket{{span="{label}",le="+Inf"}} {h["count"]}')
+                out.append(f'judge_span_duration_seconds_sum{{span="{label}"}} {h["sum"]:.6f}')
+                out.append(f'judge_span_duration_seconds_count{{span="{label}"}} {h["count"]}')
+                errors.append(f'judge_span_errors_total{{span="{label}"}} {h["errors"]}')
+        return "\n".join(out + errors) + "\n"
+
+
+STATS = SpanStats()
+_exporter: Optional[_JsonlExporter] = _JsonlExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    """구간 측정. 안쪽에서 s.attrs[...]로 속성 추가 가능. Exception이면 오류로 기록 후 그대로 전달"""
+    parent = _current.get()
+    s = Span(name, parent.trace_id if parent is not None else _new_id(16), _new_id(8), parent, time.time_ns(), attrs)
+    token = _current.set(s)
+    t0 = time.perf_counter_ns()
+    try:
+        yield s
+    except Exception as e:
+        # Streamlit의 st.stop()/st.rerun() 같은 제어용 예외(BaseException)는 오류로 보지 않음
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.duration_ns = time.perf_counter_ns() - t0
+        _current.reset(token)
+        _finish(s)
+
+
+def _finish(s: Span) -> None:
+    session_id = current_scope()[0]
+    STATS.observe(session_id, s.key, s.duration_ms, s.error is not None)
+    if _exporter is not None:
+        try:
+            _exporter.write(s, session_id)
+        except OSError:
+            pass  # 기록 실패로 판정을 멈추지 않음
+
+
+def traced(name: str) -> Callable:
+    """함수 전체를 name 구간으로 측정하는 데코레이터"""
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# =========================================================
+# Prometheus 텍스트 엔드포인트 (METRICS_PORT > 0일 때만, 프로세스당 1번)
+# =========================================================
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_lock = threading.Lock()
+# 구간 히스토그램 뒤에 붙일 다른 모듈의 지표 (예: session_store의 메모리 게이지)
+_metric_sources: List[Callable[[], str]] = []
+
+
+def add_metrics_source(fn: Callable[[], str]) -> None:
+    """Prometheus 텍스트를 돌려주는 함수를 /metrics 출력에 추가"""
+    if fn not in _metric_sources:
+        _metric_sources.append(fn)
+
+
+def metrics_text() -> str:
+    return STATS.prometheus_text() + "".join(fn() for fn in _metric_sources)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = metrics_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """이미 떠 있거나 port가 0이면 아무것도 안 함 (Streamlit 재실행마다 불러도 됨)"""
+    global _metrics_server
+    with _metrics_lock:
+        if _metrics_server is not None or port <= 0:
+            return _metrics_server
+        try:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError:
+            return None  # 다른 프로세스가 포트 사용 중
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        _metrics_server = server
+        return server
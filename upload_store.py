@@ -0,0 +1,101 @@
+import os
+import re
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+
+# =========================================================
+# 업로드 사진 저장소 (내용 주소 기반)
+# - st.file_uploader로 받은 파일을 청크 단위로 읽으면서 sha256 계산 + 임시 파일에 쓰기를 동시에 한다
+#   → 파일 전체를 한 번 더 메모리에 복사하지 않고, 해시를 위해 다시 읽지도 않음
+# - 저장 경로 = .cache/uploads/<sha256 앞 2자리>/<sha256><확장자> → 같은 내용은 한 파일(중복 제거)
+# - 저장 경로는 일반 사진 경로와 똑같이 screen_photo / prepare_image / image_to_data_url에 넘기면 되고,
+#   digest_for(path)로 파일을 읽지 않고 sha256을 알 수 있다 (image_prep / photo_hash / result_cache가 사용)
+# =========================================================
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(".cache", "uploads"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_TYPES = ("jpg", "jpeg", "png", "webp")
+
+_CHUNK = 1024 * 1024
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+_EXT = re.compile(r"^\.[0-9a-z]{1,5}$")
+
+
+@dataclass
+class StoredUpload:
+    sha256: str
+    path: str
+    name: str               # 사용자가 올린 파일 이름 (화면 표시용)
+    size: int
+    deduplicated: bool      # 같은 내용이 이미 저장돼 있었음
+
+
+def _shard(digest: str, root: str) -> str:
+    return os.path.join(root, digest[:2])
+
+
+def _existing(digest: str, root: str) -> Optional[str]:
+    """같은 sha256으로 저장된 파일 (확장자가 달라도 같은 내용이면 재사용)"""
+    shard = _shard(digest, root)
+    try:
+        names = os.listdir(shard)
+    except OSError:
+        return None
+    for name in sorted(names):
+        if os.path.splitext(name)[0] == digest:
+            return os.path.join(shard, name)
+    return None
+
+
+def ingest(stream: BinaryIO, name: str, root: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_BYTES) -> StoredUpload:
+    """
+    파일 객체(업로드 파일 등)를 청크로 읽어 저장소에 넣는다.
+    max_bytes를 넘으면 ValueError (임시 파일은 지움).
+    """
+    ext = os.path.splitext(name)[1].lower()
+    ext = ext if _EXT.match(ext) else ""
+    tmp_dir = os.path.join(root, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    if hasattr(stream, "seek"):
+        stream.seek(0)
+
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: stream.read(_CHUNK), b""):
+                size += len(chunk)
+                if max_bytes > 0 and size > max_bytes:
+                    raise ValueError(f"파일이 너무 커요 (최대 {max_bytes // (1024 * 1024)}MB)")
+                h.update(chunk)
+                f.write(chunk)
+        digest = h.hexdigest()
+        found = _existing(digest, root)
+        if found is not None:
+            os.remove(tmp)
+            return StoredUpload(digest, found, name, size, True)
+        path = os.path.join(_shard(digest, root), digest + ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 다 쓴 뒤 rename → 다른 세션이 반쯤 쓰인 파일을 보지 않음
+        os.replace(tmp, path)
+        return StoredUpload(digest, path, name, size, False)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def digest_for(path: str, root: str = UPLOAD_DIR) -> Optional[str]:
+    """저장소 안의 파일이면 이름에서 sha256 (파일을 읽지 않음), 아니면 None"""
+    shard_dir, base = os.path.split(os.path.abspath(path))
+    if os.path.dirname(shard_dir) != os.path.abspath(root):
+        return None
+    digest = os.path.splitext(base)[0]
+    if not _DIGEST.match(digest) or os.path.basename(shard_dir) != digest[:2]:
+        return None
+    return digest